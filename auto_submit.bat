@@ -29,12 +29,6 @@ if errorlevel 1 (
     pip install requests
 )
 
-pip show PyGithub >nul 2>&1
-if errorlevel 1 (
-    echo Installing PyGithub...
-    pip install PyGithub
-)
-
 pip show gitpython >nul 2>&1
 if errorlevel 1 (
     echo Installing gitpython...
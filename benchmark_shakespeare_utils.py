@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Scaling Benchmarks for shakespeare_utils
+Times the text-processing hot paths on synthetic corpora built from the
+bundled shakespeare_sonnets.txt and compares the results with a baseline.
+
+Usage:
+    python benchmark_shakespeare_utils.py
+    python benchmark_shakespeare_utils.py --scales 1,10,100,1000 --output results.json
+    python benchmark_shakespeare_utils.py --update-baseline
+
+The default scales are small enough for a routine regression check against
+the committed benchmark_baseline.json; larger scales are for scaling studies
+(with a baseline of their own, see --baseline).
+
+Runs fully offline; no data is downloaded.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Optional
+
+import numpy as np
+
+import shakespeare_utils as su
+
+
+DATA_FILE = Path(__file__).resolve().parent / "shakespeare_sonnets.txt"
+DEFAULT_SCALES = [1, 10]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+HEAVY_MODULES = ["numpy", "plotly", "requests"]
+
+
+def build_corpus(scale: int, seed: int = 0) -> str:
+    """
+    Build a synthetic corpus `scale` times the size of the sonnets file
+
+    Lines are reshuffled in every copy so bigram statistics are not just a
+    repetition of the original text.
+
+    Args:
+        scale: Size multiplier
+        seed: Random seed for the line order
+
+    Returns:
+        Corpus text
+    """
+    with open(DATA_FILE, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(scale):
+        rng.shuffle(lines)
+        parts.append("\n".join(lines))
+    return "\n".join(parts)
+
+
+def measure(func: Callable[[], Any], repeat: int = 3) -> Dict[str, float]:
+    """
+    Time a function (best of `repeat` runs) and measure its peak allocation
+
+    Peak memory comes from a separate run under tracemalloc so the tracing
+    overhead does not distort the timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(timings), "peak_bytes": peak}
+
+
+def measure_import(repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time a cold `import shakespeare_utils` in fresh interpreters
+
+    Also records which heavy dependencies the import pulled in; they are
+    meant to load only when a function that needs them is first called.
+
+    Returns:
+        Dictionary with the best import time and the heavy modules loaded
+    """
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import shakespeare_utils\n"
+        "seconds = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'seconds': seconds, 'heavy_modules': heavy}))\n"
+    )
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", script], check=True,
+                                capture_output=True, text=True,
+                                cwd=DATA_FILE.parent).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    best = min(runs, key=lambda run: run["seconds"])
+    print(f"{'import':<24} {'':6} {best['seconds']:9.4f}s "
+          f"heavy modules: {', '.join(best['heavy_modules']) or 'none'}")
+    return best
+
+
+def benchmark_cases(text: str, corpus_file: str) -> Dict[str, Callable[[], Any]]:
+    """Benchmarked calls for one corpus, keyed by benchmark name"""
+    tokens = su.tokenize(text)
+    vocab = su.create_vocabulary(tokens)
+    ids = vocab.encode(tokens)
+    rng = np.random.default_rng(0)
+    probs = rng.random(len(tokens))
+    kneser_ney = su.SmoothedNgramModel(3).fit(ids, len(vocab))
+
+    def perplexity_stream():
+        acc = su.PerplexityAccumulator()
+        for chunk in np.array_split(probs, max(1, len(probs) // 100000)):
+            acc.update(chunk)
+        return acc.perplexity()
+
+    return {
+        "clean_gutenberg_text": lambda: su.clean_gutenberg_text(text),
+        "tokenize": lambda: su.tokenize(text),
+        "iter_tokens": lambda: sum(len(batch) for batch in
+                                   su.iter_tokens(corpus_file, batch_size=1 << 16)),
+        "create_vocabulary": lambda: su.create_vocabulary(tokens),
+        "vocabulary_encode": lambda: vocab.encode(tokens),
+        "count_ngrams_2": lambda: su.count_ngrams(ids, 2, len(vocab)),
+        "count_ngrams_3": lambda: su.count_ngrams(ids, 3, len(vocab)),
+        "count_char_ngrams_5": lambda: su.count_char_ngrams(corpus_file, 5),
+        "calculate_perplexity": lambda: su.calculate_perplexity(probs),
+        "perplexity_accumulator": perplexity_stream,
+        "kneser_ney_score": lambda: kneser_ney.score(ids),
+        "plot_word_frequencies": lambda: su.plot_word_frequencies(tokens),
+        "plot_bigram_heatmap": lambda: su.plot_bigram_heatmap(tokens),
+    }
+
+
+def run_benchmarks(scales: List[int], repeat: int = 3,
+                   only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Run every benchmark at every scale
+
+    Args:
+        scales: Corpus size multipliers
+        repeat: Timed runs per benchmark (the best is kept)
+        only: Restrict to these benchmark names
+
+    Returns:
+        Report dictionary with 'meta' and 'results'
+    """
+    results = []
+    import_stats = measure_import(repeat)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            text = build_corpus(scale)
+            corpus_file = os.path.join(tmp_dir, f"corpus_{scale}.txt")
+            with open(corpus_file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            n_tokens = len(su.tokenize(text))
+
+            for name, func in benchmark_cases(text, corpus_file).items():
+                if only and name not in only:
+                    continue
+                stats = measure(func, repeat)
+                stats.update({
+                    "benchmark": name,
+                    "scale": scale,
+                    "tokens": n_tokens,
+                    "tokens_per_sec": n_tokens / stats["seconds"] if stats["seconds"] else None,
+                })
+                results.append(stats)
+                print(f"{name:<24} x{scale:<5} {stats['seconds']:9.4f}s "
+                      f"{stats['peak_bytes'] / 2**20:9.1f} MB "
+                      f"{stats['tokens_per_sec'] or 0:14,.0f} tok/s")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "import": import_stats,
+        "results": results,
+    }
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        time_threshold: float = 0.25,
+                        memory_threshold: float = 0.25) -> List[str]:
+    """
+    Find benchmarks that got slower or use more memory than the baseline
+
+    Args:
+        report: Current results from run_benchmarks()
+        baseline: Stored results in the same format
+        time_threshold: Allowed relative increase in time
+        memory_threshold: Allowed relative increase in peak memory
+
+    Returns:
+        List of human-readable regression messages (empty if none)
+    """
+    reference = {(r["benchmark"], r["scale"]): r for r in baseline.get("results", [])}
+    regressions = []
+    if report["results"] and not any((r["benchmark"], r["scale"]) in reference
+                                     for r in report["results"]):
+        regressions.append("no benchmark of this run is in the baseline "
+                           "(different --scales or --only?)")
+
+    current_import = report.get("import")
+    if current_import:
+        if current_import["heavy_modules"]:
+            regressions.append("import shakespeare_utils loads "
+                               + ", ".join(current_import["heavy_modules"]))
+        base_import = baseline.get("import")
+        if base_import and current_import["seconds"] > base_import["seconds"] * (1 + time_threshold):
+            regressions.append(f"import: time {base_import['seconds']:.4f}s -> "
+                               f"{current_import['seconds']:.4f}s")
+
+    for result in report["results"]:
+        base = reference.get((result["benchmark"], result["scale"]))
+        if base is None:
+            continue
+        label = f"{result['benchmark']} x{result['scale']}"
+        if result["seconds"] > base["seconds"] * (1 + time_threshold):
+            regressions.append(f"{label}: time {base['seconds']:.4f}s -> "
+                               f"{result['seconds']:.4f}s")
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + memory_threshold):
+            regressions.append(f"{label}: peak memory {base['peak_bytes']} -> "
+                               f"{result['peak_bytes']} bytes")
+
+    return regressions
+
+
+def main():
+    """Main entry point for the script"""
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark shakespeare_utils on synthetic corpora"
+    )
+    parser.add_argument(
+        "--scales", "-s",
+        help="Comma-separated corpus size multipliers",
+        default=",".join(str(s) for s in DEFAULT_SCALES)
+    )
+    parser.add_argument(
+        "--repeat", "-n",
+        help="Timed runs per benchmark (best is kept)",
+        type=int,
+        default=3
+    )
+    parser.add_argument(
+        "--only",
+        help="Comma-separated benchmark names to run",
+        default=None
+    )
+    parser.add_argument(
+        "--output", "-o",
+        help="Where to write the JSON results",
+        default="benchmark_results.json"
+    )
+    parser.add_argument(
+        "--baseline", "-b",
+        help="Baseline JSON to compare against",
+        default=DEFAULT_BASELINE
+    )
+    parser.add_argument(
+        "--update-baseline",
+        help="Store these results as the new baseline",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--time-threshold",
+        help="Allowed relative slowdown before failing",
+        type=float,
+        default=0.25
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        help="Allowed relative peak memory increase before failing",
+        type=float,
+        default=0.25
+    )
+
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    only = args.only.split(",") if args.only else None
+    report = run_benchmarks(scales, args.repeat, only)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\n[ERROR] No baseline at {args.baseline}; the regression check did not run.")
+        print("Run with --update-baseline to create one")
+        sys.exit(1)
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(report, baseline, args.time_threshold,
+                                      args.memory_threshold)
+    if regressions:
+        print("\n[WARNING] Performance regressions:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+
+    print("[OK] No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+Next-Word Prediction Server
+Loads an NgramModel once and serves next-word predictions to many local
+clients over HTTP (TCP or Unix socket). Concurrent and pipelined requests
+are grouped into micro-batches: request decoding, context encoding, the
+model call and JSON response building each run once per batch.
+
+Usage:
+    python prediction_server.py --model model.bin --port 8765
+    python prediction_server.py --corpus shakespeare_sonnets.txt --n 3 --unix /tmp/nlp.sock
+
+Endpoints:
+    POST /predict  {"context": ["shall", "i"], "k": 5}
+    POST /sample   {"context": ["shall", "i"], "num_samples": 3}
+    GET  /stats
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from itertools import chain
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+import numpy as np
+
+import shakespeare_utils as su
+
+# Most distinct probabilities whose JSON spelling is kept between batches
+NUMBER_CACHE_SIZE = 1 << 16
+
+# Distinct request heads kept parsed (they differ mostly by Content-Length)
+HEAD_CACHE_SIZE = 1 << 10
+
+# Default cap on num_samples per /sample request
+MAX_SAMPLES = 1000
+
+
+class MicroBatcher:
+    """Groups concurrent prediction requests into batched model calls"""
+
+    def __init__(self, model: su.NgramModel, max_batch_size: int = 256,
+                 max_wait: float = 0.002, seed: Optional[int] = None,
+                 max_samples: int = MAX_SAMPLES):
+        """
+        Initialize the batcher
+
+        Args:
+            model: Fitted model with a vocabulary
+            max_batch_size: Largest number of requests answered in one call
+            max_wait: Seconds to wait for more requests after the first one
+            seed: Random seed for sampling
+            max_samples: Largest num_samples a request may ask for
+        """
+        if model.vocab is None:
+            raise ValueError("the served model needs a vocabulary")
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer")
+        if max_samples < 1:
+            raise ValueError("max_samples must be a positive integer")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_samples = max_samples
+        # k and num_samples are validated per request, so one request cannot
+        # size the model call of the whole batch
+        self.limits = {"top_k": len(model.vocab), "sample": max_samples}
+        self.max_wait = max_wait
+        self.rng = np.random.default_rng(seed)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending: List[Tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._words_json: Dict[int, str] = {}
+        self._numbers_json: Dict[float, str] = {}
+
+        # Counters exposed by /stats
+        self.started = time.monotonic()
+        self.requests = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=10000)
+
+    def start(self):
+        """Attach the batcher to the running event loop"""
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        """Answer anything still queued and cancel the batching timer"""
+        self.flush()
+
+    def enqueue(self, kind: str, request, reply: Callable[[Any, str, bytes], None], token=None):
+        """
+        Queue one request; it is decoded and answered in the batch step
+
+        Args:
+            kind: 'top_k' or 'sample'
+            request: Raw JSON request body, or an already decoded dict
+            reply: Called as reply(token, status, body) with the HTTP status
+                and the JSON response body
+            token: Passed back to reply, so one callback can serve many requests
+        """
+        self.enqueue_many([(kind, request, reply, token, time.perf_counter())])
+
+    def enqueue_many(self, requests: List[Tuple]):
+        """
+        Queue several requests received together
+
+        Args:
+            requests: (kind, request, reply, token, arrival perf_counter) tuples,
+                with the same meaning as the arguments of enqueue()
+        """
+        pending = self.pending
+        pending.extend(requests)
+        while len(pending) >= self.max_batch_size:
+            batch = pending[:self.max_batch_size]
+            del pending[:self.max_batch_size]
+            self._answer(batch)
+        if not pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        elif pending and self._timer is None:
+            self._timer = self.loop.call_later(self.max_wait, self.flush)
+
+    async def submit(self, kind: str, context: List[str], amount: int):
+        """
+        Queue one request from Python code and wait for its answer
+
+        Args:
+            kind: 'top_k' or 'sample'
+            context: Previous words
+            amount: k for top_k, number of samples for sample
+
+        Returns:
+            (word, probability) pairs for top_k, a list of words for sample
+        """
+        future = self.loop.create_future()
+        field = "k" if kind == "top_k" else "num_samples"
+        self.enqueue(kind, {"context": list(context), field: amount}, _resolve, future)
+        status, body = await future
+        payload = json.loads(body)
+        if not status.startswith("200"):
+            raise ValueError(payload["error"])
+        if kind == "top_k":
+            return [tuple(pair) for pair in payload["predictions"]]
+        return payload["samples"]
+
+    def flush(self):
+        """Answer every queued request now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self.pending = self.pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            self._answer(pending[start:start + self.max_batch_size])
+
+    def encode_context(self, words: List[str]) -> np.ndarray:
+        """Last n-1 words as ids, left-padded with <START>"""
+        return self.encode_contexts([list(words)])[0]
+
+    def encode_contexts(self, contexts: List[List[str]]) -> np.ndarray:
+        """
+        Encode many contexts with a single vocabulary lookup
+
+        Returns:
+            (batch, n-1) array with the last n-1 ids of each context,
+            left-padded with <START>
+        """
+        width = self.model.n - 1
+        if width:
+            tails = list(map(itemgetter(slice(-width, None)), contexts))
+        else:
+            tails = [[]] * len(contexts)
+        lengths = np.fromiter(map(len, tails), dtype=np.int64, count=len(tails))
+        ids = self.model.vocab.encode(map(str.lower, chain.from_iterable(tails)))
+        encoded = np.full((len(tails), width), su.START_ID, dtype=np.int64)
+        rows = np.repeat(np.arange(len(tails)), lengths)
+        cols = np.arange(len(ids)) - np.repeat(np.cumsum(lengths) - width, lengths)
+        encoded[rows, cols] = ids
+        return encoded
+
+    def _answer(self, batch: List[Tuple]):
+        """Validate every request, then run one model call per request kind"""
+        self.batches += 1
+        groups = {"top_k": [], "sample": []}
+        limits = self.limits
+        for kind, request, reply, token, started in batch:
+            try:
+                if type(request) is bytes:
+                    request = json.loads(request.decode("utf-8"))
+                if type(request) is not dict:
+                    raise ValueError("request body must be a JSON object")
+                context = request.get("context", [])
+                if type(context) is not list or not {*map(type, context)} <= {str}:
+                    raise ValueError("context must be a list of words")
+                amount = int(request.get("k", 5) if kind == "top_k"
+                             else request.get("num_samples", 1))
+                if not 1 <= amount <= limits[kind]:
+                    raise ValueError(f"{'k' if kind == 'top_k' else 'num_samples'} "
+                                     f"must be between 1 and {limits[kind]}")
+            except (ValueError, TypeError, OverflowError) as e:
+                reply(token, "400 Bad Request", json.dumps({"error": str(e)}).encode("utf-8"))
+                continue
+            groups[kind].append((reply, token, started, context, amount))
+
+        for kind, items in groups.items():
+            if items:
+                self._answer_group(kind, items)
+
+    def _answer_group(self, kind: str, items: List[Tuple]):
+        """One model call for validated requests of one kind; on failure, one call each"""
+        replies, tokens, started, contexts, amounts = zip(*items)
+        try:
+            contexts = self.encode_contexts(contexts)
+            if kind == "top_k":
+                ids, probs = self.model.top_k(contexts, max(amounts))
+                bodies = self._prediction_bodies(ids, probs, amounts)
+            else:
+                samples = self.model.sample(contexts, max(amounts), self.rng)
+                bodies = self._sample_bodies(samples, amounts)
+        except Exception as e:
+            if len(items) > 1:
+                # Retry one by one, so a failing request cannot fail the others
+                for item in items:
+                    self._answer_group(kind, [item])
+                return
+            replies[0](tokens[0], "500 Internal Server Error",
+                       json.dumps({"error": str(e)}).encode("utf-8"))
+            return
+
+        now = time.perf_counter()
+        self.requests += len(items)
+        self.latencies.extend(map(now.__sub__, started))
+        for reply, token, body in zip(replies, tokens, bodies):
+            reply(token, "200 OK", body)
+
+    def _word_fragments(self, ids: np.ndarray) -> List[str]:
+        """JSON string of the word for every id, cached across batches"""
+        cache = self._words_json
+        flat = ids.ravel().tolist()
+        try:
+            return list(map(cache.__getitem__, flat))
+        except KeyError:
+            pass
+        missing = [i for i in set(flat) if i not in cache]
+        if missing:
+            cache.update(zip(missing, map(json.dumps, self.model.vocab.decode(missing))))
+        return list(map(cache.__getitem__, flat))
+
+    def _number_fragments(self, values: np.ndarray) -> List[str]:
+        """
+        JSON spelling of every float, cached across batches
+
+        Probabilities are count ratios that repeat across requests, and
+        repr() (which json.dumps uses) is the slowest part of a response.
+        """
+        cache = self._numbers_json
+        flat = values.ravel().tolist()
+        try:
+            return list(map(cache.__getitem__, flat))
+        except KeyError:
+            pass
+        missing = [v for v in set(flat) if v not in cache]
+        if missing:
+            if len(cache) + len(missing) > NUMBER_CACHE_SIZE:
+                cache.clear()
+            cache.update(zip(missing, map(float.__repr__, missing)))
+        return list(map(cache.__getitem__, flat))
+
+    def _prediction_bodies(self, ids: np.ndarray, probs: np.ndarray,
+                           amounts: List[int]) -> List[bytes]:
+        """{"predictions": [[word, probability], ...]} for every row, padding dropped"""
+        keep = (ids >= 0) & (np.arange(ids.shape[1]) < np.asarray(amounts)[:, None])
+        pairs = [f"[{word}, {value}]" for word, value in
+                 zip(self._word_fragments(ids[keep]), self._number_fragments(probs[keep]))]
+        ends = np.cumsum(keep.sum(axis=1)).tolist()
+        return [f'{{"predictions": [{", ".join(pairs[start:end])}]}}'.encode("utf-8")
+                for start, end in zip([0] + ends, ends)]
+
+    def _sample_bodies(self, samples: np.ndarray, amounts: List[int]) -> List[bytes]:
+        """{"samples": [word, ...]} for every row"""
+        width = samples.shape[1]
+        words = self._word_fragments(samples)
+        return [f'{{"samples": [{", ".join(words[i * width:i * width + n])}]}}'
+                .encode("utf-8") for i, n in enumerate(amounts)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Latency and throughput counters"""
+        uptime = time.monotonic() - self.started
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "uptime_s": uptime,
+            "throughput_rps": self.requests / uptime if uptime else 0.0,
+            "latency_ms": {
+                "mean": float(latencies.mean()) if len(latencies) else None,
+                "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+                "max": float(latencies.max()) if len(latencies) else None,
+            },
+        }
+
+
+class _HTTPConnection(asyncio.Protocol):
+    """
+    One keep-alive HTTP/1.1 connection
+
+    Every complete request in a received chunk is parsed at once, so
+    pipelined requests reach the batcher together. Responses are written
+    in request order, coalesced into one write per event loop iteration.
+    """
+
+    def __init__(self, server: "PredictionServer"):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = b""
+        self.slots = deque()
+        self.flush_scheduled = False
+        self.closing = False
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.server.connections.add(self)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.transport = None
+        self.server.connections.discard(self)
+
+    def data_received(self, data: bytes):
+        buffer = self.buffer + data if self.buffer else data
+        arrived = time.perf_counter()
+        add_slot = self.slots.append
+        fill = self._fill
+        queued = []
+        start = 0
+        while not self.closing:
+            end = buffer.find(b"\r\n\r\n", start)
+            if end < 0:
+                break
+            head = buffer[start:end]
+            parsed = _REQUEST_HEADS.get(head)
+            if parsed is None:
+                try:
+                    parsed = _parse_head(head)
+                except ValueError:
+                    self._respond("400 Bad Request", b'{"error": "malformed request"}', False)
+                    break
+            kind, method, path, length, keep_alive = parsed
+            body_end = end + 4 + length
+            if len(buffer) < body_end:
+                break
+            if not keep_alive:
+                self.closing = True
+            if kind is not None:
+                slot = [None, None, keep_alive]
+                add_slot(slot)
+                queued.append((kind, buffer[end + 4:body_end], fill, slot, arrived))
+            else:
+                self._dispatch(method, path, keep_alive)
+            start = body_end
+        self.buffer = buffer[start:]
+        if queued:
+            self.server.batcher.enqueue_many(queued)
+
+    def _dispatch(self, method: bytes, path: bytes, keep_alive: bool):
+        """Answer a request that does not go through the batcher"""
+        if method == b"GET" and path == b"/stats":
+            self._respond("200 OK", json.dumps(self.server.batcher.stats()).encode("utf-8"),
+                          keep_alive)
+        else:
+            error = {"error": f"unknown endpoint {method.decode('latin-1')} "
+                              f"{path.decode('latin-1')}"}
+            self._respond("404 Not Found", json.dumps(error).encode("utf-8"), keep_alive)
+
+    def _respond(self, status: str, data: bytes, keep_alive: bool):
+        """Answer a request that needs no batching (still in request order)"""
+        slot = [None, None, keep_alive]
+        self.slots.append(slot)
+        self._fill(slot, status, data)
+        if not keep_alive:
+            self.closing = True
+
+    def _fill(self, slot: list, status: str, data: bytes):
+        slot[0], slot[1] = status, data
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._write_ready)
+
+    def _write_ready(self):
+        """Write every answered response at the head of the queue"""
+        self.flush_scheduled = False
+        slots = self.slots
+        out = []
+        close = False
+        while slots and slots[0][0] is not None:
+            status, data, keep_alive = slots.popleft()
+            head = _RESPONSE_HEADS.get((status, keep_alive)) or _response_head(status, keep_alive)
+            out.append(b"%s%d\r\n\r\n%s" % (head, len(data), data))
+            if not keep_alive:
+                close = True
+                break
+        if self.transport is None:
+            return
+        if out:
+            self.transport.write(b"".join(out))
+        if close:
+            self.transport.close()
+
+
+# Response head up to the Content-Length value, per (status, keep_alive)
+_RESPONSE_HEADS: Dict[Tuple[str, bool], bytes] = {}
+
+
+def _response_head(status: str, keep_alive: bool) -> bytes:
+    head = (f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"Content-Length: ").encode("latin-1")
+    _RESPONSE_HEADS[status, keep_alive] = head
+    return head
+
+
+def _resolve(future: asyncio.Future, status: str, body: bytes):
+    """Reply callback of MicroBatcher.submit()"""
+    if not future.done():
+        future.set_result((status, body))
+
+
+# Request paths answered through the batcher, and the model call they use
+_BATCHED_ENDPOINTS = {b"/predict": "top_k", b"/sample": "sample"}
+
+
+def _parse_head(head: bytes) -> Tuple[Optional[str], bytes, bytes, int, bool]:
+    """
+    Parse a request line and headers, caching the result
+
+    Pipelining clients repeat the same head bytes, so most requests are
+    answered from the cache without touching the headers.
+
+    Returns:
+        (batched kind or None, method, path, Content-Length, keep_alive)
+
+    Raises:
+        ValueError: If the request line or Content-Length is malformed
+    """
+    line_end = head.find(b"\r\n")
+    if line_end < 0:
+        line_end = len(head)
+    method, path, _ = head[:line_end].split(b" ", 2)
+    lowered = head[line_end:].lower()
+    length = 0
+    if method == b"POST":
+        value = _header(lowered, b"content-length")
+        if value is not None:
+            length = int(value)
+    if length < 0:
+        raise ValueError("negative Content-Length")
+    keep_alive = _header(lowered, b"connection") != b"close"
+    kind = _BATCHED_ENDPOINTS.get(path) if method == b"POST" else None
+    if len(_REQUEST_HEADS) >= HEAD_CACHE_SIZE:
+        _REQUEST_HEADS.clear()
+    parsed = _REQUEST_HEADS[head] = (kind, method, path, length, keep_alive)
+    return parsed
+
+
+# Parsed request heads, see _parse_head()
+_REQUEST_HEADS: Dict[bytes, Tuple[Optional[str], bytes, bytes, int, bool]] = {}
+
+
+def _header(lowered_head: bytes, name: bytes) -> Optional[bytes]:
+    """Value of a header in a lowercased request head, or None"""
+    start = lowered_head.find(b"\r\n" + name + b":")
+    if start < 0:
+        return None
+    start += len(name) + 3
+    end = lowered_head.find(b"\r\n", start)
+    return lowered_head[start:end if end >= 0 else len(lowered_head)].strip()
+
+
+class PredictionServer:
+    """Minimal asyncio HTTP/1.1 server in front of a MicroBatcher"""
+
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765,
+                    unix_path: Optional[str] = None):
+        """
+        Start listening on a TCP port or a Unix socket
+
+        Returns:
+            The address being served
+        """
+        self.batcher.start()
+        loop = asyncio.get_running_loop()
+        if unix_path:
+            self.server = await loop.create_unix_server(lambda: _HTTPConnection(self),
+                                                        path=unix_path)
+            return unix_path
+        self.server = await loop.create_server(lambda: _HTTPConnection(self), host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        """Stop accepting connections, answer queued requests and close connections"""
+        if self.server is not None:
+            self.server.close()
+        await self.batcher.stop()
+        await asyncio.sleep(0)
+        for connection in list(self.connections):
+            if connection.transport is not None:
+                connection.transport.close()
+        if self.server is not None:
+            await self.server.wait_closed()
+
+
+def build_model(args) -> su.NgramModel:
+    """Load a saved model or fit one on a corpus file"""
+    if args.model:
+        return su.load_model(args.model)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        tokens = su.tokenize(f.read())
+    return su.NgramModel.from_tokens(tokens, n=args.n)
+
+
+async def serve(args):
+    """Run the server until interrupted"""
+    batcher = MicroBatcher(build_model(args), args.max_batch_size,
+                           args.max_wait_ms / 1000, args.seed, args.max_samples)
+    server = PredictionServer(batcher)
+    address = await server.start(args.host, args.port, args.unix)
+    print(f"[OK] Serving predictions on {address}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    """Main entry point for the script"""
+
+    parser = argparse.ArgumentParser(
+        description="Serve next-word predictions from an n-gram model"
+    )
+    parser.add_argument("--model", "-m", help="Model saved with save_model()")
+    parser.add_argument("--corpus", "-c", help="Text file to fit a model on",
+                        default="shakespeare_sonnets.txt")
+    parser.add_argument("--n", help="Model order when fitting", type=int, default=2)
+    parser.add_argument("--host", help="Host to bind", default="127.0.0.1")
+    parser.add_argument("--port", "-p", help="TCP port", type=int, default=8765)
+    parser.add_argument("--unix", help="Serve on this Unix socket instead of TCP")
+    parser.add_argument("--max-batch-size", help="Requests per batch", type=int, default=256)
+    parser.add_argument("--max-wait-ms", help="Batching window in milliseconds",
+                        type=float, default=2.0)
+    parser.add_argument("--seed", help="Random seed for sampling", type=int, default=None)
+    parser.add_argument("--max-samples", help="Largest num_samples per request",
+                        type=int, default=MAX_SAMPLES)
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,45 +7,541 @@ Usage:
     python quantlet_auto_submit.py --token YOUR_GITHUB_TOKEN
     
 Prerequisites:
-    pip install requests gitpython PyGithub
+    pip install requests gitpython
 """
 
 import os
+import re
 import sys
 import json
 import time
 import argparse
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Dict, Any
+from collections.abc import Mapping
+from typing import Optional, Dict, Any, List, Tuple
 
 try:
     import requests
-    from github import Github
     import git
 except ImportError:
     print("Installing required packages...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests", "PyGithub", "gitpython"])
+    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests", "gitpython"])
     import requests
-    from github import Github
     import git
 
 
+GITHUB_API_URL = "https://api.github.com"
+QUANTLET_STYLEGUIDE_REPO = "QuantLet/Styleguide-and-FAQ"
+
+# Fields of a Metainfo.txt file, in the order QuantLet lists them
+METAINFO_FIELDS = ["Name of QuantLet", "Published in", "Description", "Keywords",
+                   "See also", "Author", "Submitted", "Datafiles", "Input", "Output"]
+REQUIRED_METAINFO_FIELDS = ["Name of QuantLet", "Published in",
+                            "Description", "Keywords", "Author"]
+
+# Persistent verification cache, stored in the repository root
+VERIFY_CACHE_FILE = ".quantlet_verify_cache.json"
+VERIFY_CACHE_VERSION = 1
+
+# Record of what batch submission has already done, stored in the repository root
+SUBMIT_MANIFEST_FILE = ".quantlet_submit_manifest.json"
+
+# Directories never searched for Metainfo.txt
+SKIP_DIRS = {"__pycache__", "node_modules", "venv"}
+
+_FIELD_PATTERN = re.compile(
+    r"^(" + "|".join(re.escape(field) for field in METAINFO_FIELDS) + r")\s*:\s?(.*)$",
+    re.IGNORECASE
+)
+
+
+def parse_metainfo(text: str) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Parse the fields of a Metainfo.txt file
+    
+    A field starts on a line beginning with a known field name and a colon;
+    following lines up to the next field are continuation lines. Values
+    wrapped in single or double quotes are unquoted.
+    
+    Args:
+        text: Content of the Metainfo.txt file
+        
+    Returns:
+        Tuple of (fields keyed by canonical field name, parse warnings)
+    """
+    canonical = {field.lower(): field for field in METAINFO_FIELDS}
+    fields: Dict[str, List[str]] = {}
+    warnings = []
+    current = None
+    
+    for number, line in enumerate(text.splitlines(), 1):
+        match = _FIELD_PATTERN.match(line)
+        if match:
+            current = canonical[match.group(1).lower()]
+            if current in fields:
+                warnings.append(f"Duplicate '{current}' on line {number}")
+            fields[current] = [match.group(2).strip()]
+        elif current is not None:
+            fields[current].append(line.strip())
+        elif line.strip():
+            warnings.append(f"Text outside any field on line {number}")
+    
+    parsed = {}
+    for field, lines in fields.items():
+        value = " ".join(part for part in lines if part)
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1].strip()
+        parsed[field] = value
+    
+    return parsed, warnings
+
+
+def validate_metainfo(path: Path) -> Dict[str, Any]:
+    """
+    Read, parse and check one Metainfo.txt file
+    
+    A file is valid when every required field is present and non-empty and
+    the file can be read. Parse oddities and a QuantLet name that differs
+    from the folder name are reported as warnings only.
+    
+    Args:
+        path: Path to the Metainfo.txt file
+        
+    Returns:
+        Dictionary with 'valid', 'fields', 'missing', 'errors' and 'warnings'
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            fields, warnings = parse_metainfo(f.read())
+    except (OSError, UnicodeDecodeError) as e:
+        return {"valid": False, "fields": {}, "missing": [], "errors": [str(e)], "warnings": []}
+    
+    missing = [field for field in REQUIRED_METAINFO_FIELDS if not fields.get(field)]
+    name = fields.get("Name of QuantLet")
+    if name and name != path.parent.name:
+        warnings.append(f"Name of QuantLet '{name}' does not match folder '{path.parent.name}'")
+    
+    return {
+        "valid": not missing,
+        "fields": fields,
+        "missing": missing,
+        "errors": [],
+        "warnings": warnings,
+    }
+
+
+def find_metainfo_files(root: Path) -> List[Tuple[str, os.stat_result]]:
+    """
+    Find every Metainfo.txt below root, with its stat result
+    
+    Hidden directories (such as .git) and SKIP_DIRS are not searched.
+    Paths are plain strings; building Path objects dominates on large trees.
+    """
+    found = []
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(".") and entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.name == "Metainfo.txt" and entry.is_file():
+                    found.append((entry.path, entry.stat()))
+    found.sort()
+    return found
+
+
+def _load_verify_cache(cache_path: Path) -> Dict[str, Any]:
+    """Load cached results; an unreadable or outdated cache counts as empty"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != VERIFY_CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+
+def _write_json_atomic(path: Path, data: Any):
+    """
+    Write JSON atomically so an interrupted run cannot corrupt the file
+    
+    Raises:
+        OSError: If the file could not be written (the old file is kept)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # json.dumps uses the C encoder; json.dump streams through the Python one
+            f.write(json.dumps(data))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _save_verify_cache(cache_path: Path, entries: Dict[str, Any]):
+    """Store verification results for the next run; a failed write only costs speed"""
+    try:
+        _write_json_atomic(cache_path, {"version": VERIFY_CACHE_VERSION, "files": entries})
+    except OSError as e:
+        print(f"[WARNING] Could not write verification cache {cache_path}: {e}")
+
+
+def load_submit_manifest(manifest_path: Path) -> Dict[str, Any]:
+    """
+    Load the batch submission manifest
+    
+    Returns:
+        Entries keyed by repository name (empty if there is no manifest yet)
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("quantlets", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def verify_quantlets(root: Path, workers: Optional[int] = None,
+                     use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Validate every QuantLet below root
+    
+    Metainfo files whose path, modification time and size match the cache
+    are not read again; the rest are parsed in a thread pool.
+    
+    Args:
+        root: Repository root
+        workers: Number of reader threads (default: ThreadPoolExecutor's)
+        use_cache: Read and update the cache in root/VERIFY_CACHE_FILE
+        
+    Returns:
+        Machine-readable report with per-file results under 'files'
+    """
+    start = time.perf_counter()
+    root = Path(root).resolve()
+    cache_path = root / VERIFY_CACHE_FILE
+    cached = _load_verify_cache(cache_path) if use_cache else {}
+    
+    entries = {}
+    to_check = []
+    prefix = len(str(root)) + 1
+    for path, stat in find_metainfo_files(root):
+        key = path[prefix:].replace(os.sep, "/")
+        entry = cached.get(key)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            entries[key] = dict(entry, cached=True)
+        else:
+            entries[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "cached": False}
+            to_check.append((key, path))
+    
+    if to_check:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            checked = executor.map(validate_metainfo, [Path(path) for _, path in to_check])
+            for (key, _), result in zip(to_check, checked):
+                entries[key]["result"] = result
+    
+    if use_cache and (to_check or len(entries) != len(cached)):
+        _save_verify_cache(cache_path, {
+            key: {"mtime_ns": e["mtime_ns"], "size": e["size"], "result": e["result"]}
+            for key, e in entries.items()
+        })
+    
+    files = [dict(entry["result"], path=key, cached=entry["cached"])
+             for key, entry in entries.items()]
+    
+    issues = []
+    readme = (root / "README.md").exists()
+    if not readme:
+        issues.append("Missing README.md")
+    if not files:
+        issues.append("No Metainfo.txt files found")
+    for result in files:
+        for field in result["missing"]:
+            issues.append(f"Missing '{field}' in {result['path']}")
+        for error in result["errors"]:
+            issues.append(f"{error} in {result['path']}")
+    
+    return {
+        "root": str(root),
+        "valid": not issues,
+        "readme": readme,
+        "quantlets": len(files),
+        "checked": len(to_check),
+        "cached": len(files) - len(to_check),
+        "seconds": time.perf_counter() - start,
+        "issues": issues,
+        "warnings": [f"{warning} in {result['path']}"
+                     for result in files for warning in result["warnings"]],
+        "files": files,
+    }
+
+
+class GitHubAPIError(Exception):
+    """Error response from the GitHub REST API"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(f"GitHub API error {status}: {message}")
+        self.status = status
+
+
+class TokenBucket:
+    """
+    Token-bucket scheduler for API requests
+    
+    The refill rate follows GitHub's rate-limit headers: the remaining quota
+    is spread over the time left until the reset, an exhausted quota blocks
+    until the reset, and Retry-After (secondary rate limits) blocks for the
+    given number of seconds.
+    """
+    
+    def __init__(self, rate: float = 10.0, capacity: int = 10, min_rate: float = 0.1):
+        """
+        Args:
+            rate: Maximum requests per second
+            capacity: Burst size
+            min_rate: Lowest refill rate the headers can push the bucket to
+        """
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+    
+    def update(self, headers: Mapping[str, str]):
+        """Adjust the schedule from the headers of a response"""
+        retry_after = headers.get("Retry-After")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        
+        with self.lock:
+            now = time.monotonic()
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + float(retry_after))
+            if remaining is None or reset is None:
+                return
+            seconds_left = max(0.0, float(reset) - time.time())
+            if int(remaining) <= 0:
+                self.blocked_until = max(self.blocked_until, now + seconds_left)
+                self.tokens = 0.0
+            else:
+                spread = int(remaining) / max(seconds_left, 1.0)
+                self.rate = max(self.min_rate, min(self.max_rate, spread))
+
+
+class GitHubClient:
+    """
+    Small GitHub REST client shared by all submission workers
+    
+    One pooled requests.Session serves every call. GET responses are cached
+    by ETag and revalidated with If-None-Match; GitHub does not count 304
+    answers against the rate limit. Every request goes through a TokenBucket
+    and is retried after rate-limit responses. The authenticated user is
+    looked up on first use only.
+    """
+    
+    def __init__(self, token: str, base_url: str = GITHUB_API_URL,
+                 session: Optional[requests.Session] = None,
+                 bucket: Optional[TokenBucket] = None,
+                 timeout: float = 30.0, max_retries: int = 3, pool_size: int = 16):
+        """
+        Args:
+            token: Personal Access Token
+            base_url: API root; tests point this at a local server
+            session: Session to use instead of a new pooled one
+            bucket: Request scheduler (default: TokenBucket())
+            timeout: Seconds per request
+            max_retries: Retries after rate-limit responses
+            pool_size: Connections kept open to the API host
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = bucket or TokenBucket()
+        
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github+json",
+            "User-Agent": "quantlet-auto-submit",
+        })
+        self.session = session
+        
+        self._etag_cache: Dict[str, Tuple[str, Any]] = {}
+        self._user: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._user_lock = threading.Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "rate_limited": 0}
+    
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+    
+    def request(self, method: str, path: str,
+                payload: Optional[Dict[str, Any]] = None) -> Tuple[int, Any]:
+        """
+        Send one API request
+        
+        Args:
+            method: HTTP method
+            path: Path below base_url (e.g. '/user') or a full URL
+            payload: JSON body
+            
+        Returns:
+            Tuple of (status code, decoded JSON body or None)
+        """
+        url = path if path.startswith("http") else self.base_url + path
+        cacheable = method == "GET"
+        
+        for _ in range(self.max_retries + 1):
+            headers = {}
+            cached = self._etag_cache.get(url) if cacheable else None
+            if cached:
+                headers["If-None-Match"] = cached[0]
+            
+            self.bucket.acquire()
+            response = self.session.request(method, url, json=payload, headers=headers,
+                                            timeout=self.timeout)
+            self._count("requests")
+            self.bucket.update(response.headers)
+            
+            if response.status_code == 304 and cached:
+                self._count("cache_hits")
+                return 200, cached[1]
+            if response.status_code in (403, 429) and (
+                    "Retry-After" in response.headers
+                    or response.headers.get("X-RateLimit-Remaining") == "0"):
+                self._count("rate_limited")
+                continue
+            
+            body = response.json() if response.content else None
+            if cacheable and response.ok and "ETag" in response.headers:
+                with self._lock:
+                    self._etag_cache[url] = (response.headers["ETag"], body)
+            return response.status_code, body
+        
+        raise GitHubAPIError(response.status_code, "rate limit retries exhausted")
+    
+    def _expect(self, status: int, body: Any, *ok: int) -> Any:
+        """Return body if status is one of ok, else raise GitHubAPIError"""
+        if status not in ok:
+            message = body.get("message", "") if isinstance(body, dict) else ""
+            raise GitHubAPIError(status, message)
+        return body
+    
+    @property
+    def user(self) -> Dict[str, Any]:
+        """The authenticated user, fetched on first access"""
+        if self._user is None:
+            # Workers start together; only one of them should ask
+            with self._user_lock:
+                if self._user is None:
+                    self._user = self._expect(*self.request("GET", "/user"), 200)
+        return self._user
+    
+    @property
+    def login(self) -> str:
+        """Login of the authenticated user"""
+        return self.user["login"]
+    
+    def get_repo(self, full_name: str) -> Optional[Dict[str, Any]]:
+        """Repository 'owner/name', or None if it does not exist"""
+        status, body = self.request("GET", f"/repos/{full_name}")
+        if status == 404:
+            return None
+        return self._expect(status, body, 200)
+    
+    def create_repo(self, name: str, description: str = "",
+                    private: bool = False) -> Dict[str, Any]:
+        """Create a repository owned by the authenticated user"""
+        payload = {"name": name, "description": description,
+                   "private": private, "auto_init": False}
+        return self._expect(*self.request("POST", "/user/repos", payload), 201)
+    
+    def create_issue(self, full_name: str, title: str, body: str) -> Dict[str, Any]:
+        """Open an issue on repository 'owner/name'"""
+        payload = {"title": title, "body": body}
+        return self._expect(*self.request("POST", f"/repos/{full_name}/issues", payload), 201)
+
+
 class QuantLetSubmitter:
     """Automates QuantLet submission process"""
     
-    def __init__(self, github_token: str, repo_path: str = "."):
+    # Where pushes go; tests point this at local bare repositories
+    remote_url_template = "https://{token}@github.com/{owner}/{repo}.git"
+    
+    def __init__(self, github_token: str, repo_path: str = ".",
+                 api: Optional[GitHubClient] = None):
         """
         Initialize the submitter with GitHub token and repository path
         
         Args:
             github_token: Personal Access Token from GitHub
             repo_path: Path to the local repository
+            api: Client to use instead of GitHubClient(github_token)
         """
         self.token = github_token
         self.repo_path = Path(repo_path).resolve()
-        self.github = Github(github_token)
-        self.user = self.github.get_user()
+        self.api = api if api is not None else GitHubClient(github_token)
+        self.verification_report: Optional[Dict[str, Any]] = None
+        self.branch = "master"
+    
+    def remote_url(self, repo_name: str) -> str:
+        """Push URL of a repository owned by the authenticated user"""
+        return self.remote_url_template.format(token=self.token, owner=self.api.login,
+                                               repo=repo_name)
+    
+    def wait_for_remote(self, repo_name: str, timeout: float = 30.0,
+                        interval: float = 0.25) -> bool:
+        """
+        Poll until a freshly created repository accepts git connections
+        
+        Args:
+            repo_name: Name of the GitHub repository
+            timeout: Seconds to keep polling
+            interval: First polling interval; it doubles up to 2 seconds
+            
+        Returns:
+            True once `git ls-remote` succeeds, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        url = self.remote_url(repo_name)
+        while True:
+            try:
+                git.cmd.Git().ls_remote(url)
+                return True
+            except git.GitCommandError:
+                if time.monotonic() + interval > deadline:
+                    return False
+            time.sleep(interval)
+            interval = min(interval * 2, 2.0)
         
     def create_github_repository(self, 
                                   repo_name: str, 
@@ -66,87 +562,150 @@ class QuantLetSubmitter:
         
         try:
             # Check if repo already exists
-            try:
-                existing_repo = self.user.get_repo(repo_name)
-                print(f"Repository {repo_name} already exists at {existing_repo.html_url}")
-                return existing_repo.html_url
-            except:
-                pass  # Repo doesn't exist, create it
+            existing_repo = self.api.get_repo(f"{self.api.login}/{repo_name}")
+            if existing_repo is not None:
+                print(f"Repository {repo_name} already exists at {existing_repo['html_url']}")
+                return existing_repo["html_url"]
             
-            # Create new repository
-            repo = self.user.create_repo(
-                name=repo_name,
-                description=description,
-                private=not public,
-                auto_init=False  # Don't initialize with README
-            )
+            # Create new repository (without README)
+            repo = self.api.create_repo(repo_name, description, private=not public)
             
-            print(f"[OK] Repository created: {repo.html_url}")
-            return repo.html_url
+            print(f"[OK] Repository created: {repo['html_url']}")
+            return repo["html_url"]
             
         except Exception as e:
             print(f"Error creating repository: {e}")
             return None
     
-    def push_to_github(self, repo_name: str) -> bool:
+    def push_to_github(self, repo_name: str, path: Optional[Path] = None) -> bool:
         """
         Push local repository to GitHub
         
         Args:
             repo_name: Name of the GitHub repository
+            path: Directory to push (default: the submitter's repository)
             
         Returns:
             True if successful, False otherwise
         """
-        print(f"Pushing code to GitHub repository: {repo_name}")
+        return self._push(repo_name, path)["pushed"]
+    
+    def _snapshot(self, path: Path, scratch_dir: str) -> Tuple["git.Repo", str]:
+        """
+        Stage the current content of path into a throwaway index
         
-        try:
-            # Initialize git repo if needed
-            try:
-                repo = git.Repo(self.repo_path)
-            except:
-                repo = git.Repo.init(self.repo_path)
-                print("Initialized git repository")
-            
-            # Add all files if not already staged
-            repo.git.add(A=True)
-            
-            # Commit if there are changes
-            if repo.is_dirty():
-                repo.index.commit("Initial commit for QuantLet submission")
-                print("[OK] Created commit")
-            
-            # Set remote
-            remote_url = f"https://{self.token}@github.com/{self.user.login}/{repo_name}.git"
-            
-            # Remove existing origin if exists
-            try:
-                origin = repo.remote("origin")
-                origin.remove(repo, "origin")
-            except:
-                pass
+        Inside a git repository the enclosing repository stages path into a
+        temporary index, so its ignore rules apply and its own index, HEAD
+        and config stay untouched (only objects are added). Elsewhere a bare
+        repository in scratch_dir uses path as work tree. Either way no .git
+        directory is created in path.
+        
+        Args:
+            path: Directory to snapshot
+            scratch_dir: Temporary directory for the index and bare repository
             
-            # Add new origin
-            origin = repo.create_remote("origin", remote_url)
-            print(f"[OK] Added remote: {self.user.login}/{repo_name}")
+        Returns:
+            Tuple of (repository holding the objects, tree hash of path)
+        """
+        env = {"GIT_INDEX_FILE": os.path.join(scratch_dir, "index")}
+        try:
+            repo = git.Repo(path, search_parent_directories=True)
+            prefix = path.relative_to(Path(repo.working_tree_dir).resolve()).as_posix()
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError, TypeError, ValueError):
+            repo = git.Repo.init(os.path.join(scratch_dir, "snapshot.git"), bare=True)
+            repo.git.add(all=True, env=dict(env, GIT_WORK_TREE=str(path)))
+            return repo, repo.git.write_tree(env=env)
+        
+        repo.git.add("--", prefix, all=True, env=env)
+        if prefix == ".":
+            return repo, repo.git.write_tree(env=env)
+        return repo, repo.git.write_tree(f"--prefix={prefix}/", env=env)
+    
+    def _remote_head(self, repo: "git.Repo", url: str) -> Optional[str]:
+        """
+        Fetch the remote branch into repo's object store; returns its commit
+        
+        Only objects are fetched: no ref, remote or FETCH_HEAD (which would
+        record the URL and its token) is written.
+        
+        Returns:
+            Commit hash of the branch, or None if the remote does not have it
+        """
+        ref = f"refs/heads/{self.branch}"
+        listed = repo.git.ls_remote(url, ref).split()
+        if not listed:
+            return None
+        repo.git.fetch(url, ref, no_write_fetch_head=True, no_tags=True)
+        return listed[0]
+    
+    def _commit_tree(self, repo: "git.Repo", tree: str, message: str,
+                     parent: Optional[str] = None) -> str:
+        """Create a commit of tree in repo on top of parent; returns its hash"""
+        reader = repo.config_reader()
+        author, committer = git.Actor.author(reader), git.Actor.committer(reader)
+        env = {"GIT_AUTHOR_NAME": author.name, "GIT_AUTHOR_EMAIL": author.email,
+               "GIT_COMMITTER_NAME": committer.name, "GIT_COMMITTER_EMAIL": committer.email}
+        args = ["-p", parent] if parent else []
+        return repo.git.commit_tree(tree, *args, m=message, env=env)
+    
+    def _redact(self, text: str) -> str:
+        """Hide the token in messages that may quote a push URL"""
+        return text.replace(self.token, "***") if self.token else text
+    
+    def _push(self, repo_name: str, path: Optional[Path] = None,
+              known_tree: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Push a snapshot of one directory, skipping the push if its tree is known
+        
+        The snapshot from _snapshot() is committed on top of the remote
+        branch head and pushed straight to the remote URL without force, so
+        the branch history is kept and neither a nested repository nor a
+        remote holding the token is left behind. A remote branch that moved
+        in between rejects the push.
+        
+        Args:
+            repo_name: Name of the GitHub repository
+            path: Directory to push (default: the submitter's repository)
+            known_tree: Tree hash that was pushed before
             
-            # Push to GitHub
-            print("Pushing to GitHub...")
-            origin.push(refspec="master:master", force=True)
+        Returns:
+            Dictionary with 'pushed', 'skipped', 'tree' and 'commit'
+        """
+        path = Path(path or self.repo_path).resolve()
+        result = {"pushed": False, "skipped": False, "tree": None, "commit": None}
+        print(f"Pushing code to GitHub repository: {repo_name}")
+        
+        try:
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                repo, tree = self._snapshot(path, scratch_dir)
+                result["tree"] = tree
+                if known_tree == tree:
+                    print(f"[OK] {repo_name} unchanged since last push, skipping")
+                    result["pushed"] = result["skipped"] = True
+                    return result
+                
+                url = self.remote_url(repo_name)
+                parent = self._remote_head(repo, url)
+                result["commit"] = self._commit_tree(repo, tree,
+                                                     f"QuantLet submission of {path.name}",
+                                                     parent)
+                print("Pushing to GitHub...")
+                repo.git.push(url, f"{result['commit']}:refs/heads/{self.branch}")
             print("[OK] Code pushed successfully")
-            
-            return True
+            result["pushed"] = True
             
         except Exception as e:
-            print(f"Error pushing to GitHub: {e}")
-            return False
+            print(f"Error pushing to GitHub: {self._redact(str(e))}")
+        
+        return result
     
-    def create_quantlet_issue(self, repo_name: str) -> str:
+    def create_quantlet_issue(self, repo_name: str, description: Optional[str] = None) -> str:
         """
         Create submission issue on QuantLet/Styleguide-and-FAQ
         
         Args:
             repo_name: Name of your repository
+            description: Issue description (default: first paragraph of README.md)
             
         Returns:
             URL of the created issue
@@ -154,21 +713,15 @@ class QuantLetSubmitter:
         print("Creating QuantLet submission issue...")
         
         try:
-            # Get QuantLet Styleguide repository
-            quantlet_repo = self.github.get_repo("QuantLet/Styleguide-and-FAQ")
-            
             # Prepare issue content
             issue_title = f"New QuantLet Submission: {repo_name}"
-            issue_body = self._generate_issue_content(repo_name)
+            issue_body = self._generate_issue_content(repo_name, description)
             
-            # Create issue
-            issue = quantlet_repo.create_issue(
-                title=issue_title,
-                body=issue_body
-            )
+            # Create issue on the QuantLet Styleguide repository
+            issue = self.api.create_issue(QUANTLET_STYLEGUIDE_REPO, issue_title, issue_body)
             
-            print(f"[OK] Issue created: {issue.html_url}")
-            return issue.html_url
+            print(f"[OK] Issue created: {issue['html_url']}")
+            return issue["html_url"]
             
         except Exception as e:
             print(f"Error creating issue: {e}")
@@ -176,26 +729,27 @@ class QuantLetSubmitter:
             print("https://github.com/QuantLet/Styleguide-and-FAQ/issues")
             return None
     
-    def _generate_issue_content(self, repo_name: str) -> str:
+    def _generate_issue_content(self, repo_name: str, description: Optional[str] = None) -> str:
         """Generate issue content for QuantLet submission"""
         
         # Try to read local metadata
         readme_path = self.repo_path / "README.md"
-        description = "Educational QuantLet modules"
         
-        if readme_path.exists():
-            with open(readme_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()[:10]
-                for line in lines:
-                    if line.strip() and not line.startswith("#"):
-                        description = line.strip()
-                        break
+        if description is None:
+            description = "Educational QuantLet modules"
+            if readme_path.exists():
+                with open(readme_path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()[:10]
+                    for line in lines:
+                        if line.strip() and not line.startswith("#"):
+                            description = line.strip()
+                            break
         
         content = f"""# New QuantLet Submission: {repo_name}
 
 ## Repository Details
-- **Repository**: https://github.com/{self.user.login}/{repo_name}
-- **Author**: {self.user.name or self.user.login}
+- **Repository**: https://github.com/{self.api.login}/{repo_name}
+- **Author**: {self.api.user.get("name") or self.api.login}
 - **Category**: Natural Language Processing / Machine Learning
 
 ## Description
@@ -218,45 +772,33 @@ Thank you for maintaining this valuable educational resource!
 """
         return content
     
-    def verify_quantlet_structure(self) -> bool:
+    def verify_quantlet_structure(self, workers: Optional[int] = None,
+                                  use_cache: bool = True) -> bool:
         """
         Verify that the repository follows QuantLet structure
         
+        The full per-file report is kept in self.verification_report.
+        
+        Args:
+            workers: Number of threads reading Metainfo files
+            use_cache: Skip Metainfo files unchanged since the last run
+        
         Returns:
             True if structure is valid
         """
         print("Verifying QuantLet structure...")
         
-        issues = []
-        
-        # Check for README
-        if not (self.repo_path / "README.md").exists():
-            issues.append("Missing README.md")
+        report = verify_quantlets(self.repo_path, workers, use_cache)
+        self.verification_report = report
         
-        # Check for Metainfo files
-        metainfo_count = 0
-        for metainfo in self.repo_path.rglob("Metainfo.txt"):
-            metainfo_count += 1
-            
-            # Basic validation of Metainfo content
-            with open(metainfo, 'r', encoding='utf-8') as f:
-                content = f.read()
-                required_fields = ["Name of QuantLet", "Published in", 
-                                   "Description", "Keywords", "Author"]
-                for field in required_fields:
-                    if field not in content:
-                        issues.append(f"Missing '{field}' in {metainfo}")
-        
-        if metainfo_count == 0:
-            issues.append("No Metainfo.txt files found")
-        
-        if issues:
+        if report["issues"]:
             print("[WARNING] Structure issues found:")
-            for issue in issues:
+            for issue in report["issues"]:
                 print(f"  - {issue}")
             return False
         
-        print(f"[OK] Structure verified: {metainfo_count} QuantLet(s) found")
+        print(f"[OK] Structure verified: {report['quantlets']} QuantLet(s) found "
+              f"({report['cached']} unchanged, {report['seconds'] * 1000:.0f} ms)")
         return True
     
     def full_submission_workflow(self, 
@@ -303,8 +845,10 @@ Thank you for maintaining this valuable educational resource!
             print("\n[ERROR] Failed to create repository")
             return results
         
-        # Wait a moment for GitHub to process
-        time.sleep(2)
+        # Wait until GitHub accepts pushes to the new repository
+        if not self.wait_for_remote(repo_name):
+            print("\n[ERROR] Repository did not become reachable")
+            return results
         
         # Step 3: Push code
         results["pushed"] = self.push_to_github(repo_name)
@@ -331,6 +875,130 @@ Thank you for maintaining this valuable educational resource!
         print("\n[SUCCESS] QuantLet submission process complete!")
         
         return results
+    
+    def submit_quantlet(self, path: Path,
+                        previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Submit one QuantLet directory as its own repository
+        
+        Steps recorded in `previous` (from the batch manifest) are skipped:
+        an existing repo_url skips creation, an unchanged tree hash skips the
+        push and an existing issue_url skips the issue.
+        
+        Args:
+            path: QuantLet directory; its name is used as repository name
+            previous: Manifest entry from an earlier run
+            
+        Returns:
+            Dictionary with submission results
+        """
+        path = Path(path).resolve()
+        previous = previous or {}
+        results = {
+            "name": path.name,
+            "path": str(path),
+            "verified": False,
+            "repo_created": False,
+            "pushed": False,
+            "push_skipped": False,
+            "issue_created": False,
+            "repo_url": previous.get("repo_url"),
+            "issue_url": previous.get("issue_url"),
+            "tree": previous.get("tree"),
+            "error": None,
+        }
+        
+        check = validate_metainfo(path / "Metainfo.txt")
+        results["verified"] = check["valid"]
+        if not check["valid"]:
+            results["error"] = "; ".join(check["errors"] + [f"Missing '{field}'"
+                                                            for field in check["missing"]])
+            return results
+        description = check["fields"]["Description"]
+        
+        if not results["repo_url"]:
+            repo_url = self.create_github_repository(path.name, description)
+            if not repo_url:
+                results["error"] = "repository creation failed"
+                return results
+            if not self.wait_for_remote(path.name):
+                results["error"] = "repository did not become reachable"
+                return results
+            results["repo_url"] = repo_url
+        results["repo_created"] = True
+        
+        push = self._push(path.name, path, previous.get("tree"))
+        results["pushed"] = push["pushed"]
+        results["push_skipped"] = push["skipped"]
+        if not push["pushed"]:
+            results["error"] = "push failed"
+            return results
+        results["tree"] = push["tree"]
+        
+        if not results["issue_url"]:
+            results["issue_url"] = self.create_quantlet_issue(path.name, description)
+        results["issue_created"] = bool(results["issue_url"])
+        if not results["issue_created"]:
+            results["error"] = "issue creation failed"
+        
+        return results
+    
+    def submit_batch(self, paths: List[Path], workers: int = 4,
+                     manifest_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+        """
+        Submit many QuantLet directories with a bounded worker pool
+        
+        Progress is written to a manifest after every finished QuantLet, so
+        re-running the batch only repeats the steps that have not succeeded
+        and skips pushes of unchanged trees.
+        
+        Args:
+            paths: QuantLet directories
+            workers: Number of QuantLets submitted concurrently
+            manifest_path: Manifest file (default: SUBMIT_MANIFEST_FILE in repo_path)
+            
+        Returns:
+            One result dictionary per QuantLet, in the order of paths
+            
+        Raises:
+            OSError: If the manifest cannot be written; QuantLets not yet
+                started are cancelled
+        """
+        manifest_path = Path(manifest_path or self.repo_path / SUBMIT_MANIFEST_FILE)
+        manifest = load_submit_manifest(manifest_path)
+        paths = [Path(path).resolve() for path in paths]
+        results = {}
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.submit_quantlet, path, manifest.get(path.name)): path
+                       for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"name": path.name, "path": str(path), "repo_created": False,
+                              "issue_created": False, "error": str(e)}
+                results[path] = result
+                
+                # Only the main thread touches the manifest
+                if result["repo_created"]:
+                    manifest[path.name] = {
+                        "path": result["path"],
+                        "repo_url": result["repo_url"],
+                        "issue_url": result["issue_url"],
+                        "tree": result["tree"],
+                        "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    }
+                    try:
+                        _write_json_atomic(manifest_path, {"quantlets": manifest})
+                    except OSError:
+                        # Unrecorded submissions would be repeated by the next
+                        # run, so stop before starting any more of them
+                        executor.shutdown(cancel_futures=True)
+                        raise
+        
+        return [results[path] for path in paths]
 
 
 def main():
@@ -359,9 +1027,59 @@ def main():
         help="Path to local repository",
         default="."
     )
+    parser.add_argument(
+        "--verify-only",
+        help="Only validate the QuantLet structure (no token needed)",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--report",
+        help="Write the verification report as JSON to this file",
+        default=None
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        help="Number of threads for reading Metainfo files",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--batch",
+        help="Submit each of these QuantLet directories as its own repository",
+        nargs="+",
+        default=None
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        help="Number of QuantLets submitted concurrently in batch mode",
+        type=int,
+        default=4
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Batch submission manifest (default: .quantlet_submit_manifest.json in --path)",
+        default=None
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Re-check every Metainfo file, ignoring the verification cache",
+        action="store_true"
+    )
     
     args = parser.parse_args()
     
+    if args.verify_only:
+        report = verify_quantlets(Path(args.path), args.workers, not args.no_cache)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        for issue in report["issues"]:
+            print(f"  - {issue}")
+        print(f"{'[OK]' if report['valid'] else '[WARNING]'} {report['quantlets']} QuantLet(s), "
+              f"{report['checked']} checked, {report['cached']} unchanged, "
+              f"{report['seconds'] * 1000:.0f} ms")
+        sys.exit(0 if report["valid"] else 1)
+    
     if not args.token:
         print("\n[ERROR] GitHub token required!")
         print("\nHow to get a token:")
@@ -377,6 +1095,28 @@ def main():
     
     # Create submitter and run workflow
     submitter = QuantLetSubmitter(args.token, args.path)
+    
+    if args.batch:
+        try:
+            batch_results = submitter.submit_batch(args.batch, args.jobs, args.manifest)
+        except OSError as e:
+            print(f"\n[ERROR] Could not write the submission manifest: {e}")
+            print("QuantLets submitted so far are not recorded; check them before re-running")
+            sys.exit(1)
+        print("\n" + "="*60)
+        print("BATCH SUBMISSION SUMMARY")
+        print("="*60)
+        for result in batch_results:
+            if result["issue_created"]:
+                status = "[OK]" + (" (push skipped, unchanged)" if result["push_skipped"] else "")
+            else:
+                status = f"[ERROR] {result['error']}"
+            print(f"{result['name']:<32} {status}")
+        print(f"\nAPI: {submitter.api.stats['requests']} requests, "
+              f"{submitter.api.stats['cache_hits']} served from cache, "
+              f"{submitter.api.stats['rate_limited']} rate-limited")
+        sys.exit(0 if all(result["issue_created"] for result in batch_results) else 1)
+    
     results = submitter.full_submission_workflow(args.repo_name, args.description)
     
     # Exit with appropriate code
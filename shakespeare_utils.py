@@ -3,35 +3,76 @@ Utility functions for Shakespeare text processing and visualization
 BSc-level NLP course - ASE Summer School 2025
 """
 
+from __future__ import annotations
+
 import re
-import requests
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from collections import Counter, defaultdict
-from typing import List, Tuple, Dict
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from itertools import repeat
+from operator import itemgetter
+from typing import List, Tuple, Dict, Iterator, Iterable, Union, Optional, IO
 import pickle
 import os
+import io
+import codecs
+import math
+import json
+import importlib
+import hashlib
+import zlib
+import sys
+import types
+import atexit
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import heapq
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlparse
 
-def download_shakespeare_sonnets() -> str:
+class _LazyModule(types.ModuleType):
     """
-    Download Shakespeare's sonnets from Project Gutenberg.
-    Returns cleaned text suitable for NLP tasks.
+    Placeholder that imports a heavy module on first attribute access.
+    
+    The real module then replaces the placeholder in this module's globals,
+    so only the first access pays anything. Workers that only tokenize never
+    import numpy, plotly or requests.
     """
-    # Check if already downloaded
-    cache_file = "shakespeare_sonnets.txt"
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return f.read()
     
-    # Download from Project Gutenberg
-    url = "https://www.gutenberg.org/files/1041/1041-0.txt"
-    response = requests.get(url)
-    text = response.text
+    def __init__(self, module_name: str, alias: str):
+        super().__init__(module_name)
+        self._lazy_alias = alias
     
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__name__)
+        globals()[self._lazy_alias] = module
+        return getattr(module, attr)
+
+np = _LazyModule('numpy', 'np')
+go = _LazyModule('plotly.graph_objects', 'go')
+px = _LazyModule('plotly.express', 'px')
+requests = _LazyModule('requests', 'requests')
+
+# Chunk size (in characters) used by the streaming readers
+STREAM_CHUNK_SIZE = 1 << 20
+
+GUTENBERG_SONNETS_URL = "https://www.gutenberg.org/files/1041/1041-0.txt"
+
+def clean_gutenberg_text(text: str) -> str:
+    """
+    Strip the Project Gutenberg header/footer, blank lines and sonnet numbers.
+    
+    Args:
+        text: Raw Gutenberg text
+    
+    Returns:
+        Lowercased text
+    """
     # Extract just the sonnets (remove header and footer)
-    start_marker = "THE SONNETS"
-    end_marker = "End of the Project Gutenberg"
+    start_marker = GUTENBERG_START_MARKER
+    end_marker = GUTENBERG_END_MARKER
     
     start_idx = text.find(start_marker)
     end_idx = text.find(end_marker)
@@ -46,12 +87,314 @@ def download_shakespeare_sonnets() -> str:
     sonnets = re.sub(r'^\s*\d+\s*$', '', sonnets, flags=re.MULTILINE)  # Remove sonnet numbers
     sonnets = sonnets.lower()  # Lowercase
     
-    # Cache for future use
-    with open(cache_file, 'w', encoding='utf-8') as f:
-        f.write(sonnets)
-    
     return sonnets
 
+# Markers delimiting the text inside a Project Gutenberg file
+GUTENBERG_START_MARKER = "THE SONNETS"
+GUTENBERG_END_MARKER = "End of the Project Gutenberg"
+
+def _iter_raw_lines(stream: IO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[str, bool]]:
+    """
+    Split a text stream on '\\n' only, yielding (line, ends_with_newline).
+    
+    The last line is always yielded (possibly empty) with False, so the
+    lines joined with '\\n' give back the exact stream contents.
+    """
+    carry = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parts = (carry + chunk).split('\n')
+        carry = parts.pop()
+        for part in parts:
+            yield part, True
+    yield carry, False
+
+def _find_gutenberg_markers(stream: IO, chunk_size: int) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """(line, column) of the first start and end markers, or None if missing."""
+    start = end = None
+    for i, (line, _) in enumerate(_iter_raw_lines(stream, chunk_size)):
+        if start is None and GUTENBERG_START_MARKER in line:
+            start = (i, line.find(GUTENBERG_START_MARKER))
+        if end is None and GUTENBERG_END_MARKER in line:
+            end = (i, line.find(GUTENBERG_END_MARKER))
+        if start is not None and end is not None:
+            break
+    return start, end
+
+def _iter_region_lines(stream: IO, start, end, chunk_size: int) -> Iterator[Tuple[str, bool]]:
+    """Lines of text[start:end] (the whole stream if a marker is missing)."""
+    lines = _iter_raw_lines(stream, chunk_size)
+    if start is None or end is None:
+        yield from lines
+        return
+    if end < start:
+        return
+    for i, (line, newline) in enumerate(lines):
+        if i < start[0]:
+            continue
+        first = start[1] if i == start[0] else 0
+        if i == end[0]:
+            yield line[first:end[1]], False
+            return
+        yield line[first:], newline
+
+def _is_number_line(line: str) -> bool:
+    stripped = line.strip()
+    return stripped != '' and stripped.isdecimal()
+
+def _is_blank_line(line: str) -> bool:
+    return line == '' or line.isspace()
+
+def iter_clean_gutenberg(source: Union[str, os.PathLike, IO],
+                         chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Line-by-line version of clean_gutenberg_text() with identical output.
+    
+    One cheap scan locates the header/footer markers (a binary or
+    non-seekable stream is spooled to a temporary file first); a single cleaning pass then drops
+    blank and number-only lines and lowercases, holding at most two lines
+    in memory.
+    
+    Args:
+        source: Path to a UTF-8 text file, or an open text/binary file object
+        chunk_size: Number of characters to read at a time
+    
+    Returns:
+        Iterator over cleaned lines (including their trailing newline)
+    """
+    owned = isinstance(source, (str, os.PathLike))
+    stream = open(source, 'r', encoding='utf-8') if owned else source
+    spool = None
+    try:
+        if not isinstance(stream, io.TextIOBase) or not stream.seekable():
+            # Binary objects are decoded into the spool, never wrapped
+            spool = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+            for block in _iter_text_blocks(stream, chunk_size):
+                spool.write(block)
+            spool.seek(0)
+        text_stream = spool or stream
+        origin = text_stream.tell()
+        start, end = _find_gutenberg_markers(text_stream, chunk_size)
+        text_stream.seek(origin)
+        
+        # Drop whitespace-only lines between two newlines (the blank-line regex)
+        def kept_lines():
+            for i, (line, newline) in enumerate(_iter_region_lines(text_stream, start,
+                                                                   end, chunk_size)):
+                if i > 0 and newline and _is_blank_line(line):
+                    continue
+                yield line, newline
+        
+        # Blank out number-only lines (the sonnet-number regex); a blank first
+        # line or blank last line next to a number line is swallowed with it
+        lines = kept_lines()
+        current = next(lines, None)
+        first = True
+        while current is not None:
+            line, newline = current
+            following = next(lines, None)
+            if (first and following is not None and _is_blank_line(line)
+                    and _is_number_line(following[0])):
+                line, newline = '', False
+            elif _is_number_line(line):
+                if (newline and following is not None and not following[1]
+                        and _is_blank_line(following[0])):
+                    return
+                line = ''
+            if line or newline:
+                yield line.lower() + ('\n' if newline else '')
+            current = following
+            first = False
+    finally:
+        if spool is not None:
+            spool.close()
+        if owned:
+            stream.close()
+
+def _temp_path(filename: str) -> str:
+    """New empty file next to `filename`, unique across threads and processes."""
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(filename) or '.',
+                                    prefix=os.path.basename(filename) + '.', suffix='.tmp')
+    os.close(fd)
+    return tmp_file
+
+def clean_gutenberg_file(source: Union[str, os.PathLike, IO], filename: str,
+                         chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Clean a Gutenberg text file into `filename` without loading it into memory.
+    
+    Args:
+        source: Path to the raw text or an open text file object
+        filename: Output file, replaced atomically
+        chunk_size: Number of characters to read at a time
+    
+    Returns:
+        Number of characters written
+    """
+    written = 0
+    tmp_file = _temp_path(filename)
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for line in iter_clean_gutenberg(source, chunk_size):
+                written += f.write(line)
+        os.replace(tmp_file, filename)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return written
+
+def download_shakespeare_sonnets(cache_file: str = "shakespeare_sonnets.txt",
+                                 url: str = GUTENBERG_SONNETS_URL) -> str:
+    """
+    Download Shakespeare's sonnets from Project Gutenberg.
+    Returns cleaned text suitable for NLP tasks.
+    
+    Args:
+        cache_file: Where the cleaned text is cached
+        url: Source text (any Gutenberg-style URL or local path)
+    """
+    # Check if already downloaded
+    if not os.path.exists(cache_file):
+        cache_dir = os.path.dirname(cache_file) or '.'
+        result = ingest_corpora([url], cache_dir=cache_dir,
+                                filenames=[os.path.basename(cache_file)])[0]
+        if result['error']:
+            raise RuntimeError(f"Could not download {url}: {result['error']}")
+    
+    with open(cache_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# HTTP status codes worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def corpus_cache_name(source: str) -> str:
+    """Cache filename for a source URL or path: readable stem plus a short hash."""
+    stem = os.path.splitext(os.path.basename(urlparse(source).path))[0] or 'corpus'
+    return f"{stem}-{hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]}.txt"
+
+def _fetch_raw(session, source: str, filename: str, timeout: float,
+               retries: int, backoff: float) -> int:
+    """Stream a URL (or copy a local file) to `filename`; returns attempts used."""
+    if not urlparse(source).scheme.startswith('http'):
+        with open(source, 'rb') as src, open(filename, 'wb') as dst:
+            while True:
+                block = src.read(STREAM_CHUNK_SIZE)
+                if not block:
+                    break
+                dst.write(block)
+        return 1
+    
+    for attempt in range(retries + 1):
+        try:
+            with session.get(source, stream=True, timeout=timeout) as response:
+                if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                    raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                response.raise_for_status()
+                with open(filename, 'wb') as f:
+                    for block in response.iter_content(chunk_size=1 << 16):
+                        f.write(block)
+            return attempt + 1
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = getattr(e.response, 'status_code', None)
+            retryable = status is None or status in RETRY_STATUS_CODES
+            if attempt >= retries or not retryable:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def _ingest_one(session, source: str, filename: str, clean, timeout: float,
+                retries: int, backoff: float) -> Dict:
+    """Fetch, clean and cache one source; never raises."""
+    result = {'source': source, 'path': filename, 'cached': False,
+              'attempts': 0, 'error': None}
+    if os.path.exists(filename):
+        result['cached'] = True
+        return result
+    
+    cache_dir = os.path.dirname(filename) or '.'
+    fd, raw_file = tempfile.mkstemp(dir=cache_dir, suffix='.raw')
+    os.close(fd)
+    tmp_file = _temp_path(filename)
+    try:
+        result['attempts'] = _fetch_raw(session, source, raw_file, timeout, retries, backoff)
+        if clean is True:
+            with open(raw_file, 'r', encoding='utf-8', errors='replace') as f:
+                clean_gutenberg_file(f, tmp_file)
+        else:
+            with open(raw_file, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(clean(text) if clean else text)
+        os.replace(tmp_file, filename)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        for leftover in (raw_file, tmp_file):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return result
+
+def ingest_corpora(sources: List[str], cache_dir: str = '.',
+                   filenames: Optional[List[str]] = None,
+                   clean=True, max_workers: int = 8,
+                   timeout: float = 30.0, retries: int = 3, backoff: float = 0.5,
+                   session: Optional['requests.Session'] = None) -> List[Dict]:
+    """
+    Download and clean many Gutenberg-style texts concurrently.
+    
+    Sources are fetched by a bounded thread pool over one pooled
+    requests.Session, with streamed bodies, a timeout and exponential
+    backoff on connection errors and 429/5xx responses. Each cleaned text is
+    written atomically to the same kind of text cache that
+    download_shakespeare_sonnets() reads, and sources already cached are
+    skipped.
+    
+    Args:
+        sources: URLs or local file paths
+        cache_dir: Directory for the cleaned texts
+        filenames: Cache filenames per source (defaults to corpus_cache_name)
+        clean: True for the streaming Gutenberg cleaner (iter_clean_gutenberg),
+            a function applied to each whole raw text, or None to keep it as is
+        max_workers: Maximum number of parallel downloads
+        timeout: Per-request timeout in seconds
+        retries: Retries per source after the first attempt
+        backoff: Initial backoff in seconds, doubled after each retry
+        session: Session to reuse (a pooled one is created otherwise)
+    
+    Returns:
+        One dict per source, in input order, with keys 'source', 'path',
+        'cached', 'attempts' and 'error'
+    """
+    if filenames is None:
+        filenames = [corpus_cache_name(source) for source in sources]
+    if len(filenames) != len(sources):
+        raise ValueError("filenames must match sources one to one")
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers,
+                                                pool_maxsize=max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # A source listed twice is fetched once and reported for each entry
+            jobs = [(source, os.path.join(cache_dir, name))
+                    for source, name in zip(sources, filenames)]
+            futures = {}
+            for source, filename in jobs:
+                if (source, filename) not in futures:
+                    futures[source, filename] = pool.submit(
+                        _ingest_one, session, source, filename, clean,
+                        timeout, retries, backoff)
+            return [dict(futures[job].result()) for job in jobs]
+    finally:
+        if own_session:
+            session.close()
+
 def tokenize(text: str, keep_punctuation: bool = False) -> List[str]:
     """
     Simple tokenization for educational purposes.
@@ -72,48 +415,2197 @@ def tokenize(text: str, keep_punctuation: bool = False) -> List[str]:
     
     return tokens
 
-def create_vocabulary(tokens: List[str], min_freq: int = 2) -> Dict[str, int]:
+def _iter_text_blocks(source: Union[str, os.PathLike, IO],
+                      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the decoded text of a path or file object in blocks.
+    
+    Binary objects (open(..., 'rb'), BytesIO, mmap) are decoded chunk by
+    chunk with an incremental UTF-8 decoder rather than wrapped in a
+    TextIOWrapper, which would close the caller's file when collected (and
+    does not accept mmap). Newlines are translated as in text mode. Only a
+    file opened here from a path is closed.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8') as f:
+            yield from iter(lambda: f.read(chunk_size), '')
+        return
+    if isinstance(source, io.TextIOBase):
+        yield from iter(lambda: source.read(chunk_size), '')
+        return
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(),
+                                           translate=True)
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def iter_tokens(source: Union[str, os.PathLike, IO],
+                keep_punctuation: bool = False,
+                batch_size: Optional[int] = None,
+                chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator:
+    """
+    Streaming version of tokenize() for corpora that do not fit in memory.
+    
+    The input is read in chunks of `chunk_size` characters, so memory use
+    stays flat regardless of the file size. A word that straddles two chunks
+    is carried over to the next chunk, which makes the output identical to
+    tokenize(text, keep_punctuation) on the whole text.
+    
+    Args:
+        source: Path to a UTF-8 text file, or an open text/binary file object
+        keep_punctuation: Whether to keep punctuation as separate tokens
+        batch_size: If given, yield lists of up to this many tokens instead
+            of single tokens
+        chunk_size: Number of characters to read at a time
+    
+    Returns:
+        Iterator over tokens (or over lists of tokens if batch_size is set)
+    """
+    if batch_size is not None and batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    
+    pattern = re.compile(r'\w+|[.!?,;]' if keep_punctuation else r'\b\w+\b')
+    word_char = re.compile(r'\w')
+    
+    blocks = _iter_text_blocks(source, chunk_size)
+    try:
+        batch = []
+        carry = ''
+        for chunk in blocks:
+            chunk = carry + chunk.lower()
+            
+            # Hold back a trailing partial word until the next chunk arrives
+            cut = len(chunk)
+            while cut > 0 and word_char.match(chunk, cut - 1):
+                cut -= 1
+            carry = chunk[cut:]
+            chunk = chunk[:cut]
+            
+            tokens = pattern.findall(chunk)
+            if batch_size is None:
+                yield from tokens
+                continue
+            batch.extend(tokens)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        
+        if carry:
+            if batch_size is None:
+                yield carry
+            else:
+                batch.append(carry)
+        if batch_size is not None and batch:
+            yield batch
+    finally:
+        blocks.close()
+
+def top_indices(counts, k: int) -> np.ndarray:
+    """
+    Indices of the k largest counts, largest first, ties by lower index.
+    
+    Uses a partial selection (np.partition) instead of sorting everything,
+    and matches the order Counter.most_common() gives for the same counts.
+    """
+    counts = np.asarray(counts).astype(np.int64, copy=False)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= len(counts):
+        return np.argsort(-counts, kind='stable')
+    kth = np.partition(counts, len(counts) - k)[len(counts) - k]
+    above = np.flatnonzero(counts > kth)
+    ties = np.flatnonzero(counts == kth)[:k - len(above)]
+    top = np.concatenate([above, ties])
+    return top[np.argsort(-counts[top], kind='stable')]
+
+# Reserved tokens, in id order
+SPECIAL_TOKENS = ['<PAD>', '<UNK>', '<START>', '<END>']
+PAD_ID, UNK_ID, START_ID, END_ID = range(len(SPECIAL_TOKENS))
+
+class Vocabulary(Mapping):
+    """
+    Word-to-index mapping with bulk NumPy encoding and decoding.
+    
+    Behaves like the plain dict create_vocabulary() used to return
+    (vocab['the'], len(vocab), vocab.items(), ...), but also keeps the
+    reverse mapping as an array so whole corpora can be encoded and decoded
+    in one call. Ids are stored with the smallest unsigned dtype that fits.
+    """
+    
+    def __init__(self, words: Iterable[str] = ()):
+        """
+        Args:
+            words: Regular words in id order; special tokens are prepended
+        """
+        self._index = {}
+        self._words = []
+        for word in list(SPECIAL_TOKENS) + list(words):
+            if word not in self._index:
+                self._index[word] = len(self._words)
+                self._words.append(word)
+        self._words_array = np.array(self._words, dtype=object)
+    
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[str], min_freq: int = 2,
+                    max_size: Optional[int] = None) -> 'Vocabulary':
+        """Build a vocabulary from tokens, most frequent words first."""
+        return cls.from_counts(Counter(tokens), min_freq, max_size)
+    
+    @classmethod
+    def from_counts(cls, freq: Mapping, min_freq: int = 2,
+                    max_size: Optional[int] = None) -> 'Vocabulary':
+        """
+        Build a vocabulary from precomputed word counts.
+        
+        Words below min_freq are dropped with one vectorized threshold pass
+        and max_size is applied with a partial selection, so only the kept
+        words are ever sorted. The order matches Counter.most_common().
+        
+        Args:
+            freq: Mapping of word -> count (insertion order breaks ties)
+            min_freq: Minimum frequency to include a word
+            max_size: Maximum number of regular (non-special) words
+        """
+        words = list(freq)
+        counts = np.fromiter(freq.values(), dtype=np.int64, count=len(words))
+        kept = np.flatnonzero(counts >= min_freq)
+        if max_size is not None and max_size < len(kept):
+            order = kept[top_indices(counts[kept], max_size)]
+        else:
+            order = kept[np.argsort(-counts[kept], kind='stable')]
+        return cls([words[i] for i in order])
+    
+    def __getitem__(self, word: str) -> int:
+        return self._index[word]
+    
+    def __iter__(self):
+        return iter(self._words)
+    
+    def __len__(self) -> int:
+        return len(self._words)
+    
+    def __contains__(self, word) -> bool:
+        return word in self._index
+    
+    def __repr__(self) -> str:
+        return f"Vocabulary(size={len(self)}, dtype={self.dtype.name})"
+    
+    @property
+    def dtype(self) -> np.dtype:
+        """Smallest unsigned integer dtype that can hold every id."""
+        return np.dtype(np.uint16 if len(self._words) <= 1 << 16 else np.uint32)
+    
+    @property
+    def words(self) -> List[str]:
+        """Words in id order, including special tokens."""
+        return list(self._words)
+    
+    def encode(self, tokens: Iterable[str]) -> np.ndarray:
+        """
+        Convert tokens to an id array; unknown words map to <UNK>.
+        
+        Args:
+            tokens: Sequence or iterable of tokens
+        
+        Returns:
+            1-D array of ids with dtype self.dtype
+        """
+        count = len(tokens) if hasattr(tokens, '__len__') else -1
+        ids = map(self._index.get, tokens, repeat(UNK_ID))
+        return np.fromiter(ids, dtype=self.dtype, count=count)
+    
+    def decode(self, ids) -> List[str]:
+        """Convert an array (or list) of ids back to tokens."""
+        return self._words_array[np.asarray(ids, dtype=np.int64)].tolist()
+    
+    def encode_file(self, source: Union[str, os.PathLike, IO], filename: str,
+                    keep_punctuation: bool = False,
+                    batch_size: int = 1 << 16) -> np.ndarray:
+        """
+        Encode a text file straight into a .npy file without holding it in memory.
+        
+        The file is tokenized twice with iter_tokens(): once to count tokens
+        so the .npy file can be allocated, once to fill it.
+        
+        Args:
+            source: Path to a UTF-8 text file
+            filename: Output .npy file
+            keep_punctuation: Passed on to iter_tokens()
+            batch_size: Number of tokens encoded per step
+        
+        Returns:
+            Read-only memmap of the encoded corpus
+        """
+        n_tokens = sum(len(batch) for batch in
+                       iter_tokens(source, keep_punctuation, batch_size=batch_size))
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=self.dtype,
+                                        shape=(n_tokens,))
+        pos = 0
+        for batch in iter_tokens(source, keep_punctuation, batch_size=batch_size):
+            out[pos:pos + len(batch)] = self.encode(batch)
+            pos += len(batch)
+        out.flush()
+        del out
+        return load_encoded(filename)
+
+class CountMinSketch:
+    """
+    Fixed-size frequency estimator for token streams.
+    
+    Counts never underestimate and overestimate by at most about
+    2 * total / width with high probability; memory is depth * width
+    counters regardless of how many distinct tokens are seen.
+    """
+    
+    def __init__(self, width: int = 1 << 20, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+    
+    def _rows(self, tokens: List[str]) -> np.ndarray:
+        """(depth, len(tokens)) bucket indices, one hash seed per row."""
+        data = [token.encode('utf-8') for token in tokens]
+        return np.stack([np.fromiter(map(zlib.crc32, data, repeat(seed + 1)),
+                                     dtype=np.int64, count=len(data)) % self.width
+                         for seed in range(self.depth)])
+    
+    def add(self, tokens: List[str], counts=None) -> 'CountMinSketch':
+        """
+        Count a batch of tokens.
+        
+        Args:
+            tokens: Tokens to count
+            counts: Optional number of occurrences of each token, so
+                precomputed counts are added without repeating tokens
+        """
+        tokens = list(tokens)
+        if counts is not None:
+            counts = np.asarray(counts, dtype=np.int64)
+            if counts.shape != (len(tokens),):
+                raise ValueError("counts must have one entry per token")
+            if (counts < 0).any():
+                raise ValueError("counts must be non-negative")
+        if tokens:
+            for row, idx in enumerate(self._rows(tokens)):
+                # Float weights are exact for any count below 2**53
+                self.table[row] += np.bincount(idx, weights=counts,
+                                               minlength=self.width).astype(np.uint32)
+        return self
+    
+    def estimate(self, tokens: List[str]) -> np.ndarray:
+        """Estimated count of each token."""
+        tokens = list(tokens)
+        if not tokens:
+            return np.zeros(0, dtype=np.int64)
+        rows = self._rows(tokens)
+        return self.table[np.arange(self.depth)[:, None], rows].min(axis=0).astype(np.int64)
+
+class HashingVocabulary:
+    """
+    Fixed-size vocabulary using the hashing trick.
+    
+    Every word maps to one of num_buckets ids after the reserved special
+    tokens (0-3) with a stable CRC32 hash, so memory does not grow with the
+    corpus. With min_freq > 1 a CountMinSketch filters rare words to <UNK>.
+    Ids cannot be decoded back to words.
+    """
+    
+    def __init__(self, num_buckets: int, min_freq: int = 1,
+                 sketch: Optional[CountMinSketch] = None):
+        """
+        Args:
+            num_buckets: Number of hash buckets for regular words
+            min_freq: Words with a (sketched) count below this map to <UNK>
+            sketch: Frequency sketch, required when min_freq > 1
+        """
+        if min_freq > 1 and sketch is None:
+            raise ValueError("min_freq > 1 needs a CountMinSketch")
+        self.num_buckets = num_buckets
+        self.min_freq = min_freq
+        self.sketch = sketch
+    
+    @classmethod
+    def from_tokens(cls, tokens: Iterable, num_buckets: int, min_freq: int = 1,
+                    sketch_width: int = 1 << 20, sketch_depth: int = 4) -> 'HashingVocabulary':
+        """
+        Build a hashing vocabulary, sketching frequencies if min_freq > 1.
+        
+        Args:
+            tokens: Tokens, or an iterable of token batches (e.g.
+                iter_tokens(path, batch_size=...)) for bounded memory
+            num_buckets: Number of hash buckets
+            min_freq: Minimum (estimated) frequency of a regular word
+            sketch_width: Counters per sketch row
+            sketch_depth: Number of sketch rows
+        """
+        sketch = None
+        if min_freq > 1:
+            sketch = CountMinSketch(sketch_width, sketch_depth)
+            batch = []
+            for item in tokens:
+                if isinstance(item, str):
+                    batch.append(item)
+                    if len(batch) >= 1 << 16:
+                        sketch.add(batch)
+                        batch = []
+                else:
+                    sketch.add(item)
+            sketch.add(batch)
+        return cls(num_buckets, min_freq, sketch)
+    
+    @classmethod
+    def from_counts(cls, freq: Mapping, num_buckets: int, min_freq: int = 1,
+                    sketch_width: int = 1 << 20,
+                    sketch_depth: int = 4) -> 'HashingVocabulary':
+        """
+        Build a hashing vocabulary from precomputed word counts.
+        
+        Each distinct word is hashed once and added to the sketch with its
+        count as a weight, instead of being repeated count times.
+        
+        Args:
+            freq: Mapping of word -> count
+            num_buckets: Number of hash buckets
+            min_freq: Minimum (estimated) frequency of a regular word
+            sketch_width: Counters per sketch row
+            sketch_depth: Number of sketch rows
+        """
+        sketch = None
+        if min_freq > 1:
+            sketch = CountMinSketch(sketch_width, sketch_depth)
+            words = list(freq)
+            counts = np.fromiter(freq.values(), dtype=np.int64, count=len(words))
+            # Like Counter.elements(), non-positive counts add nothing
+            counts = np.maximum(counts, 0)
+            for start in range(0, len(words), 1 << 16):
+                sketch.add(words[start:start + (1 << 16)], counts[start:start + (1 << 16)])
+        return cls(num_buckets, min_freq, sketch)
+    
+    def __len__(self) -> int:
+        return len(SPECIAL_TOKENS) + self.num_buckets
+    
+    def __getitem__(self, word: str) -> int:
+        return int(self.encode([word])[0])
+    
+    def __repr__(self) -> str:
+        return f"HashingVocabulary(buckets={self.num_buckets}, min_freq={self.min_freq})"
+    
+    @property
+    def dtype(self) -> np.dtype:
+        """Smallest unsigned integer dtype that can hold every id."""
+        return np.dtype(np.uint16 if len(self) <= 1 << 16 else np.uint32)
+    
+    def encode(self, tokens: Iterable[str]) -> np.ndarray:
+        """Convert tokens to bucket ids; special tokens keep ids 0-3."""
+        tokens = list(tokens)
+        data = [token.encode('utf-8') for token in tokens]
+        hashes = np.fromiter(map(zlib.crc32, data), dtype=np.int64, count=len(data))
+        ids = len(SPECIAL_TOKENS) + hashes % self.num_buckets
+        if self.min_freq > 1:
+            ids[self.sketch.estimate(tokens) < self.min_freq] = UNK_ID
+        special_ids = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+        special = np.fromiter(map(special_ids.get, tokens, repeat(-1)),
+                              dtype=np.int64, count=len(tokens))
+        return np.where(special >= 0, special, ids).astype(self.dtype)
+
+def save_encoded(ids, filename: str):
+    """Save an encoded corpus as a .npy file that can be memory-mapped."""
+    np.save(filename, np.asarray(ids))
+
+def load_encoded(filename: str) -> np.ndarray:
+    """Memory-map an encoded corpus saved with save_encoded()."""
+    return np.load(filename, mmap_mode='r')
+
+class CorpusStats:
+    """
+    Unigram and bigram counts that can be updated as text arrives.
+    
+    add_text()/add_tokens() cost time proportional to the new text, stats
+    from separate chunks can be merged, and remove() subtracts old text for
+    sliding-window corpora. create_vocabulary(), plot_word_frequencies() and
+    plot_bigram_heatmap() accept a CorpusStats in place of a token list.
+    
+    Tokens added in several calls are treated as one continuous stream, so
+    the bigram spanning two calls is counted; pass new_document=True to
+    start an unrelated text.
+    """
+    
+    def __init__(self, keep_punctuation: bool = False):
+        """
+        Args:
+            keep_punctuation: Tokenizer setting used by add_text()
+        """
+        self.keep_punctuation = keep_punctuation
+        self.unigrams = Counter()
+        self.bigrams = Counter()
+        self.first_token = None
+        self.last_token = None
+    
+    @classmethod
+    def from_tokens(cls, tokens: List[str], keep_punctuation: bool = False) -> 'CorpusStats':
+        """Build stats for a token list in one go."""
+        return cls(keep_punctuation).add_tokens(tokens)
+    
+    @property
+    def total_tokens(self) -> int:
+        """Number of tokens currently counted."""
+        return sum(self.unigrams.values())
+    
+    def add_text(self, text: str, new_document: bool = False) -> 'CorpusStats':
+        """Tokenize `text` and add it to the counts."""
+        return self.add_tokens(tokenize(text, self.keep_punctuation), new_document)
+    
+    def add_tokens(self, tokens: List[str], new_document: bool = False) -> 'CorpusStats':
+        """
+        Add tokens to the counts.
+        
+        Args:
+            tokens: Tokens that follow the ones already added
+            new_document: Do not count a bigram from the previous last token
+        
+        Returns:
+            self
+        """
+        tokens = list(tokens)
+        if not tokens:
+            return self
+        self.unigrams.update(tokens)
+        self.bigrams.update(zip(tokens, tokens[1:]))
+        if self.last_token is not None and not new_document:
+            self.bigrams[(self.last_token, tokens[0])] += 1
+        if self.first_token is None:
+            self.first_token = tokens[0]
+        self.last_token = tokens[-1]
+        return self
+    
+    def merge(self, other: 'CorpusStats', contiguous: bool = True) -> 'CorpusStats':
+        """
+        Add the counts of another CorpusStats (e.g. from a separate worker).
+        
+        Args:
+            other: Stats of text that comes after this one
+            contiguous: Count the bigram joining this text's last token to
+                other's first token, as if the tokens were added in one call
+        
+        Returns:
+            self
+        """
+        self.unigrams.update(other.unigrams)
+        self.bigrams.update(other.bigrams)
+        if contiguous and self.last_token is not None and other.first_token is not None:
+            self.bigrams[(self.last_token, other.first_token)] += 1
+        if self.first_token is None:
+            self.first_token = other.first_token
+        if other.last_token is not None:
+            self.last_token = other.last_token
+        return self
+    
+    def remove(self, data, following: Optional[str] = None) -> 'CorpusStats':
+        """
+        Subtract old text, e.g. the oldest chunk of a sliding window.
+        
+        Args:
+            data: Tokens or a CorpusStats previously added
+            following: First token still in the window after the removed
+                text; the bigram joining the two is removed as well and it
+                becomes the new first token. Required unless the removed
+                text is everything that was counted.
+        
+        Returns:
+            self
+        
+        Raises:
+            ValueError: If `following` is missing while tokens remain, or
+                `data` holds more of a token or bigram than was counted
+        """
+        if isinstance(data, CorpusStats):
+            unigrams, bigrams = data.unigrams, data.bigrams
+            last = data.last_token
+        else:
+            data = list(data)
+            unigrams, bigrams = Counter(data), Counter(zip(data, data[1:]))
+            last = data[-1] if data else None
+        if following is None and unigrams and sum(unigrams.values()) < self.total_tokens:
+            raise ValueError("following is required when removing part of the counted text")
+        if following is not None and last is not None:
+            bigrams = bigrams + Counter({(last, following): 1})
+        
+        for counter, removed in ((self.unigrams, unigrams), (self.bigrams, bigrams)):
+            for key, count in removed.items():
+                remaining = counter.get(key, 0) - count
+                if remaining < 0:
+                    raise ValueError(f"cannot remove {key!r}: it was not counted that often")
+                if remaining == 0:
+                    del counter[key]
+                else:
+                    counter[key] = remaining
+        if following is not None:
+            self.first_token = following
+        if not self.unigrams:
+            self.first_token = self.last_token = None
+        return self
+    
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Most frequent words, in Counter.most_common() order."""
+        return self.unigrams.most_common(n)
+    
+    def bigram_matrix(self, words: List[str]) -> np.ndarray:
+        """Bigram counts between `words`: entry [i, j] counts words[i] -> words[j]."""
+        k = len(words)
+        matrix = np.zeros((k, k), dtype=np.int64)
+        position = {word: i for i, word in enumerate(words)}
+        if k * k <= len(self.bigrams):
+            for i, first in enumerate(words):
+                for j, second in enumerate(words):
+                    matrix[i, j] = self.bigrams.get((first, second), 0)
+        else:
+            for (first, second), count in self.bigrams.items():
+                if first in position and second in position:
+                    matrix[position[first], position[second]] = count
+        return matrix
+    
+    def __repr__(self) -> str:
+        return (f"CorpusStats(tokens={self.total_tokens}, types={len(self.unigrams)}, "
+                f"bigrams={len(self.bigrams)})")
+
+def create_vocabulary(tokens: List[str], min_freq: int = 2,
+                      max_size: Optional[int] = None,
+                      num_buckets: Optional[int] = None):
     """
     Create vocabulary with word-to-index mapping.
     
     Args:
-        tokens: List of tokens
+        tokens: List of tokens, or a CorpusStats holding their counts
         min_freq: Minimum frequency to include in vocabulary
+        max_size: Keep at most this many regular words (most frequent first)
+        num_buckets: Build a fixed-size HashingVocabulary with this many
+            buckets instead of storing every word
     
     Returns:
-        Dictionary mapping words to indices
+        Vocabulary mapping words to indices (usable like a dict), or a
+        HashingVocabulary if num_buckets is given
     """
-    freq = Counter(tokens)
+    if num_buckets is not None:
+        if isinstance(tokens, CorpusStats):
+            return HashingVocabulary.from_counts(tokens.unigrams, num_buckets, min_freq)
+        return HashingVocabulary.from_tokens(tokens, num_buckets, min_freq)
+    if isinstance(tokens, CorpusStats):
+        return Vocabulary.from_counts(tokens.unigrams, min_freq, max_size)
+    return Vocabulary.from_tokens(tokens, min_freq, max_size)
+
+def shard_file(filename: str, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into byte ranges that start and end on line boundaries.
     
-    # Special tokens
-    vocab = {'<PAD>': 0, '<UNK>': 1, '<START>': 2, '<END>': 3}
+    Args:
+        filename: Text file to split
+        num_shards: Desired number of shards (fewer are returned for small files)
+    
+    Returns:
+        List of (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, max(1, num_shards)):
+            target = max(size * i // num_shards, bounds[-1])
+            f.seek(target)
+            f.readline()
+            pos = min(f.tell(), size)
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    if bounds[-1] != size:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _count_shard(args) -> Tuple[bytes, np.ndarray]:
+    """
+    Worker: token counts of one byte range.
+    
+    Words are returned newline-joined in first-occurrence order with an
+    int64 count array, which pickles far more compactly than a Counter.
+    """
+    filename, start, end, keep_punctuation = args
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    freq = Counter()
+    for batch in iter_tokens(io.BytesIO(data), keep_punctuation, batch_size=1 << 16):
+        freq.update(batch)
+    words = '\n'.join(freq).encode('utf-8')
+    return words, np.fromiter(freq.values(), dtype=np.int64, count=len(freq))
+
+def parallel_count_tokens(filename: str, keep_punctuation: bool = False,
+                          workers: Optional[int] = None,
+                          shards_per_worker: int = 4) -> Counter:
+    """
+    Count the tokens of a large file with a process pool.
+    
+    The file is split on line boundaries, each shard is tokenized and
+    counted in a worker, and the compact partial counts are merged in shard
+    order. The result equals Counter(tokenize(text, keep_punctuation)),
+    including the insertion order that most_common() uses to break ties.
+    
+    Args:
+        filename: UTF-8 text file
+        keep_punctuation: Whether to keep punctuation as separate tokens
+        workers: Number of processes (defaults to os.cpu_count())
+        shards_per_worker: Shards per process, for load balancing
+    
+    Returns:
+        Counter of token frequencies
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shard_file(filename, workers * shards_per_worker)
+    jobs = [(filename, start, end, keep_punctuation) for start, end in shards]
+    
+    if workers == 1 or len(jobs) <= 1:
+        partials = map(_count_shard, jobs)
+        return _merge_shard_counts(partials)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _merge_shard_counts(pool.map(_count_shard, jobs))
+
+def _merge_shard_counts(partials: Iterable[Tuple[bytes, np.ndarray]]) -> Counter:
+    """Merge per-shard (words, counts) in shard order into one Counter."""
+    index = {}
+    totals = np.zeros(0, dtype=np.int64)
+    for words, counts in partials:
+        if not len(counts):
+            continue
+        ids = np.fromiter((index.setdefault(word, len(index))
+                           for word in words.decode('utf-8').split('\n')),
+                          dtype=np.int64, count=len(counts))
+        if len(index) > len(totals):
+            totals = np.concatenate([totals, np.zeros(len(index) - len(totals), dtype=np.int64)])
+        # Each word appears once per shard, so plain fancy-index addition is safe
+        totals[ids] += counts
+    return Counter(dict(zip(index, totals.tolist())))
+
+def parallel_create_vocabulary(filename: str, min_freq: int = 2,
+                               keep_punctuation: bool = False,
+                               workers: Optional[int] = None) -> Vocabulary:
+    """create_vocabulary() for a large file, counted with parallel_count_tokens()."""
+    freq = parallel_count_tokens(filename, keep_punctuation, workers)
+    return Vocabulary.from_counts(freq, min_freq)
+
+# Marks the last symbol of a word in BPE vocabularies
+END_OF_WORD = '</w>'
+
+class BPETokenizer:
+    """
+    Byte-pair-encoding subword tokenizer trained on word frequencies.
     
-    # Add words above minimum frequency
-    idx = len(vocab)
-    for word, count in freq.most_common():
-        if count >= min_freq:
-            vocab[word] = idx
-            idx += 1
+    Words come from tokenize(), so a BPE model sits on top of the usual
+    word-level pipeline. Subword ids live in a Vocabulary with the reserved
+    special tokens first; characters never seen in training map to <UNK>.
+    Encoded words are kept in a small LRU cache since natural text repeats
+    the same words constantly.
+    """
+    
+    def __init__(self, merges: List[Tuple[str, str]], vocab: Vocabulary,
+                 keep_punctuation: bool = False, cache_size: int = 100000):
+        """
+        Args:
+            merges: Learned merges, in the order they were learned
+            vocab: Vocabulary of all base and merged symbols
+            keep_punctuation: Tokenizer setting used by encode()
+            cache_size: Number of encoded words kept in the LRU cache
+        """
+        self.merges = list(merges)
+        self.vocab = vocab
+        self.keep_punctuation = keep_punctuation
+        self.cache_size = cache_size
+        self.ranks = {(vocab[a], vocab[b]): (rank, vocab[a + b])
+                      for rank, (a, b) in enumerate(self.merges)}
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    @staticmethod
+    def _word_symbols(word: str) -> List[str]:
+        return list(word[:-1]) + [word[-1] + END_OF_WORD]
+    
+    @classmethod
+    def train(cls, data, num_merges: int, min_frequency: int = 2,
+              keep_punctuation: bool = False) -> 'BPETokenizer':
+        """
+        Learn BPE merges.
+        
+        Pair counts are updated incrementally: a max-heap (with lazy deletion
+        of stale entries) picks the next pair, and a pair -> words index
+        limits each merge to the words that actually contain the pair.
+        
+        Args:
+            data: Text, a token list, a word->count mapping (e.g. from
+                parallel_count_tokens) or a CorpusStats
+            num_merges: Maximum number of merges to learn
+            min_frequency: Stop once the best pair is rarer than this
+            keep_punctuation: Tokenizer setting for text input and encode()
+        
+        Returns:
+            Trained tokenizer
+        """
+        if isinstance(data, str):
+            data = tokenize(data, keep_punctuation)
+        if isinstance(data, CorpusStats):
+            data = data.unigrams
+        freq = data if isinstance(data, Mapping) else Counter(data)
+        
+        # Base alphabet, then one symbol list per distinct word
+        symbols = []
+        symbol_ids = {}
+        words = []
+        counts = []
+        for word, count in freq.items():
+            if not word:
+                continue
+            ids = []
+            for symbol in cls._word_symbols(word):
+                if symbol not in symbol_ids:
+                    symbol_ids[symbol] = len(symbols)
+                    symbols.append(symbol)
+                ids.append(symbol_ids[symbol])
+            words.append(ids)
+            counts.append(count)
+        
+        pair_counts = defaultdict(int)
+        where = defaultdict(set)
+        for i, (ids, count) in enumerate(zip(words, counts)):
+            for pair in zip(ids, ids[1:]):
+                pair_counts[pair] += count
+                where[pair].add(i)
+        heap = [(-count, pair) for pair, count in pair_counts.items()]
+        heapq.heapify(heap)
+        
+        merges = []
+        while len(merges) < num_merges and heap:
+            neg_count, pair = heapq.heappop(heap)
+            if pair_counts.get(pair, 0) != -neg_count:
+                continue  # stale heap entry
+            if -neg_count < min_frequency:
+                break
+            
+            a, b = pair
+            new_id = len(symbols)
+            symbols.append(symbols[a] + symbols[b])
+            merges.append((symbols[a], symbols[b]))
+            
+            changed = set()
+            for i in where.pop(pair):
+                ids, count = words[i], counts[i]
+                old_pairs = list(zip(ids, ids[1:]))
+                merged = []
+                j = 0
+                while j < len(ids):
+                    if j + 1 < len(ids) and ids[j] == a and ids[j + 1] == b:
+                        merged.append(new_id)
+                        j += 2
+                    else:
+                        merged.append(ids[j])
+                        j += 1
+                new_pairs = list(zip(merged, merged[1:]))
+                for old in old_pairs:
+                    pair_counts[old] -= count
+                for new in new_pairs:
+                    pair_counts[new] += count
+                for old in set(old_pairs) - set(new_pairs):
+                    where[old].discard(i)
+                for new in new_pairs:
+                    where[new].add(i)
+                changed.update(old_pairs)
+                changed.update(new_pairs)
+                words[i] = merged
+            
+            pair_counts.pop(pair, None)
+            for changed_pair in changed:
+                count = pair_counts.get(changed_pair, 0)
+                if count > 0:
+                    heapq.heappush(heap, (-count, changed_pair))
+                else:
+                    pair_counts.pop(changed_pair, None)
+        
+        return cls(merges, Vocabulary(symbols), keep_punctuation)
+    
+    def _encode_uncached(self, word: str) -> Tuple[int, ...]:
+        """Apply merges to one word, lowest rank first."""
+        ids = [self.vocab.get(symbol, UNK_ID) for symbol in self._word_symbols(word)]
+        while len(ids) > 1:
+            candidates = [(self.ranks[pair][0], pair) for pair in zip(ids, ids[1:])
+                          if pair in self.ranks]
+            if not candidates:
+                break
+            _, pair = min(candidates)
+            new_id = self.ranks[pair][1]
+            merged = []
+            j = 0
+            while j < len(ids):
+                if j + 1 < len(ids) and (ids[j], ids[j + 1]) == pair:
+                    merged.append(new_id)
+                    j += 2
+                else:
+                    merged.append(ids[j])
+                    j += 1
+            ids = merged
+        return tuple(ids)
+    
+    def encode_word(self, word: str) -> Tuple[int, ...]:
+        """Subword ids of one word (served from the LRU cache when possible)."""
+        ids = self._cache.get(word)
+        if ids is not None:
+            self._cache.move_to_end(word)
+            self.cache_hits += 1
+            return ids
+        self.cache_misses += 1
+        ids = self._encode_uncached(word)
+        self._cache[word] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return ids
+    
+    def encode(self, text) -> np.ndarray:
+        """
+        Encode text (or a list of word tokens) into subword ids.
+        
+        Returns:
+            1-D id array with dtype self.vocab.dtype
+        """
+        tokens = tokenize(text, self.keep_punctuation) if isinstance(text, str) else text
+        ids = []
+        for token in tokens:
+            if token:
+                ids.extend(self.encode_word(token))
+        return np.array(ids, dtype=self.vocab.dtype)
+    
+    def tokenize(self, text) -> List[str]:
+        """Subword strings for a text, e.g. ['lov', 'e</w>']."""
+        return self.vocab.decode(self.encode(text))
+    
+    def decode(self, ids) -> str:
+        """Join subword ids back into space-separated words."""
+        pieces = [piece for piece in self.vocab.decode(ids) if piece != '<PAD>']
+        return ''.join(pieces).replace(END_OF_WORD, ' ').strip()
+    
+    def __repr__(self) -> str:
+        return f"BPETokenizer(merges={len(self.merges)}, vocab_size={len(self.vocab)})"
+
+def _ngram_base(ids: np.ndarray, vocab_size: Optional[int]) -> int:
+    """Radix used to pack id tuples into integer keys."""
+    if vocab_size is None:
+        vocab_size = int(ids.max()) + 1 if len(ids) else 1
+    return max(int(vocab_size), 1)
+
+def pack_ngrams(ids, n: int, vocab_size: Optional[int] = None) -> np.ndarray:
+    """
+    Pack every n-gram of an id sequence into a single int64 key.
+    
+    The key of (w1, ..., wn) is w1*V^(n-1) + ... + wn, so sorting keys sorts
+    n-grams lexicographically.
+    
+    Args:
+        ids: 1-D array of token ids
+        n: N-gram order
+        vocab_size: Number of distinct ids V (defaults to max(ids) + 1)
+    
+    Returns:
+        Array of len(ids) - n + 1 keys
+    """
+    ids = np.asarray(ids)
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    base = _ngram_base(ids, vocab_size)
+    if base ** n > np.iinfo(np.int64).max:
+        raise ValueError(f"{n}-grams over {base} ids do not fit in an int64 key")
+    
+    n_keys = max(len(ids) - n + 1, 0)
+    keys = ids[:n_keys].astype(np.int64)
+    for j in range(1, n):
+        keys *= base
+        keys += ids[j:j + n_keys]
+    return keys
+
+def unpack_ngrams(keys: np.ndarray, n: int, vocab_size: int) -> np.ndarray:
+    """Inverse of pack_ngrams(): turn keys back into an (m, n) id array."""
+    keys = np.asarray(keys, dtype=np.int64)
+    out = np.empty((len(keys), n), dtype=np.int64)
+    rest = keys.copy()
+    for j in range(n - 1, -1, -1):
+        out[:, j] = rest % vocab_size
+        rest //= vocab_size
+    return out
+
+def count_ngrams(ids, n: int, vocab_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count all n-grams of an integer-encoded corpus.
+    
+    Uses np.bincount when the key space is small and np.unique otherwise,
+    so no Python-level loop runs over the tokens.
+    
+    Args:
+        ids: 1-D array of token ids (e.g. from Vocabulary.encode)
+        n: N-gram order
+        vocab_size: Number of distinct ids (defaults to max(ids) + 1)
+    
+    Returns:
+        (ngrams, counts): an (m, n) array of distinct n-grams in
+        lexicographic order and their int64 counts
+    """
+    ids = np.asarray(ids)
+    base = _ngram_base(ids, vocab_size)
+    keys = pack_ngrams(ids, n, base)
+    
+    if base ** n <= max(4 * len(keys), 1 << 16):
+        # Dense key space: a histogram is cheaper than sorting
+        counts = np.bincount(keys, minlength=base ** n)
+        unique_keys = np.flatnonzero(counts)
+        counts = counts[unique_keys]
+    else:
+        unique_keys, counts = np.unique(keys, return_counts=True)
+    
+    return unpack_ngrams(unique_keys, n, base), counts.astype(np.int64)
+
+def bigram_matrix(ids, vocab_ids) -> np.ndarray:
+    """
+    Dense bigram count matrix restricted to a subset of ids.
+    
+    Args:
+        ids: 1-D array of token ids; negative ids are ignored
+        vocab_ids: Ids to keep; row i / column j correspond to vocab_ids[i] / [j]
+    
+    Returns:
+        (k, k) int64 matrix where entry [i, j] counts vocab_ids[i] followed
+        by vocab_ids[j]
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    vocab_ids = np.asarray(vocab_ids, dtype=np.int64)
+    k = len(vocab_ids)
+    if len(ids) < 2 or k == 0:
+        return np.zeros((k, k), dtype=np.int64)
+    
+    # Map every id to its row in the matrix (-1 if not kept)
+    size = int(max(ids.max(), vocab_ids.max())) + 1
+    position = np.full(size, -1, dtype=np.int64)
+    position[vocab_ids] = np.arange(k)
+    valid = ids >= 0
+    lookup = np.where(valid, position[np.where(valid, ids, 0)], -1)
+    rows = lookup[:-1]
+    cols = lookup[1:]
+    keep = (rows >= 0) & (cols >= 0)
+    
+    counts = np.bincount(rows[keep] * k + cols[keep], minlength=k * k)
+    return counts.reshape(k, k)
+
+# Bytes per chunk when counting character n-grams; bounds peak memory
+CHAR_NGRAM_CHUNK = 1 << 22
+
+def _utf8_chunks(source, chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    uint8 chunks of a file or bytes object, each cut at a character boundary.
+    
+    Files are memory-mapped one chunk at a time, so pages already counted are
+    unmapped instead of accumulating in the resident set.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(source, dtype=np.uint8)
+        size = len(data)
+    else:
+        data = None
+        size = os.path.getsize(source)
+    
+    start = 0
+    while start < size:
+        # Map up to 3 extra bytes to find where the next character starts
+        length = min(chunk_size + 3, size - start)
+        if data is None:
+            window = np.memmap(source, dtype=np.uint8, mode='r', offset=start, shape=(length,))
         else:
-            break
+            window = data[start:start + length]
+        end = min(chunk_size, length)
+        # Continuation bytes look like 10xxxxxx; never cut in front of one
+        while 0 < end < length and (window[end] & 0xC0) == 0x80:
+            end -= 1
+        if end == 0:
+            # The chunk is shorter than its first character: take the whole
+            # character instead (the 3 extra bytes always hold its rest)
+            end = min(chunk_size, length)
+            while end < length and (window[end] & 0xC0) == 0x80:
+                end += 1
+        yield window[:end]
+        start += end
+
+def _utf8_code_points(chunk: np.ndarray) -> np.ndarray:
+    """
+    Decode UTF-8 bytes to an int32 array of code points without a Python loop.
+    
+    Only multi-byte characters take the slow path, so mostly-ASCII text
+    decodes at close to copy speed. Malformed sequences decode to U+FFFD.
+    """
+    b = np.asarray(chunk)
+    if not len(b) or b.max() < 0x80:
+        return b.astype(np.int32)
+    
+    starts = np.flatnonzero((b & 0xC0) != 0x80)
+    if not len(starts):
+        return np.zeros(0, dtype=np.int32)
+    cps = b[starts].astype(np.int32)
+    ends = np.append(starts[1:], len(b))
     
-    return vocab
+    multi = np.flatnonzero(cps >= 0x80)
+    lead = cps[multi]
+    first = starts[multi]
+    length = 2 + (lead >= 0xE0) + (lead >= 0xF0)
+    # A well-formed character is followed directly by the next start byte
+    bad = (ends[multi] - first != length) | (lead >= 0xF8)
+    value = lead & np.array([0, 0, 0x1F, 0x0F, 0x07], dtype=np.int32)[length]
+    for k in range(1, 4):
+        more = (length > k) & ~bad
+        value[more] = (value[more] << 6) | (b[first[more] + k] & 0x3F)
+    # Overlong encodings, surrogates and values past U+10FFFF are malformed
+    bad |= value < np.array([0, 0, 0x80, 0x800, 0x10000], dtype=np.int32)[length]
+    bad |= (value > 0x10FFFF) | ((value >= 0xD800) & (value <= 0xDFFF))
+    cps[multi] = np.where(bad, 0xFFFD, value)
+    
+    # Stray continuation bytes after an ASCII character
+    if int((ends[multi] - first).sum()) + len(starts) - len(multi) != len(b) - starts[0]:
+        stray = (ends - starts != 1) & (cps < 0x80)
+        cps[stray] = 0xFFFD
+    return cps
+
+def _merge_key_counts(parts: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge (sorted keys, counts) pairs into one, adding counts of equal keys."""
+    keys = np.concatenate([k for k, _ in parts])
+    counts = np.concatenate([c for _, c in parts])
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    counts = counts[order]
+    if not len(keys):
+        return keys, counts
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(counts, starts)
 
-def calculate_perplexity(probabilities: List[float]) -> float:
+class CharNgramCounts:
+    """
+    Character or byte n-gram counts stored as sorted integer keys.
+    
+    Symbol i of the alphabet (a byte value or a Unicode code point) has
+    id i; the key of an n-gram is its id sequence read as a number in base
+    len(alphabet), so key order is lexicographic order. plot_word_frequencies()
+    accepts these counts directly, and plot_bigram_heatmap() accepts bigram
+    counts (n=2).
+    """
+    
+    def __init__(self, keys: np.ndarray, counts: np.ndarray, n: int,
+                 alphabet: np.ndarray, unit: str = 'char'):
+        """
+        Args:
+            keys: Sorted, distinct uint64 n-gram keys
+            counts: Count of each key
+            n: N-gram order
+            alphabet: Sorted symbols (code points or byte values)
+            unit: 'char' or 'byte'
+        """
+        self.keys = keys
+        self.counts = counts
+        self.n = n
+        self.alphabet = alphabet
+        self.unit = unit
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    @property
+    def total(self) -> int:
+        """Number of n-gram occurrences counted"""
+        return int(self.counts.sum())
+    
+    def _symbols(self, keys: np.ndarray) -> np.ndarray:
+        """(m, n) array of alphabet entries for each key."""
+        base = np.uint64(len(self.alphabet))
+        rest = np.asarray(keys, dtype=np.uint64).copy()
+        ids = np.empty((len(rest), self.n), dtype=np.int64)
+        for j in range(self.n - 1, -1, -1):
+            ids[:, j] = rest % base
+            rest //= base
+        return self.alphabet[ids]
+    
+    def decode(self, keys: np.ndarray) -> List[str]:
+        """
+        Turn keys into strings.
+        
+        Byte n-grams that cut through a multi-byte character show the stray
+        bytes as backslash escapes.
+        """
+        symbols = self._symbols(keys)
+        if self.unit == 'byte':
+            return [bytes(row).decode('utf-8', errors='backslashreplace')
+                    for row in symbols.astype(np.uint8)]
+        return [''.join(map(chr, row)) for row in symbols.tolist()]
+    
+    def encode(self, gram: str) -> Optional[int]:
+        """Key of an n-gram string, or None if it uses unknown symbols."""
+        if self.unit == 'byte':
+            symbols = np.frombuffer(gram.encode('utf-8'), dtype=np.uint8).astype(np.int64)
+        else:
+            symbols = np.array([ord(c) for c in gram], dtype=np.int64)
+        if len(symbols) != self.n:
+            raise ValueError(f"expected a {self.n}-gram, got {gram!r}")
+        ids = np.searchsorted(self.alphabet, symbols)
+        if np.any(ids >= len(self.alphabet)) or np.any(self.alphabet[ids] != symbols):
+            return None
+        key = 0
+        for i in ids.tolist():
+            key = key * len(self.alphabet) + i
+        return key
+    
+    def __getitem__(self, gram: str) -> int:
+        """Count of one n-gram (0 if unseen)."""
+        key = self.encode(gram)
+        if key is None:
+            return 0
+        pos = np.searchsorted(self.keys, np.uint64(key))
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return int(self.counts[pos])
+        return 0
+    
+    def most_common(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """The k most frequent n-grams with their counts (all if k is None)."""
+        order = top_indices(self.counts, len(self.counts) if k is None else k)
+        return list(zip(self.decode(self.keys[order]), self.counts[order].tolist()))
+    
+    def transition_matrix(self, top_n: int = 30) -> Tuple[List[str], np.ndarray]:
+        """
+        Bigram matrix over the most frequent symbols, for plot_bigram_heatmap().
+        
+        Args:
+            top_n: Number of symbols to keep (by how often they start a bigram)
+        
+        Returns:
+            (symbols, matrix) where matrix[i, j] counts symbols[i] followed
+            by symbols[j]
+        """
+        if self.n != 2:
+            raise ValueError("a transition matrix needs bigram counts (n=2)")
+        base = np.uint64(len(self.alphabet))
+        first = (self.keys // base).astype(np.int64)
+        second = (self.keys % base).astype(np.int64)
+        totals = np.bincount(first, weights=self.counts, minlength=len(self.alphabet))
+        top = top_indices(totals.astype(np.int64), top_n)
+        top = top[totals[top] > 0]
+        
+        position = np.full(len(self.alphabet), -1, dtype=np.int64)
+        position[top] = np.arange(len(top))
+        rows = position[first]
+        cols = position[second]
+        keep = (rows >= 0) & (cols >= 0)
+        k = len(top)
+        matrix = np.bincount(rows[keep] * k + cols[keep], weights=self.counts[keep],
+                             minlength=k * k).astype(np.int64).reshape(k, k)
+        
+        if self.unit == 'byte':
+            symbols = [bytes([b]).decode('utf-8', errors='backslashreplace')
+                       for b in self.alphabet[top].tolist()]
+        else:
+            symbols = [chr(c) for c in self.alphabet[top].tolist()]
+        return symbols, matrix
+
+def count_char_ngrams(source, n: int = 3, unit: str = 'char', lowercase: bool = False,
+                      chunk_size: int = CHAR_NGRAM_CHUNK) -> CharNgramCounts:
+    """
+    Count character (or byte) n-grams of a UTF-8 text file.
+    
+    The file is memory-mapped as uint8 arrays one chunk at a time, with cuts
+    at character boundaries, so memory stays bounded by the chunk size plus
+    the distinct n-grams. Each chunk is turned into integer keys through a
+    sliding-window view and counted with np.unique; the n-1 symbols at the
+    end of a chunk are carried over so no n-gram is lost at a cut.
+    
+    Args:
+        source: Path of a UTF-8 text file, or a bytes object
+        n: N-gram order (1 to 8 for bytes; for characters the limit depends
+            on the size of the text's alphabet)
+        unit: 'char' for Unicode characters, 'byte' for raw UTF-8 bytes
+        lowercase: Lowercase before counting (ASCII letters only for 'byte')
+        chunk_size: Bytes decoded and counted at a time
+    
+    Returns:
+        CharNgramCounts
+    """
+    if unit not in ('char', 'byte'):
+        raise ValueError("unit must be 'char' or 'byte'")
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    if unit == 'byte':
+        alphabet = np.arange(256, dtype=np.int64)
+        lookup = alphabet.astype(np.uint64)
+        if lowercase:
+            lookup[ord('A'):ord('Z') + 1] += ord('a') - ord('A')
+    else:
+        # First pass: the alphabet of the text, so ids are fixed before counting
+        seen = np.zeros(0x110000, dtype=bool)
+        for chunk in _utf8_chunks(source, chunk_size):
+            seen[_utf8_code_points(chunk)] = True
+        code_points = np.flatnonzero(seen)
+        if lowercase:
+            lowered = np.array([ord(c.lower()) if len(c.lower()) == 1 else ord(c)
+                                for c in map(chr, code_points.tolist())], dtype=np.int64)
+            alphabet = np.unique(lowered)
+        else:
+            lowered = code_points
+            alphabet = code_points
+        lookup = np.zeros(0x110000, dtype=np.uint64)
+        lookup[code_points] = np.searchsorted(alphabet, lowered)
+    
+    base = max(len(alphabet), 1)
+    if base ** n > 2 ** 64:
+        raise ValueError(f"{n}-grams over {base} symbols do not fit in a 64-bit key")
+    
+    parts = []
+    pending = 0
+    merged_size = 0
+    tail = np.zeros(0, dtype=np.uint64)
+    for chunk in _utf8_chunks(source, chunk_size):
+        if unit == 'byte':
+            units = lookup[chunk]
+        else:
+            units = lookup[_utf8_code_points(chunk)]
+        units = np.concatenate([tail, units])
+        tail = units[max(len(units) - (n - 1), 0):].copy()
+        if len(units) < n:
+            continue
+        
+        windows = np.lib.stride_tricks.sliding_window_view(units, n)
+        keys = windows[:, 0].copy()
+        for j in range(1, n):
+            keys *= np.uint64(base)
+            keys += windows[:, j]
+        parts.append(np.unique(keys, return_counts=True))
+        del units, windows, keys
+        
+        # Merge once the unmerged parts outgrow the running totals (amortized)
+        pending += len(parts[-1][0])
+        if len(parts) > 1 and pending >= merged_size:
+            parts = [_merge_key_counts(parts)]
+            merged_size = pending = len(parts[0][0])
+    
+    if parts:
+        keys, counts = _merge_key_counts(parts)
+    else:
+        keys, counts = np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    return CharNgramCounts(keys, counts.astype(np.int64), n, alphabet, unit)
+
+class NgramModel:
+    """
+    Count-based n-gram language model stored as flat CSR-style arrays.
+    
+    Row r of the successor table holds every word seen after context
+    context_keys[r]: next_ids[offsets[r]:offsets[r+1]] with matching counts,
+    sorted by decreasing count. The last row holds unigram counts and is used
+    as a back-off for contexts never seen in training. All queries work on
+    batches of contexts without Python loops over the batch.
+    """
+    
+    def __init__(self, n: int = 2, vocab: Optional[Vocabulary] = None):
+        """
+        Args:
+            n: Model order (2 = bigram, 3 = trigram, ...)
+            vocab: Optional vocabulary used by the word-level helpers
+        """
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        self.n = n
+        self.vocab = vocab
+        self.vocab_size = 0
+        self.context_keys = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.next_ids = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.cum_counts = np.zeros(0, dtype=np.int64)
+    
+    @classmethod
+    def from_tokens(cls, tokens: List[str], n: int = 2, min_freq: int = 1) -> 'NgramModel':
+        """Build a vocabulary from tokens and fit a model on them."""
+        vocab = create_vocabulary(tokens, min_freq)
+        return cls(n, vocab).fit(vocab.encode(tokens))
+    
+    def fit(self, ids, vocab_size: Optional[int] = None) -> 'NgramModel':
+        """
+        Count n-grams of an encoded corpus and build the successor table.
+        
+        Args:
+            ids: 1-D array of token ids
+            vocab_size: Number of distinct ids (defaults to the vocabulary
+                size, or max(ids) + 1)
+        
+        Returns:
+            self
+        """
+        ids = np.asarray(ids)
+        if vocab_size is None:
+            vocab_size = len(self.vocab) if self.vocab is not None else None
+        base = _ngram_base(ids, vocab_size)
+        
+        ngrams, counts = count_ngrams(ids, self.n, base)
+        ctx_keys = np.zeros(len(ngrams), dtype=np.int64)
+        for j in range(self.n - 1):
+            ctx_keys = ctx_keys * base + ngrams[:, j]
+        context_keys, starts = np.unique(ctx_keys, return_index=True)
+        if self.n == 1:
+            context_keys, starts = context_keys[:0], starts[:0]
+            ctx_keys, ngrams, counts = ctx_keys[:0], ngrams[:0], counts[:0]
+        
+        # Unigram back-off row, appended after the real contexts
+        unigram = np.bincount(ids.astype(np.int64), minlength=base)
+        unigram_ids = np.flatnonzero(unigram)
+        
+        row_of = np.concatenate([np.searchsorted(context_keys, ctx_keys),
+                                 np.full(len(unigram_ids), len(context_keys))])
+        next_ids = np.concatenate([ngrams[:, -1], unigram_ids])
+        all_counts = np.concatenate([counts, unigram[unigram_ids]])
+        
+        # Most frequent successors first within each row (ties by id)
+        order = np.lexsort((next_ids, -all_counts, row_of))
+        self.vocab_size = base
+        self.context_keys = context_keys
+        self.offsets = np.concatenate([starts, [len(ngrams), len(next_ids)]]).astype(np.int64)
+        self.next_ids = next_ids[order]
+        self.counts = all_counts[order]
+        self.cum_counts = np.cumsum(self.counts)
+        return self
+    
+    @property
+    def num_contexts(self) -> int:
+        """Number of distinct contexts seen in training."""
+        return len(self.context_keys)
+    
+    def context_rows(self, contexts) -> np.ndarray:
+        """
+        Map a batch of contexts to rows of the successor table.
+        
+        Args:
+            contexts: (batch, width) array of ids; a 1-D array is read as a
+                batch of single-word contexts. Only the last n-1 columns
+                are used, and narrower contexts are left-padded with
+                <START> like the start of a text
+        
+        Returns:
+            Row index per context; unseen contexts (and every context of a
+            unigram model) map to the unigram row
+        """
+        contexts = np.asarray(contexts, dtype=np.int64)
+        if contexts.ndim == 1:
+            contexts = contexts.reshape(-1, 1)
+        
+        backoff = self.num_contexts
+        if self.n == 1 or self.num_contexts == 0:
+            return np.full(len(contexts), backoff, dtype=np.int64)
+        
+        width = self.n - 1
+        if contexts.shape[1] > width:
+            contexts = contexts[:, contexts.shape[1] - width:]
+        elif contexts.shape[1] < width:
+            padding = np.full((len(contexts), width - contexts.shape[1]), START_ID,
+                              dtype=np.int64)
+            contexts = np.concatenate([padding, contexts], axis=1)
+        
+        valid = ((contexts >= 0) & (contexts < self.vocab_size)).all(axis=1)
+        keys = np.zeros(len(contexts), dtype=np.int64)
+        for j in range(self.n - 1):
+            keys = keys * self.vocab_size + np.where(valid, contexts[:, j], 0)
+        rows = np.searchsorted(self.context_keys, keys)
+        rows = np.minimum(rows, self.num_contexts - 1)
+        found = valid & (self.context_keys[rows] == keys)
+        return np.where(found, rows, backoff)
+    
+    def top_k(self, contexts, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Most likely next words for a batch of contexts.
+        
+        Args:
+            contexts: (batch, n-1) array of ids (see context_rows())
+            k: Number of predictions per context
+        
+        Returns:
+            (ids, probs): two (batch, k) arrays; rows with fewer than k
+            successors are padded with id -1 and probability 0
+        """
+        rows = self.context_rows(contexts)
+        start = self.offsets[rows]
+        end = self.offsets[rows + 1]
+        totals = self.cum_counts[end - 1] - np.where(start > 0, self.cum_counts[start - 1], 0)
+        
+        pos = start[:, None] + np.arange(k)
+        valid = pos < end[:, None]
+        pos = np.where(valid, pos, 0)
+        ids = np.where(valid, self.next_ids[pos], -1)
+        probs = np.where(valid, self.counts[pos] / np.maximum(totals, 1)[:, None], 0.0)
+        return ids, probs
+    
+    def sample(self, contexts, num_samples: int = 1,
+               rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Draw next words for a batch of contexts in one vectorized step.
+        
+        Args:
+            contexts: (batch, n-1) array of ids (see context_rows())
+            num_samples: Number of independent draws per context
+            rng: NumPy random generator (defaults to np.random.default_rng())
+        
+        Returns:
+            (batch, num_samples) array of sampled ids
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        rows = self.context_rows(contexts)
+        start = self.offsets[rows]
+        end = self.offsets[rows + 1]
+        before = np.where(start > 0, self.cum_counts[start - 1], 0)
+        totals = self.cum_counts[end - 1] - before
+        
+        # Inverse-CDF sampling on the global cumulative counts
+        targets = before[:, None] + (rng.random((len(rows), num_samples))
+                                     * totals[:, None]).astype(np.int64)
+        pos = np.searchsorted(self.cum_counts, targets, side='right')
+        return self.next_ids[pos]
+    
+    def predict_next(self, context: List[str], k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Top-k next words for one word context, ready for plot_prediction_probabilities().
+        
+        Args:
+            context: Previous words (only the last n-1 are used; shorter
+                contexts are left-padded with <START>)
+            k: Number of predictions
+        
+        Returns:
+            List of (word, probability) tuples
+        """
+        if self.vocab is None:
+            raise ValueError("predict_next() needs a model built with a vocabulary")
+        context = list(context)[len(context) - (self.n - 1):] if self.n > 1 else []
+        ids = self.vocab.encode(context).astype(np.int64)
+        top_ids, probs = self.top_k(ids.reshape(1, -1), k)
+        return [(word, float(p)) for word, p, i in
+                zip(self.vocab.decode(np.maximum(top_ids[0], 0)), probs[0], top_ids[0])
+                if i >= 0]
+    
+    def generate(self, context: List[str], length: int = 20,
+                 rng: Optional[np.random.Generator] = None) -> List[str]:
+        """Sample a continuation of `length` words after a word context."""
+        if self.vocab is None:
+            raise ValueError("generate() needs a model built with a vocabulary")
+        history = list(self.vocab.encode(context).astype(np.int64))
+        for _ in range(length):
+            ctx = history[len(history) - (self.n - 1):] if self.n > 1 else []
+            history.append(int(self.sample(np.array([ctx]), 1, rng)[0, 0]))
+        return self.vocab.decode(history[len(context):])
+
+# Key spaces up to this size are looked up through a dense array instead of
+# a binary search
+DENSE_LOOKUP_LIMIT = 1 << 22
+
+def _history_keys(ids: np.ndarray, valid: np.ndarray, k: int,
+                  base: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Key of the k-gram ending at every position, and whether it exists.
+    
+    Positions with fewer than k-1 previous tokens, or whose k-gram contains an
+    id outside the vocabulary, are marked as missing.
+    """
+    length = len(ids)
+    keys = np.zeros(length, dtype=np.int64)
+    present = np.zeros(length, dtype=bool)
+    if k > length:
+        return keys, present
+    keys[k - 1:] = pack_ngrams(np.where(valid, ids, 0), k, base)
+    bad = np.concatenate([[0], np.cumsum(~valid)])
+    present[k - 1:] = bad[k:] == bad[:length - k + 1]
+    return keys, present
+
+class SmoothedNgramModel:
+    """
+    Smoothed n-gram probabilities stored as sorted lookup tables.
+    
+    For every order k in `orders`, ngram_keys[ngram_offsets[i]:ngram_offsets[i+1]]
+    holds the packed k-grams with their discounted weight alpha, and the
+    context tables hold the packed (k-1)-word contexts with their back-off
+    weight gamma. The probability of a word is built bottom-up from the
+    uniform distribution:
+    
+        p_k = alpha(context, word) + gamma(context) * p_(k-1)
+    
+    and a context never seen at order k leaves p_(k-1) unchanged. Interpolated
+    Kneser-Ney fills orders 1..n (continuation counts below the top order).
+    Add-k fills orders 1..n as well, but does not interpolate: each token
+    uses the highest order whose context it has, with p_(k-1) = 1/V, which
+    is exactly (c + k) / (c(context) + kV). The first n-1 tokens (and tokens
+    right after an out-of-vocabulary id) thus fall back to lower-order add-k
+    rather than the uniform 1/V.
+    score() resolves all of this with array lookups (binary search, or a
+    dense array for small key spaces), so a whole held-out id array is
+    scored with a handful of array passes per order.
+    """
+    
+    def __init__(self, n: int = 3, method: str = 'kneser_ney', k: float = 1.0,
+                 discount: Optional[float] = None, vocab: Optional[Vocabulary] = None):
+        """
+        Args:
+            n: Model order
+            method: 'kneser_ney' (interpolated) or 'add_k'
+            k: Pseudo-count for add-k smoothing
+            discount: Kneser-Ney discount for every order (default: estimated
+                per order as n1 / (n1 + 2 * n2) from the count-of-counts)
+            vocab: Optional vocabulary used by the word-level helpers
+        """
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        if method not in ('kneser_ney', 'add_k'):
+            raise ValueError("method must be 'kneser_ney' or 'add_k'")
+        self.n = n
+        self.method = method
+        self.k = k
+        self.discount = discount
+        self.vocab = vocab
+        self.vocab_size = 0
+        self.discounts = np.zeros(0, dtype=np.float64)
+        self.orders = np.zeros(0, dtype=np.int64)
+        self.ngram_offsets = np.zeros(1, dtype=np.int64)
+        self.ngram_keys = np.zeros(0, dtype=np.int64)
+        self.ngram_alpha = np.zeros(0, dtype=np.float64)
+        self.context_offsets = np.zeros(1, dtype=np.int64)
+        self.context_keys = np.zeros(0, dtype=np.int64)
+        self.context_gamma = np.zeros(0, dtype=np.float64)
+    
+    @classmethod
+    def from_tokens(cls, tokens: List[str], n: int = 3, min_freq: int = 1,
+                    **kwargs) -> 'SmoothedNgramModel':
+        """Build a vocabulary from tokens and fit a model on them."""
+        vocab = create_vocabulary(tokens, min_freq)
+        return cls(n, vocab=vocab, **kwargs).fit(vocab.encode(tokens))
+    
+    def _estimate_discount(self, counts: np.ndarray) -> float:
+        """Absolute discount for one order from its count-of-counts."""
+        if self.discount is not None:
+            return float(self.discount)
+        n1 = np.count_nonzero(counts == 1)
+        n2 = np.count_nonzero(counts == 2)
+        if n1 == 0 or n2 == 0:
+            return 0.75
+        return float(np.clip(n1 / (n1 + 2 * n2), 0.05, 0.95))
+    
+    def fit(self, ids, vocab_size: Optional[int] = None) -> 'SmoothedNgramModel':
+        """
+        Count the training corpus and build the smoothing tables.
+        
+        Args:
+            ids: 1-D array of token ids
+            vocab_size: Number of distinct ids (defaults to the vocabulary
+                size, or max(ids) + 1)
+        
+        Returns:
+            self
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if vocab_size is None:
+            vocab_size = len(self.vocab) if self.vocab is not None else None
+        base = _ngram_base(ids, vocab_size)
+        
+        # Distinct k-grams with their counts, for every order
+        distinct = {}
+        for order in range(1, self.n + 1):
+            distinct[order] = np.unique(pack_ngrams(ids, order, base), return_counts=True)
+        
+        tables = []
+        discounts = []
+        for order in range(1, self.n + 1):
+            if order == self.n or self.method == 'add_k':
+                keys, numerators = distinct[order]
+            else:
+                # Continuation count: distinct words seen before the k-gram
+                higher_keys = distinct[order + 1][0]
+                keys, numerators = np.unique(higher_keys % base ** order, return_counts=True)
+            
+            # Keys are sorted, so equal contexts (key // V) are adjacent
+            contexts = keys // base
+            context_keys, starts, types = np.unique(contexts, return_index=True,
+                                                    return_counts=True)
+            totals = np.add.reduceat(numerators, starts) if len(starts) else numerators[:0]
+            row = np.repeat(np.arange(len(context_keys)), types)
+            
+            if self.method == 'add_k':
+                denominators = totals + self.k * base
+                alpha = numerators / denominators[row]
+                gamma = self.k * base / denominators
+                discounts.append(0.0)
+            else:
+                d = self._estimate_discount(numerators)
+                alpha = np.maximum(numerators - d, 0) / totals[row]
+                gamma = d * types / totals
+                discounts.append(d)
+            tables.append((order, keys, alpha, context_keys, gamma))
+        
+        self.vocab_size = base
+        self.discounts = np.array(discounts, dtype=np.float64)
+        self.orders = np.array([t[0] for t in tables], dtype=np.int64)
+        self.ngram_keys = np.concatenate([t[1] for t in tables]).astype(np.int64)
+        self.ngram_alpha = np.concatenate([t[2] for t in tables]).astype(np.float64)
+        self.ngram_offsets = np.cumsum([0] + [len(t[1]) for t in tables]).astype(np.int64)
+        self.context_keys = np.concatenate([t[3] for t in tables]).astype(np.int64)
+        self.context_gamma = np.concatenate([t[4] for t in tables]).astype(np.float64)
+        self.context_offsets = np.cumsum([0] + [len(t[3]) for t in tables]).astype(np.int64)
+        return self
+    
+    @staticmethod
+    def _lookup(table: np.ndarray, values: np.ndarray, keys: np.ndarray,
+                present: np.ndarray, space: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Values for keys found in a sorted table, and a found mask."""
+        if not len(table):
+            return np.zeros(len(keys)), np.zeros(len(keys), dtype=bool)
+        if space <= DENSE_LOOKUP_LIMIT:
+            # Small key space: scatter the table once and gather directly
+            dense = np.zeros(space)
+            dense[table] = values
+            known = np.zeros(space, dtype=bool)
+            known[table] = True
+            keys = np.where(present, keys, 0)
+            found = present & known[keys]
+            return np.where(found, dense[keys], 0.0), found
+        pos = np.minimum(np.searchsorted(table, keys), len(table) - 1)
+        found = present & (table[pos] == keys)
+        return np.where(found, values[pos], 0.0), found
+    
+    def probabilities(self, ids, offset: int = 0) -> np.ndarray:
+        """
+        Smoothed probability of every token given the tokens before it.
+        
+        The first tokens use as much history as they have (a trigram model
+        scores the second token with a bigram context). Ids outside the
+        vocabulary only receive the uniform share.
+        
+        Args:
+            ids: 1-D array of token ids
+            offset: Number of leading ids that only serve as history; pass
+                the last n-1 ids of the previous chunk to score a test set
+                in chunks exactly as in one pass
+        
+        Returns:
+            float64 array of len(ids) - offset probabilities
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        base = self.vocab_size
+        valid = (ids >= 0) & (ids < base)
+        probs = np.full(len(ids), 1.0 / base)
+        add_k = self.method == 'add_k'
+        
+        previous = None
+        for i, order in enumerate(self.orders.tolist()):
+            ngram_slice = slice(self.ngram_offsets[i], self.ngram_offsets[i + 1])
+            context_slice = slice(self.context_offsets[i], self.context_offsets[i + 1])
+            
+            if order == 1:
+                # The empty context: one table entry that every token sees
+                gamma = self.context_gamma[context_slice]
+                seen = np.full(len(ids), len(gamma) > 0)
+                context_present = seen
+                gamma = np.full(len(ids), gamma[0] if len(gamma) else 0.0)
+            else:
+                # The context of order k is the (k-1)-gram ending one token earlier
+                if previous is None or previous[0] != order - 1:
+                    previous = (order - 1,) + _history_keys(ids, valid, order - 1, base)
+                context_keys = np.concatenate([[0], previous[1][:-1]])
+                context_present = np.concatenate([[False], previous[2][:-1]])
+                gamma, seen = self._lookup(self.context_keys[context_slice],
+                                           self.context_gamma[context_slice],
+                                           context_keys, context_present,
+                                           base ** (order - 1))
+            
+            ngram_keys, ngram_present = _history_keys(ids, valid, order, base)
+            alpha, _ = self._lookup(self.ngram_keys[ngram_slice],
+                                    self.ngram_alpha[ngram_slice],
+                                    ngram_keys, ngram_present & seen, base ** order)
+            previous = (order, ngram_keys, ngram_present)
+            
+            if add_k:
+                # An unseen context has no counts, so its add-k row is uniform
+                probs = np.where(context_present, alpha + np.where(seen, gamma, 1.0) / base,
+                                 probs)
+            else:
+                probs = np.where(seen, alpha + gamma * probs, probs)
+        return probs[offset:]
+    
+    def score(self, ids, base: float = 2.0, offset: int = 0) -> np.ndarray:
+        """
+        Per-token log-probabilities of a held-out id array.
+        
+        Args:
+            ids: 1-D array of token ids
+            base: Logarithm base (2 matches calculate_perplexity())
+            offset: Number of leading ids that only serve as history
+        
+        Returns:
+            float64 array of log-probabilities, ready for
+            PerplexityAccumulator.update(log_probabilities=..., base=base)
+        """
+        log2_probs = np.log2(self.probabilities(ids, offset))
+        if base != 2.0:
+            log2_probs /= np.log2(base)
+        return log2_probs
+    
+    def perplexity(self, ids, accumulator: Optional[PerplexityAccumulator] = None,
+                   offset: int = 0) -> float:
+        """
+        Perplexity of a held-out id array.
+        
+        Args:
+            ids: 1-D array of token ids
+            accumulator: Accumulator to add this chunk to, for test sets
+                scored in several chunks
+            offset: Number of leading ids that only serve as history
+        
+        Returns:
+            Perplexity over everything the accumulator has seen
+        """
+        if accumulator is None:
+            accumulator = PerplexityAccumulator()
+        accumulator.update(log_probabilities=self.score(ids, offset=offset))
+        return accumulator.perplexity()
+    
+    def score_tokens(self, tokens: List[str], base: float = 2.0) -> np.ndarray:
+        """Per-token log-probabilities of a list of words."""
+        if self.vocab is None:
+            raise ValueError("score_tokens() needs a model built with a vocabulary")
+        return self.score(self.vocab.encode(tokens), base)
+
+# Bytes of float32 similarities scored per matrix multiply in EmbeddingStore.search()
+SEARCH_BLOCK_BYTES = 64 << 20
+
+class EmbeddingStore:
+    """
+    Word vectors indexed by vocabulary id, with batched similarity queries.
+    
+    Vectors are L2-normalized float32 once at construction so cosine
+    similarity is a plain dot product; a batch of queries is answered with
+    one matrix multiply and np.argpartition. All state is kept in flat
+    arrays, so a store written with save_model() is memory-mapped by
+    load_model(). build_index() adds a random-projection LSH index for
+    approximate queries on very large vocabularies.
+    """
+    
+    def __init__(self, vectors, vocab: Optional[Vocabulary] = None):
+        """
+        Args:
+            vectors: (vocab_size, dim) array; row i is the vector of id i
+            vocab: Vocabulary the ids refer to (needed for word-level helpers)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms > 0, norms, 1).astype(np.float32)
+        self.vocab = vocab
+        self.lsh_planes = np.zeros((0, 0, vectors.shape[1]), dtype=np.float32)
+        self.lsh_codes = np.zeros((0, 0), dtype=np.int64)
+        self.lsh_items = np.zeros((0, 0), dtype=np.int64)
+    
+    @classmethod
+    def from_keyed_vectors(cls, word_vectors, vocab: Vocabulary) -> 'EmbeddingStore':
+        """
+        Align word vectors (e.g. a gensim model.wv) with vocabulary ids.
+        
+        Words without a vector get a zero row.
+        """
+        words = list(vocab)
+        dim = next(len(word_vectors[w]) for w in words if w in word_vectors)
+        vectors = np.zeros((len(words), dim), dtype=np.float32)
+        for i, word in enumerate(words):
+            if word in word_vectors:
+                vectors[i] = word_vectors[word]
+        return cls(vectors, vocab)
+    
+    @property
+    def has_index(self) -> bool:
+        """Whether build_index() has been run."""
+        return self.lsh_codes.size > 0
+    
+    def _exclusions(self, n: int, exclude) -> List[np.ndarray]:
+        """Ids to leave out of each query's results (special tokens always)."""
+        special = np.arange(min(len(SPECIAL_TOKENS), len(self.vectors)))
+        if exclude is None:
+            return [special] * n
+        return [np.concatenate([special, np.atleast_1d(np.asarray(e, dtype=np.int64))])
+                for e in exclude]
+    
+    def search(self, queries, k: int = 10, exclude=None,
+               approximate: bool = False,
+               block_bytes: int = SEARCH_BLOCK_BYTES) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest neighbours of query vectors by cosine similarity.
+        
+        Args:
+            queries: (batch, dim) array of query vectors
+            k: Number of neighbours per query
+            exclude: Optional per-query sequences of ids to skip
+            approximate: Use the LSH index instead of an exact scan
+            block_bytes: Memory budget of one block of similarities; queries
+                are scored block_bytes // (4 * vocab_size) at a time
+        
+        Returns:
+            (ids, similarities): two (batch, k) arrays, best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        exclusions = self._exclusions(len(queries), exclude)
+        if approximate:
+            if not self.has_index:
+                raise ValueError("call build_index() before approximate queries")
+            return self._search_lsh(queries, k, exclusions)
+        
+        n = len(self.vectors)
+        k = min(k, n)
+        block_size = max(1, block_bytes // (4 * max(n, 1)))
+        out_ids = np.zeros((len(queries), k), dtype=np.int64)
+        out_sims = np.zeros((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return out_ids, out_sims
+        for start in range(0, len(queries), block_size):
+            sims = queries[start:start + block_size] @ self.vectors.T
+            for row, ids in enumerate(exclusions[start:start + block_size]):
+                sims[row, ids[ids < n]] = -np.inf
+            # The k largest end up in the last k columns, no negated copy needed
+            top = np.argpartition(sims, n - k, axis=1)[:, n - k:]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind='stable')
+            out_ids[start:start + len(sims)] = np.take_along_axis(top, order, axis=1)
+            out_sims[start:start + len(sims)] = np.take_along_axis(top_sims, order, axis=1)
+        return out_ids, out_sims
+    
+    def most_similar(self, query_ids, k: int = 10,
+                     approximate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Most similar words for a batch of word ids (each query excludes itself).
+        
+        Returns:
+            (ids, similarities): two (batch, k) arrays, best first
+        """
+        query_ids = np.atleast_1d(np.asarray(query_ids, dtype=np.int64))
+        return self.search(self.vectors[query_ids], k, exclude=query_ids[:, None],
+                           approximate=approximate)
+    
+    def analogy(self, a, b, c, k: int = 5,
+                approximate: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Solve "a is to b as c is to ?" with the vector b - a + c.
+        
+        a, b and c are ids or equal-length arrays of ids; the input words are
+        excluded from the answers.
+        """
+        a, b, c = (np.atleast_1d(np.asarray(x, dtype=np.int64)) for x in (a, b, c))
+        queries = self.vectors[b] - self.vectors[a] + self.vectors[c]
+        return self.search(queries, k, exclude=np.stack([a, b, c], axis=1),
+                           approximate=approximate)
+    
+    def similar_words(self, word: str, k: int = 10) -> List[Tuple[str, float]]:
+        """(word, similarity) pairs for one word, like the Embeddings notebook shows."""
+        if self.vocab is None:
+            raise ValueError("similar_words() needs a store built with a vocabulary")
+        ids, sims = self.most_similar([self.vocab.get(word, UNK_ID)], k)
+        return list(zip(self.vocab.decode(ids[0]), sims[0].tolist()))
+    
+    def build_index(self, num_tables: int = 8, num_bits: int = 16,
+                    seed: int = 0) -> 'EmbeddingStore':
+        """
+        Build a random-projection LSH index for approximate queries.
+        
+        Each table hashes vectors to num_bits signs of random projections;
+        a query only scores the items sharing its bucket in some table. More
+        tables raise recall, more bits shrink buckets (and query time).
+        
+        Returns:
+            self
+        """
+        rng = np.random.default_rng(seed)
+        dim = self.vectors.shape[1]
+        self.lsh_planes = rng.standard_normal((num_tables, num_bits, dim)).astype(np.float32)
+        codes = self._lsh_codes(self.vectors)
+        order = np.argsort(codes, axis=1, kind='stable')
+        self.lsh_codes = np.take_along_axis(codes, order, axis=1)
+        self.lsh_items = order
+        return self
+    
+    def _lsh_codes(self, vectors: np.ndarray) -> np.ndarray:
+        """(num_tables, len(vectors)) integer bucket codes."""
+        weights = 1 << np.arange(self.lsh_planes.shape[1], dtype=np.int64)
+        bits = np.einsum('tbd,nd->tnb', self.lsh_planes, vectors) > 0
+        return bits.astype(np.int64) @ weights
+    
+    def _search_lsh(self, queries: np.ndarray, k: int,
+                    exclusions: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Score only the candidates that share an LSH bucket with each query."""
+        codes = self._lsh_codes(queries)
+        starts = np.stack([np.searchsorted(self.lsh_codes[t], codes[t], side='left')
+                           for t in range(len(codes))])
+        ends = np.stack([np.searchsorted(self.lsh_codes[t], codes[t], side='right')
+                         for t in range(len(codes))])
+        
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q in range(len(queries)):
+            candidates = np.unique(np.concatenate(
+                [self.lsh_items[t, starts[t, q]:ends[t, q]] for t in range(len(codes))]))
+            candidates = np.setdiff1d(candidates, exclusions[q])
+            if not len(candidates):
+                continue
+            sims = self.vectors[candidates] @ queries[q]
+            top = np.argsort(-sims, kind='stable')[:k]
+            out_ids[q, :len(top)] = candidates[top]
+            out_sims[q, :len(top)] = sims[top]
+        return out_ids, out_sims
+
+def positional_encoding(max_len: int, d_model: int) -> np.ndarray:
+    """Sinusoidal positional encodings, shape (max_len, d_model)."""
+    positions = np.arange(max_len)[:, None]
+    rates = 1.0 / 10000 ** (np.arange(0, d_model, 2) / d_model)
+    encoding = np.zeros((max_len, d_model), dtype=np.float32)
+    encoding[:, 0::2] = np.sin(positions * rates)
+    encoding[:, 1::2] = np.cos(positions * rates[:d_model // 2])
+    return encoding
+
+def layer_norm(x: np.ndarray, gamma: np.ndarray, beta: np.ndarray,
+               eps: float = 1e-5) -> np.ndarray:
+    """Normalize the last axis to zero mean and unit variance, then scale and shift."""
+    mean = x.mean(axis=-1, keepdims=True)
+    var = x.var(axis=-1, keepdims=True)
+    return (x - mean) / np.sqrt(var + eps) * gamma + beta
+
+def softmax(x: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Numerically stable softmax."""
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+class NumpyTransformer:
+    """
+    Minimal decoder-only transformer for CPU inference in plain NumPy.
+    
+    Pre-norm blocks of multi-head causal self-attention and a ReLU
+    feed-forward network, with sinusoidal positions and an output layer tied
+    to the token embeddings. Weights are randomly initialized (or assigned
+    directly) for teaching purposes; the point is the inference path:
+    batches with padding masks and a key/value cache so each generated
+    token only attends over cached keys instead of recomputing the prefix.
+    """
+    
+    def __init__(self, vocab_size: int, d_model: int = 64, num_heads: int = 4,
+                 num_layers: int = 2, d_ff: int = 256, max_len: int = 512, seed: int = 0):
+        if d_model % num_heads:
+            raise ValueError("d_model must be divisible by num_heads")
+        rng = np.random.default_rng(seed)
+        
+        def weight(*shape):
+            return (rng.standard_normal(shape) / np.sqrt(shape[0])).astype(np.float32)
+        
+        self.d_model = d_model
+        self.num_heads = num_heads
+        self.num_layers = num_layers
+        self.max_len = max_len
+        self.embedding = (rng.standard_normal((vocab_size, d_model)) * 0.1).astype(np.float32)
+        self.positions = positional_encoding(max_len, d_model)
+        self.layers = [{
+            'wq': weight(d_model, d_model), 'wk': weight(d_model, d_model),
+            'wv': weight(d_model, d_model), 'wo': weight(d_model, d_model),
+            'w1': weight(d_model, d_ff), 'b1': np.zeros(d_ff, dtype=np.float32),
+            'w2': weight(d_ff, d_model), 'b2': np.zeros(d_model, dtype=np.float32),
+            'ln1_gamma': np.ones(d_model, dtype=np.float32),
+            'ln1_beta': np.zeros(d_model, dtype=np.float32),
+            'ln2_gamma': np.ones(d_model, dtype=np.float32),
+            'ln2_beta': np.zeros(d_model, dtype=np.float32),
+        } for _ in range(num_layers)]
+        self.final_gamma = np.ones(d_model, dtype=np.float32)
+        self.final_beta = np.zeros(d_model, dtype=np.float32)
+    
+    def init_cache(self, batch_size: int, capacity: Optional[int] = None) -> Dict:
+        """Empty key/value cache for up to `capacity` positions per sequence."""
+        capacity = capacity or self.max_len
+        head_dim = self.d_model // self.num_heads
+        shape = (self.num_layers, batch_size, self.num_heads, capacity, head_dim)
+        return {
+            'keys': np.zeros(shape, dtype=np.float32),
+            'values': np.zeros(shape, dtype=np.float32),
+            'valid': np.zeros((batch_size, capacity), dtype=bool),
+            'real_tokens': np.zeros(batch_size, dtype=np.int64),
+            'length': 0,
+        }
+    
+    def _split_heads(self, x: np.ndarray) -> np.ndarray:
+        b, t, _ = x.shape
+        return x.reshape(b, t, self.num_heads, -1).transpose(0, 2, 1, 3)
+    
+    def _extend(self, ids: np.ndarray, mask: np.ndarray, cache: Dict) -> np.ndarray:
+        """
+        Run new columns of tokens through the model, appending to the cache.
+        
+        Args:
+            ids: (batch, t) token ids for the next t columns
+            mask: (batch, t) True for real tokens, False for padding
+            cache: Cache from init_cache(), updated in place
+        
+        Returns:
+            (batch, t, vocab_size) logits
+        """
+        batch, t = ids.shape
+        start = cache['length']
+        if start + t > cache['valid'].shape[1]:
+            raise ValueError("sequence longer than the cache capacity")
+        
+        # Positions count real tokens only, so left and right padding both work
+        positions = cache['real_tokens'][:, None] + np.cumsum(mask, axis=1) - 1
+        positions = np.clip(positions, 0, self.max_len - 1)
+        cache['valid'][:, start:start + t] = mask
+        cache['real_tokens'] += mask.sum(axis=1)
+        cache['length'] = start + t
+        end = start + t
+        
+        # Query column i may see key column j if j <= start + i and j is real
+        causal = np.arange(end)[None, :] <= (start + np.arange(t))[:, None]
+        allowed = causal[None, None] & cache['valid'][:, None, None, :end]
+        
+        x = self.embedding[ids] + self.positions[positions]
+        scale = 1.0 / math.sqrt(self.d_model // self.num_heads)
+        for i, layer in enumerate(self.layers):
+            h = layer_norm(x, layer['ln1_gamma'], layer['ln1_beta'])
+            q = self._split_heads(h @ layer['wq'])
+            cache['keys'][i, :, :, start:end] = self._split_heads(h @ layer['wk'])
+            cache['values'][i, :, :, start:end] = self._split_heads(h @ layer['wv'])
+            k = cache['keys'][i, :, :, :end]
+            v = cache['values'][i, :, :, :end]
+            
+            scores = np.where(allowed, q @ k.swapaxes(-1, -2) * scale, -1e9)
+            attended = softmax(scores) @ v
+            attended = attended.transpose(0, 2, 1, 3).reshape(batch, t, self.d_model)
+            x = x + attended @ layer['wo']
+            
+            h = layer_norm(x, layer['ln2_gamma'], layer['ln2_beta'])
+            x = x + np.maximum(h @ layer['w1'] + layer['b1'], 0) @ layer['w2'] + layer['b2']
+        
+        x = layer_norm(x, self.final_gamma, self.final_beta)
+        return x @ self.embedding.T
+    
+    def forward(self, ids, padding_mask=None) -> np.ndarray:
+        """
+        Full forward pass over whole sequences (no cache reuse).
+        
+        Args:
+            ids: (batch, seq_len) token ids
+            padding_mask: (batch, seq_len) True for real tokens (default: all)
+        
+        Returns:
+            (batch, seq_len, vocab_size) logits
+        """
+        ids = np.atleast_2d(np.asarray(ids, dtype=np.int64))
+        mask = np.ones(ids.shape, dtype=bool) if padding_mask is None else np.asarray(padding_mask, bool)
+        return self._extend(ids, mask, self.init_cache(len(ids), ids.shape[1]))
+    
+    def prefill(self, ids, padding_mask=None,
+                capacity: Optional[int] = None) -> Tuple[np.ndarray, Dict]:
+        """Process prompts once and return (logits, cache) for incremental decoding."""
+        ids = np.atleast_2d(np.asarray(ids, dtype=np.int64))
+        mask = np.ones(ids.shape, dtype=bool) if padding_mask is None else np.asarray(padding_mask, bool)
+        cache = self.init_cache(len(ids), capacity)
+        return self._extend(ids, mask, cache), cache
+    
+    def step(self, ids, cache: Dict) -> np.ndarray:
+        """Feed one new token per sequence; returns (batch, vocab_size) logits."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1, 1)
+        return self._extend(ids, np.ones(ids.shape, dtype=bool), cache)[:, -1]
+    
+    def generate(self, prompt_ids, max_new_tokens: int = 20, padding_mask=None,
+                 use_cache: bool = True, temperature: float = 0.0,
+                 rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, Dict]:
+        """
+        Extend a batch of prompts token by token.
+        
+        Args:
+            prompt_ids: (batch, prompt_len) token ids
+            max_new_tokens: Tokens to generate per sequence
+            padding_mask: True for real prompt tokens (left or right padding)
+            use_cache: Reuse keys/values (O(N) per token) instead of
+                re-running the whole prefix (O(N^2) per token)
+            temperature: 0 for greedy decoding, otherwise sampling temperature
+            rng: Random generator for sampling
+        
+        Returns:
+            (new_ids, stats): a (batch, max_new_tokens) array and a dict
+            with 'tokens', 'seconds' and 'tokens_per_sec'
+        """
+        prompt_ids = np.atleast_2d(np.asarray(prompt_ids, dtype=np.int64))
+        mask = (np.ones(prompt_ids.shape, dtype=bool) if padding_mask is None
+                else np.asarray(padding_mask, bool))
+        rng = rng or np.random.default_rng()
+        
+        def pick(logits):
+            if temperature <= 0:
+                return logits.argmax(axis=-1)
+            probs = softmax(logits / temperature)
+            u = rng.random((len(probs), 1))
+            return np.minimum((probs.cumsum(axis=-1) < u).sum(axis=-1), probs.shape[-1] - 1)
+        
+        # Logits of the last real token of each prompt
+        last = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1)
+        batch = np.arange(len(prompt_ids))
+        
+        started = time.perf_counter()
+        new_ids = np.zeros((len(prompt_ids), max_new_tokens), dtype=np.int64)
+        if use_cache:
+            logits, cache = self.prefill(prompt_ids, mask,
+                                         prompt_ids.shape[1] + max_new_tokens)
+            next_ids = pick(logits[batch, last])
+            for i in range(max_new_tokens):
+                new_ids[:, i] = next_ids
+                if i + 1 < max_new_tokens:
+                    next_ids = pick(self.step(next_ids, cache))
+        else:
+            ids, full_mask = prompt_ids, mask
+            for i in range(max_new_tokens):
+                logits = self.forward(ids, full_mask)
+                next_ids = pick(logits[batch, last] if i == 0 else logits[:, -1])
+                new_ids[:, i] = next_ids
+                ids = np.concatenate([ids, next_ids[:, None]], axis=1)
+                full_mask = np.concatenate([full_mask, np.ones((len(ids), 1), bool)], axis=1)
+        seconds = time.perf_counter() - started
+        
+        tokens = new_ids.size
+        return new_ids, {'tokens': tokens, 'seconds': seconds,
+                         'tokens_per_sec': tokens / seconds if seconds else float('inf')}
+
+# Probabilities are clipped to this floor before taking logs
+MIN_PROBABILITY = 1e-10
+
+def calculate_perplexity(probabilities) -> float:
     """
     Calculate perplexity from a list of probabilities.
     
     Perplexity = 2^(-avg(log2(p)))
     
     Args:
-        probabilities: List of prediction probabilities
+        probabilities: List of prediction probabilities, or a
+            PerplexityAccumulator that has already seen them
     
     Returns:
         Perplexity score (lower is better)
     """
+    if isinstance(probabilities, PerplexityAccumulator):
+        return probabilities.perplexity()
+    
     # Avoid log(0)
     probs = np.array(probabilities)
-    probs = np.clip(probs, 1e-10, 1.0)
+    probs = np.clip(probs, MIN_PROBABILITY, 1.0)
     
     # Calculate perplexity
     avg_log_prob = np.mean(np.log2(probs))
@@ -121,30 +2613,242 @@ def calculate_perplexity(probabilities: List[float]) -> float:
     
     return perplexity
 
-def plot_word_frequencies(tokens: List[str], top_n: int = 20) -> go.Figure:
+# Number of values converted at a time by _exact_sum_terms()
+EXACT_SUM_BLOCK = 1 << 16
+
+def _fsum_terms(values: List[float]) -> List[float]:
+    """Greedy fsum() expansion of a short list of floats (see _exact_sum_terms)."""
+    terms = []
+    while True:
+        term = math.fsum(values + [-t for t in terms])
+        if term == 0.0:
+            return terms
+        terms.append(term)
+
+def _exact_sum_terms(values) -> List[float]:
+    """
+    Represent the exact sum of floats as a short list of non-overlapping floats.
+    
+    Each term is the correctly rounded remainder of the previous ones, so
+    math.fsum() of the terms is the exact sum no matter how the values were
+    split into chunks. This is what makes merged accumulators agree exactly.
+    
+    The values are never turned into a Python list: each block of
+    EXACT_SUM_BLOCK values is split into integer mantissas and exponents,
+    the mantissas are summed per exponent with np.bincount (two 27-bit
+    halves, so the float64 sums stay exact) and the result is added to one
+    Python integer counting multiples of 2**-1126.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    total = 0
+    for start in range(0, len(values), EXACT_SUM_BLOCK):
+        block = values[start:start + EXACT_SUM_BLOCK]
+        if not np.isfinite(block).all():
+            raise ValueError("cannot sum NaN or infinite values exactly")
+        mantissas, exponents = np.frexp(block)
+        mantissas = (mantissas * 2.0 ** 53).astype(np.int64)
+        lowest = int(exponents.min())
+        bins = exponents - lowest
+        halves = [((mantissas & 0x7FFFFFF).astype(np.float64), 0),
+                  ((mantissas >> 27).astype(np.float64), 27)]
+        for half, shift in halves:
+            sums = np.bincount(bins, weights=half)
+            for b in np.flatnonzero(sums):
+                total += int(sums[b]) << (int(b) + lowest + 1073 + shift)
+    
+    # Every float is a multiple of 2**-1074, so the total is too; split it
+    # into 52-bit pieces that are each exactly representable
+    total >>= 52
+    sign = -1.0 if total < 0 else 1.0
+    total = abs(total)
+    pieces = []
+    exponent = -1074
+    while total:
+        pieces.append(sign * math.ldexp(float(total & ((1 << 52) - 1)), exponent))
+        total >>= 52
+        exponent += 52
+    return _fsum_terms(pieces)
+
+def _log2_probabilities(probabilities=None, log_probabilities=None,
+                        base: float = 2.0) -> np.ndarray:
+    """Clipped log2 probabilities (float64) from either input form."""
+    if (probabilities is None) == (log_probabilities is None):
+        raise ValueError("pass exactly one of probabilities or log_probabilities")
+    if probabilities is not None:
+        probs = np.clip(np.asarray(probabilities, dtype=np.float64), MIN_PROBABILITY, 1.0)
+        return np.log2(probs)
+    logs = np.asarray(log_probabilities, dtype=np.float64)
+    if base != 2.0:
+        logs = logs * np.log2(base)
+    return np.clip(logs, np.log2(MIN_PROBABILITY), 0.0)
+
+class PerplexityAccumulator:
+    """
+    Running perplexity over chunks of probabilities.
+    
+    Only a running sum of log2 probabilities and a token count are kept, so
+    arbitrarily large held-out sets can be scored chunk by chunk. The sum is
+    tracked exactly, which lets accumulators filled by separate workers be
+    merged into the same result as a single pass. Clipping matches
+    calculate_perplexity().
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self._log_terms = []
+        self.documents = {}
+    
+    def update(self, probabilities=None, log_probabilities=None,
+               base: float = 2.0, document=None) -> 'PerplexityAccumulator':
+        """
+        Add a chunk of token probabilities.
+        
+        Args:
+            probabilities: Array of probabilities (float32 or float64)
+            log_probabilities: Array of log-probabilities instead of probabilities
+            base: Logarithm base of log_probabilities (2, 10 or np.e)
+            document: Optional key to also track this chunk under a document
+        
+        Returns:
+            self
+        """
+        log2_probs = _log2_probabilities(probabilities, log_probabilities, base)
+        terms = _exact_sum_terms(log2_probs)
+        self._add(terms, log2_probs.size)
+        if document is not None:
+            if document not in self.documents:
+                self.documents[document] = PerplexityAccumulator()
+            self.documents[document]._add(terms, log2_probs.size)
+        return self
+    
+    def _add(self, terms: List[float], count: int):
+        self._log_terms = _fsum_terms(self._log_terms + terms)
+        self.count += count
+    
+    def merge(self, other: 'PerplexityAccumulator') -> 'PerplexityAccumulator':
+        """Fold another accumulator (e.g. from a worker process) into this one."""
+        self._add(other._log_terms, other.count)
+        for document, acc in other.documents.items():
+            if document not in self.documents:
+                self.documents[document] = PerplexityAccumulator()
+            self.documents[document].merge(acc)
+        return self
+    
+    @property
+    def log2_sum(self) -> float:
+        """Sum of clipped log2 probabilities seen so far."""
+        return math.fsum(self._log_terms)
+    
+    def perplexity(self, document=None) -> float:
+        """Perplexity over everything seen so far, or over one document."""
+        if document is not None:
+            return self.documents[document].perplexity()
+        if self.count == 0:
+            raise ValueError("no probabilities have been added")
+        return 2 ** (-self.log2_sum / self.count)
+    
+    def document_perplexities(self) -> Dict:
+        """Perplexity of every tracked document."""
+        return {document: acc.perplexity() for document, acc in self.documents.items()}
+    
+    def __repr__(self) -> str:
+        return f"PerplexityAccumulator(count={self.count})"
+
+def sentence_perplexities(lengths, probabilities=None, log_probabilities=None,
+                          base: float = 2.0) -> np.ndarray:
+    """
+    Perplexity of each sentence in a chunk of consecutive token probabilities.
+    
+    Args:
+        lengths: Number of tokens in each sentence (must sum to the chunk size)
+        probabilities: Array of probabilities
+        log_probabilities: Array of log-probabilities instead of probabilities
+        base: Logarithm base of log_probabilities
+    
+    Returns:
+        Array with one perplexity per sentence
+    """
+    log2_probs = _log2_probabilities(probabilities, log_probabilities, base).ravel()
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if lengths.sum() != len(log2_probs):
+        raise ValueError("sentence lengths must add up to the number of probabilities")
+    if (lengths <= 0).any():
+        raise ValueError("sentence lengths must be positive")
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    sums = np.add.reduceat(log2_probs, starts) if len(starts) else np.zeros(0)
+    return 2 ** (-sums / lengths)
+
+# Figure size budgets: beyond these, per-item text labels are dropped and
+# large charts switch to WebGL traces or binned heatmaps
+BAR_TEXT_LIMIT = 50
+WEBGL_BAR_THRESHOLD = 200
+HEATMAP_TEXT_LIMIT = 625
+HEATMAP_MAX_SIDE = 100
+
+def _top_word_counts(data, top_n: int,
+                     vocab: Optional[Vocabulary] = None) -> Tuple[List[str], np.ndarray]:
+    """Top words and counts from tokens, a count mapping, (words, counts) or ids."""
+    if isinstance(data, CorpusStats):
+        data = data.unigrams
+    if isinstance(data, CharNgramCounts):
+        top = data.most_common(top_n)
+    elif isinstance(data, Mapping):
+        top = heapq.nlargest(top_n, data.items(), key=itemgetter(1))
+    elif isinstance(data, tuple) and len(data) == 2 and not isinstance(data[0], str):
+        words, counts = data
+        order = top_indices(counts, top_n)
+        return [words[i] for i in order], np.asarray(counts)[order]
+    elif isinstance(data, np.ndarray):
+        if vocab is None:
+            raise ValueError("an id array needs the vocabulary that encoded it")
+        counts = np.bincount(data.astype(np.int64), minlength=len(vocab))
+        order = top_indices(counts, top_n)
+        order = order[counts[order] > 0]
+        return vocab.decode(order), counts[order]
+    else:
+        top = Counter(data).most_common(top_n)
+    
+    words = [word for word, _ in top]
+    return words, np.array([count for _, count in top], dtype=np.int64)
+
+def plot_word_frequencies(tokens, top_n: int = 20,
+                          vocab: Optional[Vocabulary] = None) -> go.Figure:
     """
     Create interactive bar chart of word frequencies.
     
     Args:
-        tokens: List of tokens
+        tokens: List of tokens, or precomputed counts: a CorpusStats, a
+            CharNgramCounts, a word->count mapping (e.g. Counter), a
+            (words, counts) tuple, or an id array with `vocab`
         top_n: Number of top words to display
+        vocab: Vocabulary for an id array
     
     Returns:
         Plotly figure
     """
-    freq = Counter(tokens)
-    top_words = freq.most_common(top_n)
+    words, counts = _top_word_counts(tokens, top_n, vocab)
     
-    words, counts = zip(*top_words)
+    if len(words) > WEBGL_BAR_THRESHOLD:
+        # Thousands of SVG bars are slow to render; draw a filled WebGL trace
+        trace = go.Scattergl(
+            x=words,
+            y=counts,
+            mode='lines',
+            fill='tozeroy',
+            line=dict(color='lightblue'),
+            hovertemplate='Word: %{x}<br>Count: %{y}<extra></extra>'
+        )
+    else:
+        trace = go.Bar(
+            x=words,
+            y=counts,
+            text=counts if len(words) <= BAR_TEXT_LIMIT else None,
+            textposition='auto',
+            marker_color='lightblue',
+            hovertemplate='Word: %{x}<br>Count: %{y}<extra></extra>'
+        )
     
-    fig = go.Figure([go.Bar(
-        x=list(words),
-        y=list(counts),
-        text=list(counts),
-        textposition='auto',
-        marker_color='lightblue',
-        hovertemplate='Word: %{x}<br>Count: %{y}<extra></extra>'
-    )])
+    fig = go.Figure([trace])
     
     fig.update_layout(
         title=f'Top {top_n} Most Frequent Words',
@@ -157,32 +2861,77 @@ def plot_word_frequencies(tokens: List[str], top_n: int = 20) -> go.Figure:
     
     return fig
 
-def plot_bigram_heatmap(tokens: List[str], top_n: int = 15) -> go.Figure:
+def _bin_matrix(matrix: np.ndarray, words: List[str],
+                max_side: int) -> Tuple[np.ndarray, List[str]]:
+    """Sum a square matrix over blocks so it is at most max_side wide."""
+    k = len(words)
+    size = -(-k // max_side)
+    n_bins = -(-k // size)
+    padded = np.zeros((n_bins * size, n_bins * size), dtype=matrix.dtype)
+    padded[:k, :k] = matrix
+    binned = padded.reshape(n_bins, size, n_bins, size).sum(axis=(1, 3))
+    labels = [f"{words[i * size]}…{words[min(k, (i + 1) * size) - 1]}"
+              for i in range(n_bins)]
+    return binned, labels
+
+def _bigram_heatmap_data(tokens, top_n: int,
+                         vocab: Optional[Vocabulary]) -> Tuple[List[str], np.ndarray]:
+    """Top words and their bigram matrix from tokens, ids or a precomputed matrix."""
+    if isinstance(tokens, CorpusStats):
+        top_words = [word for word, _ in tokens.most_common(top_n)]
+        return top_words, tokens.bigram_matrix(top_words)
+    
+    if isinstance(tokens, CharNgramCounts):
+        return tokens.transition_matrix(top_n)
+    
+    if isinstance(tokens, tuple) and len(tokens) == 2 and np.ndim(tokens[1]) == 2:
+        words, matrix = tokens
+        k = min(top_n, len(words))
+        return list(words[:k]), np.asarray(matrix)[:k, :k]
+    
+    if isinstance(tokens, np.ndarray):
+        if vocab is None:
+            raise ValueError("an id array needs the vocabulary that encoded it")
+        ids = tokens.astype(np.int64)
+        counts = np.bincount(ids, minlength=len(vocab))
+        top = top_indices(counts, top_n)
+        top = top[counts[top] > 0]
+        return vocab.decode(top), bigram_matrix(ids, top)
+    
+    # Get top words
+    freq = Counter(tokens)
+    top_words = [word for word, _ in freq.most_common(top_n)]
+    
+    # Encode tokens as positions in top_words (-1 for all other words)
+    position = {word: i for i, word in enumerate(top_words)}
+    ids = np.fromiter(map(position.get, tokens, repeat(-1)),
+                      dtype=np.int64, count=len(tokens))
+    
+    # Count bigrams with the vectorized n-gram engine
+    return top_words, bigram_matrix(ids, np.arange(len(top_words)))
+
+def plot_bigram_heatmap(tokens, top_n: int = 15,
+                        vocab: Optional[Vocabulary] = None) -> go.Figure:
     """
     Create heatmap of bigram frequencies.
     
     Args:
-        tokens: List of tokens
+        tokens: List of tokens, a CorpusStats, character bigram counts
+            (CharNgramCounts with n=2), an id array with `vocab`, or a
+            precomputed (words, matrix) tuple
         top_n: Number of top words to include
+        vocab: Vocabulary for an id array
     
     Returns:
         Plotly figure
     """
-    # Get top words
-    freq = Counter(tokens)
-    top_words = [word for word, _ in freq.most_common(top_n)]
-    
-    # Count bigrams
-    bigram_counts = defaultdict(lambda: defaultdict(int))
-    for i in range(len(tokens) - 1):
-        if tokens[i] in top_words and tokens[i+1] in top_words:
-            bigram_counts[tokens[i]][tokens[i+1]] += 1
+    top_words, matrix = _bigram_heatmap_data(tokens, top_n, vocab)
     
-    # Create matrix
-    matrix = np.zeros((top_n, top_n))
-    for i, word1 in enumerate(top_words):
-        for j, word2 in enumerate(top_words):
-            matrix[i, j] = bigram_counts[word1][word2]
+    title = 'Bigram Frequency Heatmap'
+    if len(top_words) > HEATMAP_MAX_SIDE:
+        matrix, top_words = _bin_matrix(matrix, top_words, HEATMAP_MAX_SIDE)
+        title += ' (binned)'
+    show_text = matrix.size <= HEATMAP_TEXT_LIMIT
     
     # Create heatmap
     fig = go.Figure(data=go.Heatmap(
@@ -190,14 +2939,14 @@ def plot_bigram_heatmap(tokens: List[str], top_n: int = 15) -> go.Figure:
         x=top_words,
         y=top_words,
         colorscale='Blues',
-        text=matrix.astype(int),
-        texttemplate='%{text}',
+        text=matrix.astype(int) if show_text else None,
+        texttemplate='%{text}' if show_text else None,
         textfont={"size": 8},
         hovertemplate='%{y} → %{x}<br>Count: %{z}<extra></extra>'
     ))
     
     fig.update_layout(
-        title='Bigram Frequency Heatmap',
+        title=title,
         xaxis_title='Second Word',
         yaxis_title='First Word',
         font=dict(size=10),
@@ -296,19 +3045,368 @@ def generate_text_comparison(methods_outputs: Dict[str, str]) -> go.Figure:
     
     return fig
 
+# On-disk model format: magic, header length, JSON header, aligned raw arrays
+MODEL_MAGIC = b'SUMODEL\x00'
+MODEL_FORMAT_VERSION = 1
+_MODEL_ALIGNMENT = 64
+
+def _is_plain_instance(model) -> bool:
+    """
+    True for an ordinary object whose state is exactly its __dict__.
+    
+    Containers (dict, list, set subclasses such as Counter or OrderedDict)
+    and classes that customise pickling keep state elsewhere, so rebuilding
+    them from __dict__ alone would lose data.
+    """
+    cls = type(model)
+    if isinstance(model, (type, dict, list, set, frozenset, tuple)):
+        return False
+    if not hasattr(model, '__dict__'):
+        return False
+    # Empty __slots__ (as on the collections.abc bases) hold no state
+    if any(c.__dict__.get('__slots__') for c in cls.__mro__):
+        return False
+    for name in ('__getstate__', '__setstate__', '__reduce__', '__reduce_ex__'):
+        if getattr(cls, name, None) is not getattr(object, name, None):
+            return False
+    return True
+
+def _split_model_state(model) -> Tuple[str, Dict[str, np.ndarray], object]:
+    """Separate numeric arrays (stored raw) from the rest of a model (pickled)."""
+    def is_raw(value):
+        return isinstance(value, np.ndarray) and not value.dtype.hasobject
+    
+    if is_raw(model):
+        return 'ndarray', {'__array__': model}, None
+    if type(model) is dict and all(isinstance(k, str) for k in model):
+        arrays = {k: v for k, v in model.items() if is_raw(v)}
+        rest = {k: v for k, v in model.items() if k not in arrays}
+        return 'dict', arrays, rest
+    if _is_plain_instance(model):
+        cls = type(model)
+        arrays = {k: v for k, v in vars(model).items() if is_raw(v)}
+        rest = {k: v for k, v in vars(model).items() if k not in arrays}
+        return f"{cls.__module__}:{cls.__qualname__}", arrays, rest
+    return 'pickle', {}, model
+
+def _write_model(model, filename: str):
+    """Write a model in the save_model() format without printing."""
+    kind, arrays, rest = _split_model_state(model)
+    blob = pickle.dumps(rest, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    # Lay out segments after the header
+    header = {'format_version': MODEL_FORMAT_VERSION, 'type': kind, 'arrays': {}}
+    if kind == 'dict':
+        header['keys'] = list(model)
+    offset = 0
+    layout = []
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        header['arrays'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                                  'offset': offset}
+        layout.append((offset, arr))
+        offset += -(-arr.nbytes // _MODEL_ALIGNMENT) * _MODEL_ALIGNMENT
+    header['pickle'] = {'offset': offset, 'length': len(blob)}
+    
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix = len(MODEL_MAGIC) + 8 + len(header_bytes)
+    data_start = -(-prefix // _MODEL_ALIGNMENT) * _MODEL_ALIGNMENT
+    header_bytes += b' ' * (data_start - prefix)
+    
+    # Write to a temporary file first so readers never see a partial model
+    tmp_file = _temp_path(filename)
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(MODEL_MAGIC)
+            f.write(len(header_bytes).to_bytes(8, 'little'))
+            f.write(header_bytes)
+            for seg_offset, arr in layout:
+                f.seek(data_start + seg_offset)
+                f.write(memoryview(arr).cast('B') if arr.nbytes else b'')
+            f.seek(data_start + offset)
+            f.write(blob)
+        os.replace(tmp_file, filename)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
 def save_model(model, filename: str):
-    """Save a model to disk using pickle."""
-    with open(filename, 'wb') as f:
-        pickle.dump(model, f)
+    """
+    Save a model to disk.
+    
+    NumPy arrays held by the model (the attributes of an ordinary object, or
+    the values of a plain dict with string keys) are written as raw, aligned
+    segments after a small JSON header so that load_model() can memory-map
+    them. Everything else, including dict subclasses such as Counter and
+    objects that customise pickling, is pickled whole.
+    """
+    _write_model(model, filename)
     print(f"Model saved to {filename}")
 
-def load_model(filename: str):
-    """Load a model from disk."""
+def _read_model(filename: str, mmap: bool = True):
+    """Rebuild a model written by save_model(); None if the file is a plain pickle."""
     with open(filename, 'rb') as f:
-        model = pickle.load(f)
+        if f.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            return None
+        header_len = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        data_start = len(MODEL_MAGIC) + 8 + header_len
+        if header['format_version'] > MODEL_FORMAT_VERSION:
+            raise ValueError(f"{filename} uses model format "
+                             f"{header['format_version']}, newer than this version")
+        
+        f.seek(data_start + header['pickle']['offset'])
+        rest = pickle.loads(f.read(header['pickle']['length']))
+        
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            count = int(np.prod(shape))
+            if count == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            elif mmap:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                                         offset=data_start + spec['offset'])
+            else:
+                f.seek(data_start + spec['offset'])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+    
+    kind = header['type']
+    if kind == 'pickle':
+        return rest
+    if kind == 'ndarray':
+        return arrays['__array__']
+    if kind == 'dict':
+        return {key: arrays[key] if key in arrays else rest[key] for key in header['keys']}
+    module_name, qualname = kind.split(':')
+    cls = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        cls = getattr(cls, part)
+    model = cls.__new__(cls)
+    model.__dict__.update(rest)
+    model.__dict__.update(arrays)
+    return model
+
+def load_model(filename: str, mmap: bool = True):
+    """
+    Load a model from disk.
+    
+    Arrays saved by save_model() are memory-mapped read-only by default, so
+    loading is fast and processes that open the same file share its pages.
+    Files written with plain pickle are still supported.
+    
+    Args:
+        filename: Model file
+        mmap: Memory-map arrays instead of reading them into RAM
+    """
+    model = _read_model(filename, mmap)
+    if model is None:
+        with open(filename, 'rb') as f:
+            model = pickle.load(f)
     print(f"Model loaded from {filename}")
     return model
 
+# Directory for derived corpus artifacts (override with SHAKESPEARE_CACHE_DIR)
+DEFAULT_CACHE_DIR = os.environ.get('SHAKESPEARE_CACHE_DIR', '.shakespeare_cache')
+DEFAULT_CACHE_BYTES = 1 << 30
+
+def text_digest(text: str) -> str:
+    """SHA-256 hex digest of a text, used to key cached artifacts."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ArtifactCache:
+    """
+    Content-addressed, size-bounded cache of derived corpus artifacts.
+    
+    Entries are keyed by a hash of the input text, the artifact kind and its
+    parameters, stored in the save_model() format and memory-mapped on a
+    hit. Writes are atomic. When the directory grows past max_bytes the least
+    recently used entries are evicted.
+    """
+    
+    SUFFIX = '.artifact'
+    
+    def __init__(self, cache_dir: Optional[str] = None,
+                 max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        Args:
+            cache_dir: Directory for cache entries (defaults to DEFAULT_CACHE_DIR)
+            max_bytes: Total size budget for all entries
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(digest: str, kind: str, **params) -> str:
+        """Cache key for an artifact of `kind` derived from text with `digest`."""
+        spec = json.dumps({'text': digest, 'kind': kind, 'params': params}, sort_keys=True)
+        return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+    
+    def path(self, key: str) -> str:
+        """File that holds (or would hold) the entry for `key`."""
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+    
+    def get(self, key: str):
+        """
+        Return the cached artifact for `key`, or None on a miss.
+        
+        A missing, truncated or otherwise unreadable entry counts as a miss;
+        a damaged file is removed so the next put() replaces it.
+        """
+        filename = self.path(key)
+        try:
+            artifact = _read_model(filename)
+        except FileNotFoundError:
+            artifact = None
+        except (OSError, ValueError, MemoryError, EOFError, KeyError,
+                ImportError, AttributeError, pickle.UnpicklingError):
+            artifact = None
+            self._remove(filename)
+        else:
+            if artifact is None:
+                # Not in the save_model() format, so not written by put()
+                self._remove(filename)
+        if artifact is None:
+            self.misses += 1
+            return None
+        # Touch the entry so LRU eviction sees it as recently used; it may
+        # already have been evicted by another process
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        self.hits += 1
+        return artifact
+    
+    @staticmethod
+    def _remove(filename: str) -> bool:
+        """
+        Delete an entry file; False if it is still there.
+        
+        On Windows a file that is memory-mapped (by this or another process)
+        cannot be deleted; it is skipped and a later evict() tries again.
+        """
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        return True
+    
+    def put(self, key: str, artifact):
+        """Store an artifact atomically and evict old entries if over budget."""
+        filename = self.path(key)
+        try:
+            _write_model(artifact, filename)
+        except PermissionError:
+            # Windows cannot replace an entry that is memory-mapped; entries are
+            # content-addressed, so the one in place already holds this artifact
+            if not os.path.exists(filename):
+                raise
+        self.evict()
+    
+    def get_or_compute(self, text: str, kind: str, compute, **params):
+        """
+        Fetch an artifact derived from `text`, computing and storing it on a miss.
+        
+        Args:
+            text: Source text the artifact is derived from
+            kind: Artifact name, e.g. 'tokens' or 'ngrams'
+            compute: Zero-argument function that builds the artifact
+            **params: Parameters the artifact depends on
+        """
+        key = self.make_key(text_digest(text), kind, **params)
+        artifact = self.get(key)
+        if artifact is None:
+            artifact = compute()
+            self.put(key, artifact)
+        return artifact
+    
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """(path, size, last use) of every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.SUFFIX):
+                continue
+            filename = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            entries.append((filename, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+    
+    def size(self) -> int:
+        """Total bytes used by cache entries."""
+        return sum(size for _, size, _ in self.entries())
+    
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for filename, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(filename):
+                total -= size
+    
+    def clear(self):
+        """Remove every entry."""
+        for filename, _, _ in self.entries():
+            self._remove(filename)
+
+def cached_encoded_tokens(text: str, keep_punctuation: bool = False,
+                          cache: Optional[ArtifactCache] = None) -> Tuple[Vocabulary, np.ndarray]:
+    """
+    Tokenize and encode a text once, then serve it from the cache.
+    
+    Returns:
+        (vocab, ids): a Vocabulary of every token (min_freq=1) and the
+        encoded corpus, memory-mapped from the cache
+    """
+    cache = cache or ArtifactCache()
+    
+    def compute():
+        tokens = tokenize(text, keep_punctuation)
+        vocab = create_vocabulary(tokens, min_freq=1)
+        return {'vocab': vocab, 'ids': vocab.encode(tokens)}
+    
+    entry = cache.get_or_compute(text, 'tokens', compute,
+                                 keep_punctuation=keep_punctuation)
+    return entry['vocab'], entry['ids']
+
+def cached_vocabulary(text: str, min_freq: int = 2, keep_punctuation: bool = False,
+                      cache: Optional[ArtifactCache] = None) -> Vocabulary:
+    """create_vocabulary(tokenize(text, keep_punctuation), min_freq), cached."""
+    cache = cache or ArtifactCache()
+    return cache.get_or_compute(
+        text, 'vocabulary',
+        lambda: create_vocabulary(tokenize(text, keep_punctuation), min_freq),
+        keep_punctuation=keep_punctuation, min_freq=min_freq)
+
+def cached_ngram_counts(text: str, n: int = 2, keep_punctuation: bool = False,
+                        cache: Optional[ArtifactCache] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    count_ngrams() over the cached encoding of a text.
+    
+    The ids refer to the vocabulary returned by cached_encoded_tokens().
+    """
+    cache = cache or ArtifactCache()
+    
+    def compute():
+        vocab, ids = cached_encoded_tokens(text, keep_punctuation, cache)
+        ngrams, counts = count_ngrams(ids, n, len(vocab))
+        return {'ngrams': ngrams, 'counts': counts}
+    
+    entry = cache.get_or_compute(text, 'ngrams', compute,
+                                 keep_punctuation=keep_punctuation, n=n)
+    return entry['ngrams'], entry['counts']
+
 # Color scheme for consistency
 COLORS = {
     'primary': '#1f77b4',
@@ -323,4 +3421,197 @@ def print_section_header(title: str):
     """Print a formatted section header."""
     print("\n" + "="*60)
     print(f" {title}")
-    print("="*60 + "\n")
\ No newline at end of file
+    print("="*60 + "\n")
+
+# Profiling: off by default. When enabled, public functions and methods of
+# this module are swapped for instrumented wrappers; disabling restores the
+# originals, so there is no overhead at all while profiling is off.
+PROFILE_ENV_VAR = 'SHAKESPEARE_PROFILE'
+_PROFILING_API = {'enable_profiling', 'disable_profiling', 'profiling',
+                  'profile_stats', 'profile_report', 'reset_profile',
+                  'print_section_header'}
+_profile_stats = {}
+_profile_lock = threading.Lock()
+_profile_local = threading.local()
+_profile_state = {'originals': None, 'depth': 0, 'memory': False, 'callbacks': []}
+
+def _input_size(args: tuple) -> Optional[int]:
+    """Size of the first argument: array size or len(), if it has one."""
+    if not args:
+        return None
+    first = args[0]
+    if isinstance(first, np.ndarray):
+        return int(first.size)
+    try:
+        return len(first)
+    except TypeError:
+        return None
+
+def _record_call(name: str, seconds: float, size: Optional[int], peak: Optional[int]):
+    with _profile_lock:
+        stats = _profile_stats.setdefault(name, {
+            'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            'total_input_size': 0, 'peak_bytes': 0})
+        stats['calls'] += 1
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['total_input_size'] += size or 0
+        if peak is not None:
+            stats['peak_bytes'] = max(stats['peak_bytes'], peak)
+        callbacks = list(_profile_state['callbacks'])
+    record = {'name': name, 'seconds': seconds, 'input_size': size, 'peak_bytes': peak}
+    for callback in callbacks:
+        callback(record)
+
+def _instrument(func, name: str, skip_self: bool):
+    """Wrap a function so each call is timed (and memory-traced if enabled)."""
+    def wrapper(*args, **kwargs):
+        size = _input_size(args[1:] if skip_self else args)
+        trace = _profile_state['memory'] and tracemalloc.is_tracing()
+        if trace:
+            # Nested calls reset the peak counter, so carry the parent's peak over
+            stack = getattr(_profile_local, 'stack', None)
+            if stack is None:
+                stack = _profile_local.stack = []
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = None
+            if trace:
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                stack.pop()
+                peak_bytes = frame[1] - frame[0]
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], frame[1])
+                tracemalloc.reset_peak()
+            _record_call(name, seconds, size, peak_bytes)
+    
+    wrapper.__name__ = getattr(func, '__name__', name)
+    wrapper.__qualname__ = getattr(func, '__qualname__', name)
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+def _profile_targets():
+    """(owner, attribute, original, report name) for every public callable."""
+    module = sys.modules[__name__]
+    for name, obj in list(vars(module).items()):
+        if name.startswith('_') or name in _PROFILING_API:
+            continue
+        if isinstance(obj, types.FunctionType) and obj.__module__ == __name__:
+            yield module, name, obj, name
+        elif isinstance(obj, type) and obj.__module__ == __name__:
+            for attr, member in list(vars(obj).items()):
+                if attr.startswith('_'):
+                    continue
+                if isinstance(member, (types.FunctionType, classmethod, staticmethod)):
+                    yield obj, attr, member, f"{name}.{attr}"
+
+def enable_profiling(memory: bool = False, callback=None):
+    """
+    Start recording call counts, wall time, input sizes and (optionally) memory.
+    
+    Only calls made through the module (su.tokenize, methods of its classes,
+    and calls between its own functions) are seen; names imported with
+    `from shakespeare_utils import ...` before enabling are not instrumented.
+    
+    Args:
+        memory: Also trace peak allocated memory per call with tracemalloc
+            (much slower)
+        callback: Function called with a dict for every recorded call
+    """
+    with _profile_lock:
+        if callback is not None:
+            _profile_state['callbacks'].append(callback)
+        _profile_state['depth'] += 1
+        if memory and not _profile_state['memory']:
+            _profile_state['memory'] = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _profile_state['started_tracemalloc'] = True
+        if _profile_state['originals'] is not None:
+            return
+        originals = []
+        for owner, attr, member, name in _profile_targets():
+            if isinstance(member, classmethod):
+                wrapped = classmethod(_instrument(member.__func__, name, skip_self=True))
+            elif isinstance(member, staticmethod):
+                wrapped = staticmethod(_instrument(member.__func__, name, skip_self=False))
+            else:
+                wrapped = _instrument(member, name, skip_self=isinstance(owner, type))
+            originals.append((owner, attr, member))
+            setattr(owner, attr, wrapped)
+        _profile_state['originals'] = originals
+
+def disable_profiling():
+    """Undo one enable_profiling() call; the last one restores the originals."""
+    with _profile_lock:
+        if _profile_state['depth'] == 0:
+            return
+        _profile_state['depth'] -= 1
+        if _profile_state['depth'] > 0:
+            return
+        for owner, attr, member in _profile_state['originals'] or []:
+            setattr(owner, attr, member)
+        _profile_state['originals'] = None
+        _profile_state['callbacks'] = []
+        if _profile_state['memory'] and _profile_state.pop('started_tracemalloc', False):
+            tracemalloc.stop()
+        _profile_state['memory'] = False
+
+@contextmanager
+def profiling(memory: bool = False, callback=None, reset: bool = True):
+    """
+    Profile the calls made inside a `with` block.
+    
+    Example:
+        with profiling(memory=True):
+            vocab = create_vocabulary(tokenize(text))
+        print(profile_report())
+    """
+    if reset:
+        reset_profile()
+    enable_profiling(memory, callback)
+    try:
+        yield _profile_stats
+    finally:
+        disable_profiling()
+
+def reset_profile():
+    """Forget all recorded calls."""
+    with _profile_lock:
+        _profile_stats.clear()
+
+def profile_stats() -> Dict[str, Dict]:
+    """Copy of the recorded statistics, keyed by function name."""
+    with _profile_lock:
+        return {name: dict(stats) for name, stats in _profile_stats.items()}
+
+def profile_report(as_json: bool = False) -> str:
+    """
+    Recorded statistics as a text table (slowest total time first) or JSON.
+    """
+    stats = profile_stats()
+    if as_json:
+        return json.dumps(stats, indent=2, sort_keys=True)
+    
+    header = f"{'function':<36} {'calls':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'input':>12} {'peak MB':>9}"
+    lines = [header, '-' * len(header)]
+    for name, row in sorted(stats.items(), key=lambda item: -item[1]['total_seconds']):
+        lines.append(f"{name:<36} {row['calls']:>7} {row['total_seconds']:>10.4f} "
+                     f"{row['total_seconds'] / row['calls'] * 1000:>10.3f} "
+                     f"{row['max_seconds'] * 1000:>10.3f} {row['total_input_size']:>12} "
+                     f"{row['peak_bytes'] / 2**20:>9.2f}")
+    return '\n'.join(lines)
+
+if os.environ.get(PROFILE_ENV_VAR):
+    enable_profiling(memory=os.environ[PROFILE_ENV_VAR].lower() == 'memory')
+    atexit.register(lambda: print(profile_report(), file=sys.stderr))
@@ -0,0 +1,26 @@
+"""Make the top-level modules importable when pytest is run from anywhere,
+and skip wall-clock benchmarks unless --run-slow is given."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true',
+                     help='also run wall-clock benchmarks marked slow')
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: wall-clock benchmark, needs --run-slow')
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason='wall-clock benchmark; run with --run-slow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,126 @@
+"""ArtifactCache hits, misses, eviction and recovery from damaged entries."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+TEXT = "shall i compare thee to a summer's day thou art more lovely " * 20
+
+@pytest.fixture
+def cache(tmp_path):
+    return su.ArtifactCache(str(tmp_path / 'cache'))
+
+def test_get_or_compute_hits_after_first_call(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'ids': np.arange(5)}
+
+    first = cache.get_or_compute(TEXT, 'ids', compute, n=1)
+    second = cache.get_or_compute(TEXT, 'ids', compute, n=1)
+    assert len(calls) == 1
+    assert np.array_equal(first['ids'], second['ids'])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get_or_compute(TEXT, 'ids', compute, n=2)
+    assert len(calls) == 2
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:len(su.MODEL_MAGIC) + 3],   # truncated header length
+    lambda data: data[:len(su.MODEL_MAGIC)] + (1 << 62).to_bytes(8, 'little') + data[16:],
+    lambda data: data[:len(data) // 2],             # truncated arrays and pickle
+    lambda data: data[:-5],                         # truncated pickle
+    lambda data: data[:20] + b'\xff' * 10 + data[30:],   # garbage header JSON
+    lambda data: b'not a model at all',
+])
+def test_damaged_entry_is_a_miss_and_recomputed(cache, damage):
+    key = cache.make_key(su.text_digest(TEXT), 'ids')
+    cache.put(key, {'ids': np.arange(1000), 'meta': list(range(50))})
+    filename = cache.path(key)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    with open(filename, 'wb') as f:
+        f.write(damage(data))
+
+    assert cache.get(key) is None
+    assert cache.misses == 1 and cache.hits == 0
+    assert not os.path.exists(filename)
+
+    entry = cache.get_or_compute(TEXT, 'ids', lambda: {'ids': np.arange(3)})
+    assert np.array_equal(entry['ids'], np.arange(3))
+    assert np.array_equal(cache.get(key)['ids'], np.arange(3))
+
+def test_entry_evicted_after_read_still_hits(cache, monkeypatch):
+    key = cache.make_key(su.text_digest(TEXT), 'ids')
+    cache.put(key, {'ids': np.arange(4)})
+
+    def evicted(filename, *args, **kwargs):
+        raise FileNotFoundError(filename)
+
+    monkeypatch.setattr(su.os, 'utime', evicted)
+    assert list(cache.get(key)['ids']) == [0, 1, 2, 3]
+    assert cache.hits == 1
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    cache = su.ArtifactCache(str(tmp_path / 'cache'), max_bytes=30_000)
+    keys = [cache.make_key('digest', 'block', i=i) for i in range(5)]
+    for i, key in enumerate(keys):
+        cache.put(key, {'block': np.full(1000, i, dtype=np.int64)})
+        os.utime(cache.path(key), (i, i))
+    cache.put(cache.make_key('digest', 'block', i=5), {'block': np.zeros(1000, np.int64)})
+    assert cache.size() <= 30_000
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) is not None
+
+def test_concurrent_puts_of_one_key(cache):
+    key = cache.make_key('digest', 'block')
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: cache.put(key, {'block': np.full(1000, 7)}), range(16)))
+    assert os.listdir(cache.cache_dir) == [os.path.basename(cache.path(key))]
+    assert (cache.get(key)['block'] == 7).all()
+
+def test_locked_entries_are_skipped_and_evicted_later(tmp_path, monkeypatch):
+    cache = su.ArtifactCache(str(tmp_path / 'cache'), max_bytes=45_000)
+    keys = [cache.make_key('digest', 'block', i=i) for i in range(7)]
+    for i, key in enumerate(keys[:5]):
+        cache.put(key, {'block': np.full(1000, i, dtype=np.int64)})
+        os.utime(cache.path(key), (i, i))
+    # Windows refuses to delete a file that is still memory-mapped
+    locked = {cache.path(keys[0])}
+    remove = os.remove
+
+    def guarded_remove(filename):
+        if filename in locked:
+            raise PermissionError(filename)
+        remove(filename)
+
+    monkeypatch.setattr(su.os, 'remove', guarded_remove)
+    cache.put(keys[5], {'block': np.zeros(1000, np.int64)})
+    assert os.path.exists(cache.path(keys[0]))
+    assert not os.path.exists(cache.path(keys[1]))
+    assert cache.size() <= 45_000
+
+    locked.clear()
+    cache.put(keys[6], {'block': np.zeros(1000, np.int64)})
+    assert not os.path.exists(cache.path(keys[0]))
+    assert os.path.exists(cache.path(keys[2])) and cache.size() <= 45_000
+
+def test_put_over_a_mapped_entry_keeps_it(cache, monkeypatch):
+    key = cache.make_key('digest', 'block')
+    cache.put(key, {'block': np.full(10, 3)})
+    replace = os.replace
+
+    def guarded_replace(src, dst):
+        if dst == cache.path(key):
+            raise PermissionError(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(su.os, 'replace', guarded_replace)
+    cache.put(key, {'block': np.full(10, 3)})
+    assert os.listdir(cache.cache_dir) == [os.path.basename(cache.path(key))]
+    assert (cache.get(key)['block'] == 3).all()
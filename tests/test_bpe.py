@@ -0,0 +1,89 @@
+"""BPETokenizer: heap training against a plain re-count, round trips, LRU cache."""
+
+import os
+from collections import Counter
+
+import pytest
+
+import shakespeare_utils as su
+
+SONNETS = os.path.join(su.__file__.rsplit(os.sep, 1)[0], 'shakespeare_sonnets.txt')
+
+@pytest.fixture(scope='module')
+def text():
+    with open(SONNETS, encoding='utf-8') as f:
+        return f.read()
+
+def reference_merges(freq, num_merges, min_frequency=2):
+    """Recount every pair after each merge; ties go to the lowest symbol ids."""
+    symbols, words = [], []
+    for word, count in freq.items():
+        pieces = list(word[:-1]) + [word[-1] + su.END_OF_WORD]
+        for piece in pieces:
+            if piece not in symbols:
+                symbols.append(piece)
+        words.append(([symbols.index(p) for p in pieces], count))
+    merges = []
+    while len(merges) < num_merges:
+        pairs = Counter()
+        for ids, count in words:
+            for pair in zip(ids, ids[1:]):
+                pairs[pair] += count
+        if not pairs:
+            break
+        best = min(pairs, key=lambda pair: (-pairs[pair], pair))
+        if pairs[best] < min_frequency:
+            break
+        symbols.append(symbols[best[0]] + symbols[best[1]])
+        merges.append((symbols[best[0]], symbols[best[1]]))
+        merged_words = []
+        for ids, count in words:
+            merged, j = [], 0
+            while j < len(ids):
+                if tuple(ids[j:j + 2]) == best:
+                    merged.append(len(symbols) - 1)
+                    j += 2
+                else:
+                    merged.append(ids[j])
+                    j += 1
+            merged_words.append((merged, count))
+        words = merged_words
+    return merges
+
+def test_small_corpus_merges_in_a_fixed_order():
+    freq = {'low': 5, 'lower': 2, 'newest': 6, 'widest': 3}
+    bpe = su.BPETokenizer.train(freq, 10)
+    assert bpe.merges == reference_merges(freq, 10)
+    # Equal counts go to the earliest-seen symbols: ('w', 'est</w>') beats ('n', 'e')
+    assert bpe.merges == [('e', 's'), ('es', 't</w>'), ('l', 'o'), ('w', 'est</w>'),
+                          ('e', 'west</w>'), ('n', 'ewest</w>'), ('lo', 'w</w>'),
+                          ('w', 'i'), ('d', 'est</w>'), ('wi', 'dest</w>')]
+    assert su.BPETokenizer.train(dict(freq), 10).merges == bpe.merges
+
+def test_heap_training_matches_recounting(text):
+    freq = Counter(su.tokenize(text)[:3000])
+    assert su.BPETokenizer.train(freq, 200).merges == reference_merges(freq, 200)
+
+def test_min_frequency_stops_training():
+    freq = {'abab': 1, 'cd': 3}
+    assert su.BPETokenizer.train(freq, 10, min_frequency=3).merges == [('c', 'd</w>')]
+
+def test_round_trip(text):
+    bpe = su.BPETokenizer.train(text, 500)
+    words = su.tokenize(text)
+    ids = bpe.encode(text)
+    assert len(ids) < sum(len(word) for word in words)
+    assert bpe.decode(ids) == ' '.join(words)
+    # Unseen words made of known characters still round-trip
+    assert bpe.decode(bpe.encode("thee summerless loveliest")) == "thee summerless loveliest"
+    assert ''.join(bpe.tokenize("loveliest")).replace(su.END_OF_WORD, '') == "loveliest"
+
+def test_lru_cache():
+    trained = su.BPETokenizer.train({'low': 5, 'lower': 2, 'newest': 6}, 10)
+    bpe = su.BPETokenizer(trained.merges, trained.vocab, cache_size=2)
+    for word in ['low', 'newest', 'low', 'lower']:
+        assert bpe.encode_word(word) == bpe._encode_uncached(word)
+    assert (bpe.cache_hits, bpe.cache_misses) == (1, 3)
+    assert list(bpe._cache) == ['low', 'lower']
+    bpe.encode_word('newest')
+    assert bpe.cache_misses == 4 and list(bpe._cache) == ['lower', 'newest']
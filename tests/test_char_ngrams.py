@@ -0,0 +1,51 @@
+"""count_char_ngrams must match a plain-Python count for any chunk size."""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+# 1-, 2-, 3- and 4-byte UTF-8 characters
+ALPHABET = "ab Ée\né€漢😀"
+
+def random_texts(count, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(list(ALPHABET), int(rng.integers(0, 40))))
+
+def reference(text, n, unit='char'):
+    if unit == 'byte':
+        data = text.encode('utf-8')
+        return Counter(data[i:i + n].decode('utf-8', errors='backslashreplace')
+                       for i in range(len(data) - n + 1))
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 4, 5, 9, 1 << 16])
+def test_char_counts_match_reference(chunk_size):
+    for text in random_texts(30, seed=chunk_size):
+        for n in (1, 2, 3):
+            counts = su.count_char_ngrams(text.encode('utf-8'), n, chunk_size=chunk_size)
+            assert dict(counts.most_common()) == reference(text, n), (text, n)
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7])
+def test_byte_counts_and_files(tmp_path, chunk_size):
+    path = tmp_path / 'text.txt'
+    for text in random_texts(20, seed=100 + chunk_size):
+        path.write_bytes(text.encode('utf-8'))
+        counts = su.count_char_ngrams(str(path), 2, unit='byte', chunk_size=chunk_size)
+        assert dict(counts.most_common()) == reference(text, 2, 'byte')
+        lowered = su.count_char_ngrams(str(path), 2, lowercase=True, chunk_size=chunk_size)
+        assert dict(lowered.most_common()) == reference(text.lower(), 2)
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5])
+def test_chunks_end_on_character_boundaries(chunk_size):
+    data = "a😀é漢b".encode('utf-8')
+    chunks = [bytes(chunk) for chunk in su._utf8_chunks(data, chunk_size)]
+    assert b''.join(chunks) == data
+    assert all(chunk.decode('utf-8') for chunk in chunks)
+
+def test_chunk_size_must_be_positive():
+    with pytest.raises(ValueError):
+        su.count_char_ngrams(b"abc", 2, chunk_size=0)
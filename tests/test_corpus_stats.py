@@ -0,0 +1,41 @@
+"""CorpusStats sliding-window updates against counting from scratch."""
+
+import pytest
+
+import shakespeare_utils as su
+
+TOKENS = ("shall i compare thee to a summer s day thou art more lovely "
+          "and more temperate rough winds do shake the darling buds of may").split()
+
+def snapshot(stats):
+    return (dict(stats.unigrams), dict(stats.bigrams), stats.first_token, stats.last_token)
+
+@pytest.mark.parametrize('as_stats', [False, True])
+def test_add_then_remove_restores_earlier_counts(as_stats):
+    old, window = TOKENS[:5], TOKENS[5:15]
+    stats = su.CorpusStats.from_tokens(window)
+    before = snapshot(stats)
+
+    stats = su.CorpusStats.from_tokens(old).add_tokens(window)
+    chunk = su.CorpusStats.from_tokens(old) if as_stats else old
+    stats.remove(chunk, following=window[0])
+    assert snapshot(stats) == before
+
+def test_sliding_window_matches_recount():
+    size, step = 12, 4
+    stats = su.CorpusStats.from_tokens(TOKENS[:size])
+    for start in range(step, len(TOKENS) - size + 1, step):
+        stats.add_tokens(TOKENS[start + size - step:start + size])
+        stats.remove(TOKENS[start - step:start], following=TOKENS[start])
+        assert snapshot(stats) == snapshot(
+            su.CorpusStats.from_tokens(TOKENS[start:start + size]))
+
+def test_remove_requires_following_while_tokens_remain():
+    stats = su.CorpusStats.from_tokens(TOKENS)
+    before = snapshot(stats)
+    with pytest.raises(ValueError, match='following'):
+        stats.remove(TOKENS[:3])
+    assert snapshot(stats) == before
+
+    stats.remove(TOKENS)
+    assert snapshot(stats) == ({}, {}, None, None)
@@ -0,0 +1,41 @@
+"""Weighted CountMinSketch.add() and hashing vocabularies built from counts."""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+TOKENS = ("shall i compare thee to a summer s day thou art more lovely "
+          "and more temperate rough winds do shake the darling buds of may").split() * 7
+
+def test_weighted_add_matches_repeated_tokens():
+    counts = Counter(TOKENS)
+    repeated = su.CountMinSketch(width=64, depth=3).add(TOKENS)
+    weighted = su.CountMinSketch(width=64, depth=3).add(list(counts), list(counts.values()))
+    np.testing.assert_array_equal(weighted.table, repeated.table)
+    assert (weighted.estimate(list(counts)) >= list(counts.values())).all()
+
+def test_weighted_add_rejects_bad_counts():
+    sketch = su.CountMinSketch(width=16, depth=2)
+    with pytest.raises(ValueError):
+        sketch.add(['a', 'b'], [1])
+    with pytest.raises(ValueError):
+        sketch.add(['a'], [-1])
+
+def test_create_vocabulary_from_stats_matches_tokens():
+    stats = su.CorpusStats.from_tokens(TOKENS + ['rare'])
+    from_stats = su.create_vocabulary(stats, min_freq=3, num_buckets=100)
+    from_tokens = su.create_vocabulary(TOKENS + ['rare'], min_freq=3, num_buckets=100)
+    np.testing.assert_array_equal(from_stats.sketch.table, from_tokens.sketch.table)
+    words = ['shall', 'rare', 'unseen']
+    np.testing.assert_array_equal(from_stats.encode(words), from_tokens.encode(words))
+    assert from_stats['rare'] == su.UNK_ID and from_stats['shall'] != su.UNK_ID
+
+def test_large_counts_are_not_expanded():
+    stats = su.CorpusStats()
+    stats.unigrams.update({'the': 10 ** 9, 'and': 3})
+    vocab = su.create_vocabulary(stats, min_freq=5, num_buckets=50)
+    assert vocab.sketch.estimate(['the'])[0] == 10 ** 9
+    assert vocab['and'] == su.UNK_ID
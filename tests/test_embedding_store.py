@@ -0,0 +1,38 @@
+"""Exact EmbeddingStore.search() against a brute-force reference."""
+
+import numpy as np
+
+import shakespeare_utils as su
+
+def brute_force(store, queries, k, exclude):
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    sims = queries @ store.vectors.T
+    ids, best = [], []
+    for row, skip in zip(sims, exclude):
+        row = row.copy()
+        row[:len(su.SPECIAL_TOKENS)] = -np.inf
+        row[skip] = -np.inf
+        order = np.argsort(-row, kind='stable')[:k]
+        ids.append(order)
+        best.append(row[order])
+    return np.array(ids), np.array(best)
+
+def test_search_matches_brute_force_across_block_budgets():
+    rng = np.random.default_rng(0)
+    store = su.EmbeddingStore(rng.normal(size=(300, 16)))
+    queries = rng.normal(size=(25, 16))
+    exclude = rng.integers(0, 300, size=(25, 3))
+    expected_ids, expected_sims = brute_force(store, queries, 7, exclude)
+    for block_bytes in (1, 4 * 300 * 4, su.SEARCH_BLOCK_BYTES):
+        ids, sims = store.search(queries, k=7, exclude=exclude, block_bytes=block_bytes)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(sims, expected_sims, rtol=1e-6)
+        assert (np.diff(sims, axis=1) <= 0).all()
+
+def test_search_k_bounds():
+    store = su.EmbeddingStore(np.eye(6))
+    ids, sims = store.search(np.eye(6)[4:], k=0)
+    assert ids.shape == sims.shape == (2, 0)
+    ids, sims = store.search(np.eye(6)[4:], k=50)
+    assert ids.shape == (2, 6)
+    assert ids[0, 0] == 4 and ids[1, 0] == 5
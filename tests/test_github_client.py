@@ -0,0 +1,130 @@
+"""GitHubClient against a fake GitHub API served on localhost."""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("git")
+pytest.importorskip("requests")
+import quantlet_auto_submit as qas
+
+USER = {"login": "tester", "name": "Test Author"}
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    """Answers a handful of GitHub endpoints and records every request."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, **headers):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), str(value))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.seen.append(("GET", self.path, self.headers.get("If-None-Match")))
+        if self.path == "/user":
+            time.sleep(0.05)  # keep concurrent first lookups overlapping
+            self.reply(200, USER, ETag='"user-1"')
+        elif self.path == "/repos/tester/cached":
+            if self.headers.get("If-None-Match") == '"repo-1"':
+                self.reply(304, ETag='"repo-1"')
+            else:
+                self.reply(200, {"html_url": "https://github.com/tester/cached"}, ETag='"repo-1"')
+        elif self.path == "/repos/tester/limited":
+            with server.lock:
+                server.limited_left -= 1
+                limited = server.limited_left >= 0
+            if limited:
+                self.reply(403, {"message": "secondary rate limit"}, Retry_After=0)
+            else:
+                self.reply(200, {"html_url": "https://github.com/tester/limited"})
+        else:
+            self.reply(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.seen.append(("POST", self.path, payload))
+        if self.path == "/user/repos":
+            self.reply(201, {"html_url": f"https://github.com/tester/{payload['name']}"})
+        else:
+            self.reply(422, {"message": "Validation Failed"})
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+    server.lock = threading.Lock()
+    server.seen = []
+    server.limited_left = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_client(server, **kwargs):
+    return qas.GitHubClient("secret", base_url=f"http://127.0.0.1:{server.server_port}",
+                            bucket=qas.TokenBucket(rate=1000, capacity=100), **kwargs)
+
+def test_etag_revalidation_serves_cached_body(server):
+    client = make_client(server)
+    first = client.get_repo("tester/cached")
+    second = client.get_repo("tester/cached")
+    assert first == second == {"html_url": "https://github.com/tester/cached"}
+    assert [etag for _, _, etag in server.seen] == [None, '"repo-1"']
+    assert client.stats == {"requests": 2, "cache_hits": 1, "rate_limited": 0}
+
+def test_retry_after_is_retried(server):
+    server.limited_left = 2
+    client = make_client(server)
+    assert client.get_repo("tester/limited")["html_url"].endswith("/limited")
+    assert client.stats == {"requests": 3, "cache_hits": 0, "rate_limited": 2}
+
+def test_rate_limit_retries_are_bounded(server):
+    server.limited_left = 10
+    client = make_client(server, max_retries=2)
+    with pytest.raises(qas.GitHubAPIError) as error:
+        client.get_repo("tester/limited")
+    assert error.value.status == 403
+    assert client.stats["requests"] == 3 and client.stats["rate_limited"] == 3
+
+def test_user_is_fetched_lazily_and_once(server):
+    client = make_client(server)
+    assert server.seen == []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        logins = list(executor.map(lambda _: client.login, range(8)))
+    assert logins == ["tester"] * 8
+    assert client.user["name"] == "Test Author"
+    assert server.seen == [("GET", "/user", None)]
+    assert client.stats["requests"] == 1
+
+def test_missing_repo_and_errors(server):
+    client = make_client(server)
+    assert client.get_repo("tester/nowhere") is None
+    assert client.create_repo("QL_One", "desc")["html_url"].endswith("/QL_One")
+    with pytest.raises(qas.GitHubAPIError, match="Validation Failed") as error:
+        client.create_issue("tester/QL_One", "title", "body")
+    assert error.value.status == 422
+    assert server.seen[1] == ("POST", "/user/repos", {"name": "QL_One", "description": "desc",
+                                                      "private": False, "auto_init": False})
+    assert client.stats == {"requests": 3, "cache_hits": 0, "rate_limited": 0}
+
+def test_bucket_follows_rate_limit_headers():
+    bucket = qas.TokenBucket(rate=10, capacity=1)
+    bucket.update({"X-RateLimit-Remaining": "30", "X-RateLimit-Reset": str(time.time() + 100)})
+    assert bucket.rate == pytest.approx(0.3, rel=0.05)
+    bucket.update({"Retry-After": "0.2"})
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.15
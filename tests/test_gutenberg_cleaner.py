@@ -0,0 +1,46 @@
+"""The streaming Gutenberg cleaner must reproduce clean_gutenberg_text() exactly."""
+
+import io
+import random
+
+import pytest
+
+import shakespeare_utils as su
+
+PIECES = ['\n', '\n\n', '  \n', '\t\n', ' 12 \n', '7', '42\n', 'From fairest creatures',
+          'THE SONNETS', 'End of the Project Gutenberg', ' ', 'À ÇA', '\r\n', '\x0b',
+          'word', '٣', '\n \n', 'O\n']
+
+class NonSeekable(io.StringIO):
+    def seekable(self):
+        return False
+
+def _random_text(rng):
+    return ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 40)))
+
+@pytest.mark.parametrize('seed', range(300))
+def test_random_texts_match_regex_cleaner(seed, tmp_path):
+    rng = random.Random(seed)
+    text = _random_text(rng)
+    expected = su.clean_gutenberg_text(text)
+    chunk_size = rng.choice([1, 2, 3, 7, 64])
+
+    assert ''.join(su.iter_clean_gutenberg(io.StringIO(text), chunk_size)) == expected
+    assert ''.join(su.iter_clean_gutenberg(NonSeekable(text), chunk_size)) == expected
+
+    # Files go through text-mode newline translation, like the regex version would
+    path = tmp_path / 'raw.txt'
+    path.write_bytes(text.encode('utf-8'))
+    with open(path, encoding='utf-8') as f:
+        translated = f.read()
+    out = tmp_path / 'clean.txt'
+    written = su.clean_gutenberg_file(str(path), str(out), chunk_size)
+    with open(out, encoding='utf-8') as f:
+        assert f.read() == su.clean_gutenberg_text(translated)
+    assert written == len(su.clean_gutenberg_text(translated))
+
+def test_sonnets_file():
+    path = su.__file__.replace('shakespeare_utils.py', 'shakespeare_sonnets.txt')
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    assert ''.join(su.iter_clean_gutenberg(path)) == su.clean_gutenberg_text(text)
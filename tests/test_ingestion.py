@@ -0,0 +1,124 @@
+"""ingest_corpora() against a local HTTP server standing in for Gutenberg."""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import shakespeare_utils as su
+
+RAW = ("Project Gutenberg header\n\nTHE SONNETS\n\n1\n\n"
+       "From fairest creatures we desire increase,\n"
+       "That thereby beauty's rose might never die,\n\n2\n"
+       "When forty winters shall besiege thy brow,\n"
+       "End of the Project Gutenberg EBook\nlicense text\n")
+
+class GutenbergStandIn(BaseHTTPRequestHandler):
+    """Serves RAW, fails /flaky twice with 503 and /missing with 404."""
+
+    requests_seen = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requests_seen.append(self.path)
+            flaky_calls = self.requests_seen.count(self.path)
+        if self.path == '/missing.txt':
+            self.send_error(404)
+            return
+        if self.path == '/flaky.txt' and flaky_calls <= 2:
+            self.send_error(503)
+            return
+        body = RAW.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    GutenbergStandIn.requests_seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), GutenbergStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_ingest_cleans_retries_and_reports_errors(server, tmp_path):
+    sources = [f"{server}/sonnets.txt", f"{server}/flaky.txt", f"{server}/missing.txt"]
+    results = su.ingest_corpora(sources, cache_dir=str(tmp_path), max_workers=3,
+                                retries=3, backoff=0.01)
+
+    assert [r['source'] for r in results] == sources
+    ok, flaky, missing = results
+    expected = su.clean_gutenberg_text(RAW)
+    for result in (ok, flaky):
+        assert result['error'] is None and not result['cached']
+        with open(result['path'], encoding='utf-8') as f:
+            assert f.read() == expected
+    assert ok['attempts'] == 1 and flaky['attempts'] == 3
+    assert missing['error'].startswith('HTTPError') and missing['attempts'] == 0
+    assert GutenbergStandIn.requests_seen.count('/missing.txt') == 1
+    assert not os.path.exists(missing['path'])
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(r['path'])
+                                                  for r in (ok, flaky))
+
+def test_ingest_skips_cached_sources(server, tmp_path):
+    source = f"{server}/sonnets.txt"
+    su.ingest_corpora([source], cache_dir=str(tmp_path))
+    again = su.ingest_corpora([source], cache_dir=str(tmp_path))[0]
+    assert again['cached'] and again['error'] is None
+    assert GutenbergStandIn.requests_seen == ['/sonnets.txt']
+
+def test_ingest_local_files_and_custom_cleaner(tmp_path):
+    raw = tmp_path / 'raw.txt'
+    raw.write_text(RAW, encoding='utf-8')
+    result = su.ingest_corpora([str(raw)], cache_dir=str(tmp_path / 'out'),
+                               clean=str.upper)[0]
+    with open(result['path'], encoding='utf-8') as f:
+        assert f.read() == RAW.upper()
+
+def test_download_shakespeare_sonnets_uses_ingestion(server, tmp_path):
+    cache_file = str(tmp_path / 'sonnets.txt')
+    text = su.download_shakespeare_sonnets(cache_file, url=f"{server}/sonnets.txt")
+    assert text == su.clean_gutenberg_text(RAW)
+    with pytest.raises(RuntimeError):
+        su.download_shakespeare_sonnets(str(tmp_path / 'none.txt'),
+                                        url=f"{server}/missing.txt")
+
+def test_duplicate_sources_are_fetched_once(server, tmp_path):
+    source = f"{server}/sonnets.txt"
+    results = su.ingest_corpora([source] * 6, cache_dir=str(tmp_path), max_workers=6)
+    assert all(r['error'] is None for r in results)
+    assert len({r['path'] for r in results}) == 1
+    assert GutenbergStandIn.requests_seen == ['/sonnets.txt']
+    assert os.listdir(tmp_path) == [os.path.basename(results[0]['path'])]
+
+def test_concurrent_cleans_of_one_file_do_not_collide(tmp_path):
+    raw = tmp_path / 'raw.txt'
+    raw.write_text(RAW, encoding='utf-8')
+    target = str(tmp_path / 'out' / 'clean.txt')
+    os.makedirs(os.path.dirname(target))
+    errors = []
+
+    def clean():
+        try:
+            su.clean_gutenberg_file(str(raw), target)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=clean) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert os.listdir(os.path.dirname(target)) == ['clean.txt']
+    with open(target, encoding='utf-8') as f:
+        assert f.read() == su.clean_gutenberg_text(RAW)
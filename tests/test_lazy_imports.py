@@ -0,0 +1,41 @@
+"""shakespeare_utils imports numpy, plotly and requests only when first used."""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('numpy', 'plotly', 'requests')
+
+def run(code):
+    """Run code in a fresh interpreter at the repo root; returns its JSON output."""
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+def import_seconds(module):
+    """Best of three wall times for importing module in a fresh interpreter."""
+    code = ("import json, time; start = time.perf_counter(); "
+            f"import {module}; print(json.dumps(time.perf_counter() - start))")
+    return min(run(code) for _ in range(3))
+
+def test_import_leaves_heavy_modules_unloaded():
+    loaded = run("import json, sys, shakespeare_utils; "
+                 f"print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))")
+    assert loaded == []
+
+def test_tokenizing_does_not_load_numpy():
+    loaded = run("import json, sys, shakespeare_utils as su; "
+                 "su.tokenize('Shall I compare thee to a summer\\'s day?'); "
+                 "print(json.dumps('numpy' in sys.modules))")
+    assert loaded is False
+
+def test_first_use_imports_the_real_module():
+    result = run("import json, sys, shakespeare_utils as su; "
+                 "total = int(su.np.arange(4).sum()); "
+                 "print(json.dumps([total, su.np is sys.modules['numpy']]))")
+    assert result == [6, True]
+
+def test_import_is_cheaper_than_numpy():
+    assert import_seconds('shakespeare_utils') < import_seconds('numpy')
@@ -0,0 +1,101 @@
+"""save_model()/load_model() round trips, including the raw-array fast path."""
+
+import json
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+class Plain:
+    def __init__(self):
+        self.weights = np.arange(12, dtype=np.float32).reshape(3, 4)
+        self.name = 'plain'
+
+class CustomState(Plain):
+    def __getstate__(self):
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.weights = None
+
+class Tagged(dict):
+    def __init__(self, *args, tag=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = tag
+
+def _header_type(filename):
+    with open(filename, 'rb') as f:
+        f.read(len(su.MODEL_MAGIC))
+        length = int.from_bytes(f.read(8), 'little')
+        return json.loads(f.read(length))['type']
+
+def _round_trip(model, tmp_path, mmap=True):
+    filename = str(tmp_path / 'model.bin')
+    su._write_model(model, filename)
+    return su._read_model(filename, mmap), _header_type(filename)
+
+@pytest.mark.parametrize('model', [
+    Counter({('a', 'b'): 3, ('b', 'c'): 1}),
+    OrderedDict([(('a', 'b'), 1), (('c',), 2)]),
+    Counter({'a': 2, 'b': 1}),
+    OrderedDict([('b', np.arange(3)), ('a', 1)]),
+    defaultdict(int, {'x': 1}),
+    Tagged({'a': 1}, tag='t'),
+    [np.arange(3), 'x'],
+    {('a', 'b'): 1},
+])
+def test_containers_round_trip_with_their_type(model, tmp_path):
+    loaded, kind = _round_trip(model, tmp_path)
+    assert type(loaded) is type(model)
+    assert kind == 'pickle'
+    if isinstance(model, dict):
+        assert list(loaded) == list(model)
+        for key, value in model.items():
+            assert np.array_equal(loaded[key], value)
+    if isinstance(model, Tagged):
+        assert loaded.tag == 't'
+
+def test_plain_dict_and_instance_use_raw_arrays(tmp_path):
+    model = {'ids': np.arange(10, dtype=np.int32), 'meta': {'n': 2}}
+    loaded, kind = _round_trip(model, tmp_path)
+    assert kind == 'dict'
+    assert isinstance(loaded['ids'], np.memmap)
+    assert np.array_equal(loaded['ids'], model['ids']) and loaded['meta'] == {'n': 2}
+
+    loaded, kind = _round_trip(Plain(), tmp_path, mmap=False)
+    assert kind.endswith(':Plain')
+    assert np.array_equal(loaded.weights, Plain().weights) and loaded.name == 'plain'
+
+def test_custom_pickling_is_respected(tmp_path):
+    loaded, kind = _round_trip(CustomState(), tmp_path)
+    assert kind == 'pickle'
+    assert loaded.weights is None and loaded.name == 'plain'
+
+def test_repo_models_keep_raw_arrays(tmp_path):
+    tokens = su.tokenize(open(su.__file__.replace('shakespeare_utils.py',
+                                                  'shakespeare_sonnets.txt'),
+                              encoding='utf-8').read())[:5000]
+    vocab = su.create_vocabulary(tokens, min_freq=1)
+    model = su.SmoothedNgramModel(n=3).fit(vocab.encode(tokens))
+    loaded, kind = _round_trip(model, tmp_path)
+    assert kind.endswith(':SmoothedNgramModel')
+    ids = vocab.encode(tokens[:200])
+    assert np.allclose(loaded.probabilities(ids), model.probabilities(ids))
+
+class Slotted(Plain):
+    __slots__ = ('extra',)
+
+def test_slotted_instances_are_pickled(tmp_path):
+    model = Slotted()
+    model.extra = 5
+    loaded, kind = _round_trip(model, tmp_path)
+    assert kind == 'pickle' and loaded.extra == 5
+
+def test_vocabulary_keeps_raw_arrays(tmp_path):
+    vocab = su.create_vocabulary(['a', 'b', 'a', 'c'], min_freq=1)
+    loaded, kind = _round_trip(vocab, tmp_path)
+    assert kind.endswith(':Vocabulary')
+    assert dict(loaded) == dict(vocab)
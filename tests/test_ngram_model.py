@@ -0,0 +1,52 @@
+"""NgramModel queries with short, empty and unigram contexts."""
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+TOKENS = su.tokenize("shall i compare thee to a summers day thou art more lovely "
+                     "and more temperate shall i compare thee to thy self thy love")
+
+@pytest.fixture(scope='module', params=[1, 2, 3])
+def model(request):
+    return su.NgramModel.from_tokens(TOKENS, n=request.param)
+
+def unigram(model, k):
+    counts = {w: TOKENS.count(w) for w in set(TOKENS)}
+    ranked = sorted(counts, key=lambda w: (-counts[w], model.vocab.encode([w])[0]))
+    return [(w, counts[w] / len(TOKENS)) for w in ranked[:k]]
+
+def test_predict_next_uses_the_last_words(model):
+    predictions = model.predict_next(["to", "shall", "i"], 3)
+    if model.n == 1:
+        assert predictions == unigram(model, 3)
+    else:
+        assert predictions == [("compare", 1.0)]
+
+def test_short_and_empty_contexts_are_padded_with_start(model):
+    # No training context starts with <START>, so short contexts back off to unigrams
+    assert model.predict_next([], 4) == unigram(model, 4)
+    if model.n == 3:
+        assert model.predict_next(["thy"], 4) == unigram(model, 4)
+    ids = model.vocab.encode(["thy"])
+    padded = np.concatenate([np.full(max(model.n - 2, 0), su.START_ID), ids])[None, :]
+    assert np.array_equal(model.context_rows(ids[None, :]), model.context_rows(padded))
+
+def test_unigram_model_ignores_context():
+    model = su.NgramModel.from_tokens(TOKENS, n=1)
+    ids, probs = model.top_k(np.array([1, 2]), 2)
+    assert ids.shape == (2, 2) and np.array_equal(ids[0], ids[1])
+    assert [(w, p) for w, p in zip(model.vocab.decode(ids[0]), probs[0])] == unigram(model, 2)
+    assert model.sample(np.zeros((3, 0)), 2, np.random.default_rng(0)).shape == (3, 2)
+
+def test_generate_from_short_contexts(model):
+    rng = np.random.default_rng(0)
+    for context in ([], ["thy"], ["shall", "i", "compare"]):
+        words = model.generate(context, 5, rng)
+        assert len(words) == 5 and all(w in model.vocab for w in words)
+
+def test_wider_contexts_use_the_last_words(model):
+    ids = model.vocab.encode(["to", "shall", "i"])[None, :]
+    tail = ids[:, ids.shape[1] - (model.n - 1):] if model.n > 1 else ids[:, :0]
+    assert np.array_equal(model.top_k(ids, 3)[0], model.top_k(tail, 3)[0])
@@ -0,0 +1,55 @@
+"""Sharded token counts must equal Counter(tokenize(text)), tie order included."""
+
+from collections import Counter
+
+import pytest
+
+import shakespeare_utils as su
+
+LINES = ["Shall I compare thee to a summer's day?",
+         "Thou art more lovely and more temperate:",
+         "Rough winds do shake the darling buds of May,",
+         "And summer's lease hath all too short a date;",
+         "Café naïve — thee, thou; thy THY thy!"]
+
+def write(tmp_path, text, newline):
+    path = tmp_path / 'corpus.txt'
+    with open(path, 'w', encoding='utf-8', newline=newline) as f:
+        f.write(text)
+    return str(path)
+
+def single_process(path, keep_punctuation):
+    # Read as the workers do: bytes, newlines translated as in text mode
+    with open(path, encoding='utf-8') as f:
+        return Counter(su.tokenize(f.read(), keep_punctuation))
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+@pytest.mark.parametrize('keep_punctuation', [False, True])
+@pytest.mark.parametrize('num_shards', [1, 3, 16, 200])
+def test_sharded_counts_match_single_process(tmp_path, newline, keep_punctuation, num_shards):
+    text = "\n".join(LINES * 7)
+    path = write(tmp_path, text, newline)
+    expected = single_process(path, keep_punctuation)
+    counts = su.parallel_count_tokens(path, keep_punctuation, workers=1,
+                                      shards_per_worker=num_shards)
+    assert list(counts.items()) == list(expected.items())
+    assert counts.most_common() == expected.most_common()
+
+def test_shard_targets_inside_words_move_to_line_ends(tmp_path):
+    path = write(tmp_path, "\n".join(LINES * 3) + "\n", '\r\n')
+    with open(path, 'rb') as f:
+        data = f.read()
+    shards = su.shard_file(path, 40)
+    assert len(shards) > 1 and shards[0][0] == 0 and shards[-1][1] == len(data)
+    # Most byte targets fall inside a word; every shard still starts a line
+    assert all(data[start - 1:start] == b'\n' for start, _ in shards[1:])
+    assert all(end == start for (_, end), (start, _) in zip(shards, shards[1:]))
+
+def test_process_pool_matches_and_keeps_ties(tmp_path):
+    # Every word appears exactly twice, so most_common() order is first occurrence
+    words = [f"w{i}" for i in range(500)]
+    text = "".join(" ".join(words[i:i + 7]) + "\n" for i in range(0, 500, 7)) * 2
+    path = write(tmp_path, text, '\r\n')
+    counts = su.parallel_count_tokens(path, workers=2, shards_per_worker=8)
+    assert counts.most_common() == single_process(path, False).most_common()
+    assert [word for word, _ in counts.most_common(5)] == words[:5]
@@ -0,0 +1,49 @@
+"""PerplexityAccumulator must give the same exact sum however it is fed."""
+
+import math
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+def _greedy_terms(values):
+    terms = []
+    while True:
+        term = math.fsum(list(values) + [-t for t in terms])
+        if term == 0.0:
+            return terms
+        terms.append(term)
+
+def test_exact_sum_terms_matches_fsum_expansion():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = int(rng.integers(0, 60))
+        values = rng.standard_normal(n) * 10.0 ** rng.integers(-320, 300, n)
+        values = values[np.isfinite(values)]
+        values = np.concatenate([values, -values[:2]])
+        assert su._exact_sum_terms(values) == _greedy_terms(values.tolist())
+    assert su._exact_sum_terms([]) == []
+    assert su._exact_sum_terms([5e-324, 5e-324]) == [1e-323]
+    assert su._exact_sum_terms([1e300, 1.0, -1e300]) == [1.0]
+
+def test_exact_sum_terms_across_blocks(monkeypatch):
+    values = np.log2(np.random.default_rng(1).random(5000).clip(1e-10))
+    expected = _greedy_terms(values.tolist())
+    monkeypatch.setattr(su, 'EXACT_SUM_BLOCK', 97)
+    assert su._exact_sum_terms(values) == expected
+
+def test_exact_sum_terms_rejects_nan():
+    with pytest.raises(ValueError):
+        su._exact_sum_terms([1.0, float('nan')])
+
+def test_accumulator_merge_is_exact():
+    probs = np.random.default_rng(2).random(10_000)
+    whole = su.PerplexityAccumulator().update(probs)
+    parts = [su.PerplexityAccumulator().update(chunk) for chunk in np.array_split(probs, 7)]
+    merged = su.PerplexityAccumulator()
+    for part in reversed(parts):
+        merged.merge(part)
+    assert merged.count == whole.count
+    assert merged.log2_sum == whole.log2_sum
+    assert merged.perplexity() == pytest.approx(su.calculate_perplexity(probs), rel=1e-12)
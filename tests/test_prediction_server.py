@@ -0,0 +1,246 @@
+"""prediction_server.py end to end: a real server process on localhost."""
+
+import ast
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import prediction_server as ps
+import shakespeare_utils as su
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(ROOT, 'shakespeare_sonnets.txt')
+
+def start_server(*args):
+    """Start prediction_server.py on a free port; returns (process, port)."""
+    process = subprocess.Popen(
+        [sys.executable, '-u', os.path.join(ROOT, 'prediction_server.py'),
+         '--corpus', CORPUS, '--n', '3', '--port', '0', *args],
+        stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    assert line.startswith('[OK]'), line
+    return process, ast.literal_eval(line.split(' on ', 1)[1])[1]
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=10)
+    process.stdout.close()
+
+@pytest.fixture(scope='module')
+def port():
+    process, port = start_server('--seed', '0')
+    yield port
+    stop_server(process)
+
+@pytest.fixture(scope='module')
+def model():
+    with open(CORPUS, encoding='utf-8') as f:
+        return su.NgramModel.from_tokens(su.tokenize(f.read()), n=3)
+
+def post(path, body, connection=None):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    extra = f"Connection: {connection}\r\n" if connection else ""
+    return (f"POST {path} HTTP/1.1\r\nHost: localhost\r\n{extra}"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body
+
+def read_responses(sock, count):
+    """Read count responses; returns (status code, headers, body) tuples."""
+    data = b""
+    responses = []
+    while len(responses) < count:
+        end = data.find(b"\r\n\r\n")
+        if end >= 0:
+            lines = data[:end].decode('latin-1').split("\r\n")
+            headers = dict(line.lower().split(": ", 1) for line in lines[1:])
+            body_end = end + 4 + int(headers['content-length'])
+            if len(data) >= body_end:
+                responses.append((int(lines[0].split()[1]), headers, data[end + 4:body_end]))
+                data = data[body_end:]
+                continue
+        chunk = sock.recv(1 << 16)
+        assert chunk, "connection closed early"
+        data += chunk
+    return responses
+
+def exchange(port, *requests):
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(b"".join(requests))
+        return read_responses(sock, len(requests))
+
+def test_predict_matches_the_model(port, model):
+    context = ["Shall", "I"]
+    (status, headers, body), = exchange(port, post('/predict', {"context": context, "k": 3}))
+    assert status == 200 and headers['content-type'] == 'application/json'
+    ids, probs = model.top_k(model.vocab.encode(["shall", "i"])[None, :], 3)
+    expected = [[word, float(p)] for word, p, i in
+                zip(model.vocab.decode(np.maximum(ids[0], 0)), probs[0], ids[0]) if i >= 0]
+    assert json.loads(body) == {"predictions": expected}
+
+def test_sample_and_stats(port, model):
+    (status, _, body), (stats_status, _, stats) = exchange(
+        port, post('/sample', {"context": ["thy"], "num_samples": 4}),
+        b"GET /stats HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    samples = json.loads(body)["samples"]
+    assert status == 200 and len(samples) == 4
+    assert all(word in model.vocab for word in samples)
+    assert stats_status == 200 and json.loads(stats)["requests"] >= 1
+
+def test_errors(port):
+    responses = exchange(port, post('/predict', b'{"context": ['),
+                         post('/predict', {"context": "shall i"}),
+                         post('/predict', {"context": [], "k": 0}),
+                         post('/predict', b'{"context": []} []'),
+                         b"GET /nowhere HTTP/1.1\r\n\r\n")
+    assert [status for status, _, _ in responses] == [400, 400, 400, 400, 404]
+    assert all("error" in json.loads(body) for _, _, body in responses)
+
+def test_pipelined_responses_keep_request_order(port, model):
+    contexts = [["my", "love"], ["thou", "art"], ["Shall", "I"], ["from", "fairest"]] * 25
+    requests = [post('/predict' if i % 3 else '/sample', {"context": context})
+                for i, context in enumerate(contexts)]
+    responses = exchange(port, *requests)
+    for i, (context, (status, _, body)) in enumerate(zip(contexts, responses)):
+        assert status == 200
+        if i % 3:
+            ids, _ = model.top_k(model.vocab.encode([w.lower() for w in context])[None, :], 5)
+            words = [word for word, _ in json.loads(body)["predictions"]]
+            assert words == [w for w, i in zip(model.vocab.decode(np.maximum(ids[0], 0)),
+                                                ids[0]) if i >= 0]
+        else:
+            assert len(json.loads(body)["samples"]) == 1
+
+def test_connection_close(port):
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(post('/predict', {"context": ["my"]}, connection='close')
+                     + post('/predict', {"context": ["my"]}))
+        (status, headers, _), = read_responses(sock, 1)
+        assert status == 200 and headers['connection'] == 'close'
+        sock.settimeout(5)
+        assert sock.recv(1 << 16) == b""
+
+def pipelined_load(port, requests, connections=8, depth=64):
+    """Requests per second with `depth` requests in flight per connection."""
+    selector = selectors.DefaultSelector()
+    states = []
+    for c in range(connections):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.setblocking(False)
+        state = {'sock': sock, 'todo': requests[c::connections], 'sent': 0, 'open': 0, 'tail': b""}
+        selector.register(sock, selectors.EVENT_READ, state)
+        states.append(state)
+    marker = b"HTTP/1.1 "
+    done = 0
+    started = time.perf_counter()
+    for state in states:
+        state['sent'] = state['open'] = min(depth, len(state['todo']))
+        state['sock'].sendall(b"".join(state['todo'][:state['sent']]))
+    while done < len(requests):
+        for key, _ in selector.select():
+            state = key.data
+            data = state['tail'] + state['sock'].recv(1 << 20)
+            answered = data.count(marker)
+            state['tail'] = data[-(len(marker) - 1):]
+            done += answered
+            state['open'] -= answered
+            more = min(depth - state['open'], len(state['todo']) - state['sent'])
+            if more > 0:
+                state['sock'].sendall(b"".join(state['todo'][state['sent']:state['sent'] + more]))
+                state['sent'] += more
+                state['open'] += more
+    elapsed = time.perf_counter() - started
+    for state in states:
+        state['sock'].close()
+    selector.close()
+    return len(requests) / elapsed
+
+class CountingModel:
+    """Wraps a model and records the batch size of every model call."""
+
+    def __init__(self, model):
+        self.model = model
+        self.n = model.n
+        self.vocab = model.vocab
+        self.calls = []
+
+    def top_k(self, contexts, k):
+        self.calls.append((len(contexts), k))
+        return self.model.top_k(contexts, k)
+
+    def sample(self, contexts, num_samples, rng=None):
+        self.calls.append((len(contexts), num_samples))
+        return self.model.sample(contexts, num_samples, rng)
+
+def answer_together(batcher, requests):
+    """Queue (kind, body) requests as one batch; returns (status, body) per request."""
+    replies = {}
+    batcher.enqueue_many([(kind, json.dumps(body).encode('utf-8'),
+                           lambda token, status, data: replies.__setitem__(token, (status, data)),
+                           i, time.perf_counter()) for i, (kind, body) in enumerate(requests)])
+    return [(replies[i][0], json.loads(replies[i][1])) for i in range(len(requests))]
+
+def test_requests_are_answered_in_full_batches(model):
+    counting = CountingModel(model)
+    batcher = ps.MicroBatcher(counting, max_batch_size=250)
+    requests = [('top_k', {"context": ["shall", "i"], "k": 1 + i % 5}) for i in range(1000)]
+    responses = answer_together(batcher, requests)
+    assert all(status == '200 OK' for status, _ in responses)
+    assert [len(body["predictions"]) for _, body in responses[:5]] == [1, 2, 3, 4, 5]
+    assert counting.calls == [(250, 5)] * 4
+    assert batcher.stats()["mean_batch_size"] == 250
+
+def test_bad_requests_do_not_fail_their_batch(model):
+    counting = CountingModel(model)
+    batcher = ps.MicroBatcher(counting, max_batch_size=6, max_samples=10)
+    responses = answer_together(batcher, [
+        ('top_k', {"context": ["my"], "k": 3}),
+        ('top_k', {"context": ["my"], "k": 10 ** 12}),
+        ('top_k', {"context": ["my"], "k": len(model.vocab) + 1}),
+        ('sample', {"context": ["my"], "num_samples": 11}),
+        ('sample', {"context": ["my"], "num_samples": 2}),
+        ('top_k', {"context": ["my"], "k": len(model.vocab)}),
+    ])
+    assert [status[:3] for status, _ in responses] == ['200', '400', '400', '400', '200', '200']
+    assert len(responses[0][1]["predictions"]) == 3
+    assert len(responses[4][1]["samples"]) == 2
+    assert "between 1 and" in responses[1][1]["error"]
+    assert counting.calls == [(2, len(model.vocab)), (1, 2)]
+
+def test_failing_model_call_is_retried_per_request(model):
+    class Failing(CountingModel):
+        def top_k(self, contexts, k):
+            if k == 4:
+                raise MemoryError("too big")
+            return super().top_k(contexts, k)
+    batcher = ps.MicroBatcher(Failing(model), max_batch_size=3)
+    responses = answer_together(batcher, [('top_k', {"context": ["my"], "k": k})
+                                          for k in (2, 4, 3)])
+    assert [status[:3] for status, _ in responses] == ['200', '500', '200']
+    assert [len(body.get("predictions", [])) for _, body in responses] == [2, 0, 3]
+
+@pytest.mark.slow
+def test_batching_is_ten_times_one_request_at_a_time():
+    with open(CORPUS, encoding='utf-8') as f:
+        tokens = su.tokenize(f.read())
+    rng = np.random.default_rng(0)
+    requests = [post('/predict', {"context": tokens[i:i + 2], "k": 5})
+                for i in rng.integers(0, len(tokens) - 2, 8000).tolist()]
+    servers = {size: start_server('--max-batch-size', str(size)) for size in (1, 256)}
+    try:
+        best = {size: 0.0 for size in servers}
+        # Alternate the two servers and keep each one's best round, so a
+        # noisy neighbour slowing one round does not decide the ratio
+        for _ in range(6):
+            for size, (_, port) in servers.items():
+                best[size] = max(best[size], pipelined_load(port, requests))
+    finally:
+        for process, _ in servers.values():
+            stop_server(process)
+    assert best[256] >= 10 * best[1], best
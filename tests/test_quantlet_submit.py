@@ -0,0 +1,181 @@
+"""Batch submission against a stubbed GitHub API and local bare remotes."""
+
+import json
+import os
+import subprocess
+
+import pytest
+
+git = pytest.importorskip("git")
+import quantlet_auto_submit as qas
+
+TOKEN = "ghp_secret_token_for_tests"
+
+METAINFO = """Name of QuantLet: {name}
+
+Published in: Tests
+
+Description: 'A QuantLet used in tests'
+
+Keywords: testing
+
+Author: Test Author
+"""
+
+class StubAPI:
+    """GitHubClient stand-in; creating a repository creates a bare remote."""
+
+    def __init__(self, remotes):
+        self.remotes = remotes
+        self.login = "tester"
+        self.user = {"login": "tester", "name": "Test Author"}
+        self.created = []
+        self.issues = []
+
+    def get_repo(self, full_name):
+        if os.path.isdir(os.path.join(self.remotes, TOKEN, full_name + ".git")):
+            return {"html_url": f"https://github.com/{full_name}"}
+        return None
+
+    def create_repo(self, name, description="", private=False):
+        git.Repo.init(os.path.join(self.remotes, TOKEN, self.login, name + ".git"), bare=True)
+        self.created.append(name)
+        return {"html_url": f"https://github.com/{self.login}/{name}"}
+
+    def create_issue(self, full_name, title, body):
+        self.issues.append(title)
+        return {"html_url": f"https://github.com/{full_name}/issues/{len(self.issues)}"}
+
+def make_quantlet(root, name):
+    path = root / name
+    (path / "__pycache__").mkdir(parents=True)
+    (path / "Metainfo.txt").write_text(METAINFO.format(name=name), encoding="utf-8")
+    (path / f"{name}.py").write_text("print('hello')\n", encoding="utf-8")
+    (path / "__pycache__" / "cached.pyc").write_bytes(b"\0")
+    return path
+
+def make_submitter(root, remotes):
+    submitter = qas.QuantLetSubmitter(TOKEN, str(root), api=StubAPI(str(remotes)))
+    # The token is part of the remote path, so a stored push URL would show up in configs
+    submitter.remote_url_template = str(remotes) + "/{token}/{owner}/{repo}.git"
+    return submitter
+
+def pushed_files(remotes, name):
+    remote = git.Repo(os.path.join(remotes, TOKEN, "tester", name + ".git"))
+    return sorted(remote.git.ls_tree("-r", "--name-only", "master").splitlines())
+
+def config_texts(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "config" in filenames and os.path.basename(dirpath) == ".git":
+            with open(os.path.join(dirpath, "config"), encoding="utf-8") as f:
+                yield f.read()
+
+@pytest.fixture
+def workspace(tmp_path):
+    root = tmp_path / "course"
+    root.mkdir()
+    repo = git.Repo.init(root)
+    (root / ".gitignore").write_text("__pycache__/\n.quantlet_submit_manifest.json\n",
+                                     encoding="utf-8")
+    paths = [make_quantlet(root, name) for name in ("QL_One", "QL_Two")]
+    repo.git.add(all=True)
+    repo.index.commit("course")
+    return root, tmp_path / "remotes", paths
+
+def test_batch_pushes_snapshots_without_touching_module_folders(workspace, capsys):
+    root, remotes, paths = workspace
+    repo = git.Repo(root)
+    head, status = repo.head.commit.hexsha, repo.git.status("--porcelain")
+    (paths[0] / "notes.txt").write_text("uncommitted\n", encoding="utf-8")
+
+    results = make_submitter(root, remotes).submit_batch(paths, workers=2)
+
+    assert [r["issue_created"] for r in results] == [True, True]
+    assert pushed_files(remotes, "QL_One") == ["Metainfo.txt", "QL_One.py", "notes.txt"]
+    assert pushed_files(remotes, "QL_Two") == ["Metainfo.txt", "QL_Two.py"]
+    assert not any((path / ".git").exists() for path in paths)
+    assert repo.head.commit.hexsha == head and not repo.remotes
+    assert repo.git.status("--porcelain") == (status + "\n?? QL_One/notes.txt").strip()
+    assert all(TOKEN not in text for text in config_texts(root))
+    assert TOKEN not in capsys.readouterr().out
+
+def test_rerun_skips_unchanged_trees_and_pushes_changes(workspace):
+    root, remotes, paths = workspace
+    first = make_submitter(root, remotes).submit_batch(paths)
+    with open(root / qas.SUBMIT_MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)["quantlets"]
+    assert manifest["QL_One"]["tree"] == first[0]["tree"]
+
+    (paths[1] / "QL_Two.py").write_text("print('changed')\n", encoding="utf-8")
+    submitter = make_submitter(root, remotes)
+    again = submitter.submit_batch(paths)
+
+    assert submitter.api.created == [] and submitter.api.issues == []
+    assert again[0]["push_skipped"] and again[0]["tree"] == first[0]["tree"]
+    assert not again[1]["push_skipped"] and again[1]["tree"] != first[1]["tree"]
+    remote = git.Repo(os.path.join(remotes, TOKEN, "tester", "QL_Two.git"))
+    assert remote.git.show("master:QL_Two.py") == "print('changed')"
+
+def test_push_outside_any_repository(tmp_path):
+    path = make_quantlet(tmp_path / "loose", "QL_Loose")
+    submitter = make_submitter(tmp_path, tmp_path / "remotes")
+    result = submitter.submit_quantlet(path)
+    assert result["pushed"] and result["issue_created"]
+    assert pushed_files(tmp_path / "remotes", "QL_Loose") == [
+        "Metainfo.txt", "QL_Loose.py", "__pycache__/cached.pyc"]
+    assert not (path / ".git").exists()
+
+def test_failed_push_is_reported_without_the_token(workspace, capsys):
+    root, remotes, paths = workspace
+    submitter = make_submitter(root, remotes)
+    push = submitter._push("QL_Missing", paths[0])
+    assert not push["pushed"] and push["tree"]
+    output = capsys.readouterr().out
+    assert "Error pushing to GitHub" in output and TOKEN not in output
+    assert subprocess.run(["git", "-C", str(root), "remote"], capture_output=True,
+                          text=True).stdout == ""
+
+def test_pushes_keep_the_remote_history(workspace):
+    root, remotes, paths = workspace
+    submitter = make_submitter(root, remotes)
+    submitter.api.create_repo("QL_One")
+    # The remote already has a commit of its own, e.g. a README made on GitHub
+    seed = git.Repo.init(root.parent / "seed")
+    (root.parent / "seed" / "README.md").write_text("made online\n", encoding="utf-8")
+    seed.git.add(all=True)
+    seed.index.commit("Initial commit")
+    remote_path = os.path.join(remotes, TOKEN, "tester", "QL_One.git")
+    seed.git.push(remote_path, "HEAD:refs/heads/master")
+
+    assert submitter.push_to_github("QL_One", paths[0])
+    (paths[0] / "QL_One.py").write_text("print('changed')\n", encoding="utf-8")
+    assert submitter.push_to_github("QL_One", paths[0])
+
+    remote = git.Repo(remote_path)
+    assert [c.message.strip() for c in remote.iter_commits("master")] == [
+        "QuantLet submission of QL_One", "QuantLet submission of QL_One", "Initial commit"]
+    assert pushed_files(remotes, "QL_One") == ["Metainfo.txt", "QL_One.py"]
+    assert not (root / ".git" / "FETCH_HEAD").exists()
+    assert all(TOKEN not in text for text in config_texts(root))
+
+def test_manifest_write_failure_stops_the_batch(workspace, tmp_path):
+    root, remotes, paths = workspace
+    paths += [make_quantlet(root, name) for name in ("QL_Three", "QL_Four")]
+    submitter = make_submitter(root, remotes)
+    with pytest.raises(OSError):
+        submitter.submit_batch(paths, workers=1,
+                               manifest_path=tmp_path / "missing" / "manifest.json")
+    assert len(submitter.api.created) < len(paths)
+
+def test_write_json_atomic_raises_and_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "manifest.json"
+    qas._write_json_atomic(path, {"quantlets": {}})
+
+    def fail(src, dst):
+        raise PermissionError("locked")
+
+    monkeypatch.setattr(qas.os, "replace", fail)
+    with pytest.raises(PermissionError):
+        qas._write_json_atomic(path, {"quantlets": {"QL_One": {}}})
+    assert os.listdir(tmp_path) == ["manifest.json"]
+    assert json.loads(path.read_text(encoding="utf-8")) == {"quantlets": {}}
@@ -0,0 +1,85 @@
+"""SmoothedNgramModel against plain-Python Kneser-Ney and add-k."""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+V = 7
+
+@pytest.fixture(scope='module')
+def corpus():
+    rng = np.random.default_rng(0)
+    return rng.choice(V, size=400, p=[0.3, 0.2, 0.15, 0.15, 0.1, 0.06, 0.04])
+
+def ngram_counts(ids, order):
+    ids = [int(i) for i in ids]
+    return Counter(tuple(ids[i:i + order]) for i in range(len(ids) - order + 1))
+
+def kneser_ney_tables(ids, n, discounts):
+    """Per order: (alpha by k-gram, gamma by context), as in Chen & Goodman."""
+    tables = []
+    for order in range(1, n + 1):
+        if order == n:
+            numerators = ngram_counts(ids, order)
+        else:
+            numerators = Counter(gram[1:] for gram in ngram_counts(ids, order + 1))
+        totals, types = Counter(), Counter()
+        for gram, count in numerators.items():
+            totals[gram[:-1]] += count
+            types[gram[:-1]] += 1
+        d = discounts[order - 1]
+        alpha = {gram: max(count - d, 0) / totals[gram[:-1]]
+                 for gram, count in numerators.items()}
+        gamma = {context: d * types[context] / totals[context] for context in totals}
+        tables.append((alpha, gamma))
+    return tables
+
+def kneser_ney_probability(tables, history, word):
+    p = 1.0 / V
+    for order, (alpha, gamma) in enumerate(tables, 1):
+        context = tuple(history[len(history) - order + 1:]) if order > 1 else ()
+        if len(context) == order - 1 and context in gamma:
+            p = alpha.get(context + (word,), 0.0) + gamma[context] * p
+    return p
+
+def add_k_probability(ids, n, k, history, word):
+    order = min(n, len(history) + 1)
+    context = tuple(history[len(history) - order + 1:]) if order > 1 else ()
+    counts = ngram_counts(ids, order)
+    total = sum(count for gram, count in counts.items() if gram[:-1] == context)
+    return (counts[context + (word,)] + k) / (total + k * V)
+
+@pytest.mark.parametrize('n', [1, 2, 3])
+@pytest.mark.parametrize('discount', [None, 0.5])
+def test_kneser_ney_matches_reference(corpus, n, discount):
+    model = su.SmoothedNgramModel(n, discount=discount).fit(corpus, V)
+    tables = kneser_ney_tables(corpus, n, model.discounts.tolist())
+    test = np.random.default_rng(1).integers(0, V, 200)
+    expected = [kneser_ney_probability(tables, test[:i].tolist(), int(w))
+                for i, w in enumerate(test)]
+    np.testing.assert_allclose(model.probabilities(test), expected, rtol=1e-12)
+
+@pytest.mark.parametrize('k', [1.0, 0.1])
+def test_add_k_closed_form_with_lower_order_fallback(corpus, k):
+    model = su.SmoothedNgramModel(3, method='add_k', k=k).fit(corpus, V)
+    test = np.random.default_rng(2).integers(0, V, 100)
+    expected = [add_k_probability(corpus, 3, k, test[:i].tolist(), int(w))
+                for i, w in enumerate(test)]
+    np.testing.assert_allclose(model.probabilities(test), expected, rtol=1e-12)
+    # An out-of-vocabulary id cuts the history short for the next two tokens
+    ids = np.array([1, 2, -1, 3, 4, 5])
+    assert model.probabilities(ids, offset=3) == pytest.approx(
+        [add_k_probability(corpus, 3, k, [], 3), add_k_probability(corpus, 3, k, [3], 4),
+         add_k_probability(corpus, 3, k, [3, 4], 5)], rel=1e-12)
+
+@pytest.mark.parametrize('method', ['kneser_ney', 'add_k'])
+def test_distributions_sum_to_one(corpus, method):
+    # The last word is in the vocabulary but never seen, nor any context with it
+    model = su.SmoothedNgramModel(3, method=method).fit(corpus[corpus < V - 1], V)
+    for history in [[], [0], [1, 0], [V - 1], [2, V - 1], [V - 1, 3], [-1, 2]]:
+        ids = np.array([history + [word] for word in range(V)])
+        total = sum(model.probabilities(row, offset=len(history))[0] for row in ids)
+        assert total == pytest.approx(1.0, abs=1e-12), history
@@ -0,0 +1,48 @@
+"""Streaming readers must match the in-memory functions on any input."""
+
+import io
+import mmap
+import os
+
+import pytest
+
+import shakespeare_utils as su
+
+SONNETS = os.path.join(su.__file__.rsplit(os.sep, 1)[0], 'shakespeare_sonnets.txt')
+
+@pytest.fixture(scope='module')
+def text():
+    with open(SONNETS, encoding='utf-8') as f:
+        return f.read()
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 777, su.STREAM_CHUNK_SIZE])
+def test_iter_tokens_binary_file_stays_open(text, chunk_size):
+    with open(SONNETS, 'rb') as f:
+        assert list(su.iter_tokens(f, chunk_size=chunk_size)) == su.tokenize(text)
+        assert not f.closed
+
+def test_iter_tokens_bytesio_and_mmap(text):
+    buffer = io.BytesIO(text.encode('utf-8'))
+    assert list(su.iter_tokens(buffer, keep_punctuation=True, chunk_size=5)) == \
+        su.tokenize(text, keep_punctuation=True)
+    assert not buffer.closed
+    with open(SONNETS, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert list(su.iter_tokens(m, chunk_size=1000)) == su.tokenize(text)
+
+def test_iter_tokens_split_code_points():
+    data = ('été 世界\r\nok').encode('utf-8')
+    assert list(su.iter_tokens(io.BytesIO(data), chunk_size=1)) == ['été', '世界', 'ok']
+
+def test_iter_tokens_batches(text):
+    batches = list(su.iter_tokens(SONNETS, batch_size=100))
+    assert all(len(b) == 100 for b in batches[:-1])
+    assert [t for b in batches for t in b] == su.tokenize(text)
+
+def test_iter_clean_gutenberg_sources(text):
+    expected = su.clean_gutenberg_text(text)
+    assert ''.join(su.iter_clean_gutenberg(SONNETS, 500)) == expected
+    with open(SONNETS, 'rb') as f:
+        assert ''.join(su.iter_clean_gutenberg(f, 500)) == expected
+        assert not f.closed
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            assert ''.join(su.iter_clean_gutenberg(m)) == expected
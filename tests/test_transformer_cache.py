@@ -0,0 +1,54 @@
+"""NumpyTransformer: cached decoding must match full recomputation."""
+
+import numpy as np
+import pytest
+
+import shakespeare_utils as su
+
+# float32 rounding alone differs by about 5e-7 on logits of magnitude ~1.5
+ATOL = 1e-5
+
+@pytest.fixture(scope='module')
+def model():
+    return su.NumpyTransformer(vocab_size=50, d_model=32, num_heads=4, num_layers=2,
+                               d_ff=64, max_len=64, seed=0)
+
+def padded_prompts(side):
+    rng = np.random.default_rng(1)
+    lengths = [7, 3, 5]
+    ids = np.zeros((3, 7), dtype=np.int64)
+    mask = np.zeros((3, 7), dtype=bool)
+    for row, length in enumerate(lengths):
+        cols = slice(7 - length, 7) if side == 'left' else slice(0, length)
+        ids[row, cols] = rng.integers(1, 50, length)
+        mask[row, cols] = True
+    return ids, mask
+
+@pytest.mark.parametrize('side', ['left', 'right'])
+def test_cached_steps_match_full_forward(model, side):
+    ids, mask = padded_prompts(side)
+    new = np.random.default_rng(2).integers(1, 50, (3, 6))
+    logits, cache = model.prefill(ids, mask, ids.shape[1] + new.shape[1])
+    stepped = [model.step(new[:, i], cache) for i in range(new.shape[1] - 1)]
+
+    full_ids = np.concatenate([ids, new], axis=1)
+    full_mask = np.concatenate([mask, np.ones(new.shape, bool)], axis=1)
+    full = model.forward(full_ids, full_mask)
+    np.testing.assert_allclose(logits[mask], full[:, :ids.shape[1]][mask], atol=ATOL)
+    for i, step_logits in enumerate(stepped):
+        np.testing.assert_allclose(step_logits, full[:, ids.shape[1] + i], atol=ATOL)
+
+@pytest.mark.parametrize('side', ['left', 'right'])
+def test_padding_does_not_change_logits(model, side):
+    ids, mask = padded_prompts(side)
+    logits = model.forward(ids, mask)
+    for row in range(len(ids)):
+        alone = model.forward(ids[row][mask[row]][None, :])[0]
+        np.testing.assert_allclose(logits[row][mask[row]], alone, atol=ATOL)
+
+@pytest.mark.parametrize('side', ['left', 'right'])
+def test_generate_with_and_without_cache(model, side):
+    ids, mask = padded_prompts(side)
+    cached, _ = model.generate(ids, 8, mask, use_cache=True)
+    recomputed, _ = model.generate(ids, 8, mask, use_cache=False)
+    assert np.array_equal(cached, recomputed)